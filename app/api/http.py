@@ -1,4 +1,5 @@
 import uuid
+from typing import List
 
 from fastapi import APIRouter, Depends, HTTPException, status
 
@@ -10,6 +11,9 @@ from app.schemas import (
     ChatResponse,
     CreateNomi,
     CreateRoom,
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
+    EmbeddingBatchResult,
     EmbeddingRequest,
     EmbeddingResponse,
     Message,
@@ -17,7 +21,8 @@ from app.schemas import (
     Room,
     RoomMessagesResponse,
 )
-from app.services.embeddings import EmbeddingsWorker
+from app.services.embeddings import EmbeddingsOverloaded, EmbeddingsWorker
+from app.services.frames import EncodedMessage, RawJSONResponse
 from app.services.rooms import RoomManager
 from app.services.store import InMemoryStore
 
@@ -45,10 +50,11 @@ async def create_room(
 )
 async def get_room_messages(
     room_id: str, store: InMemoryStore = Depends(get_store)
-) -> RoomMessagesResponse:
+) -> RawJSONResponse:
     if not await store.room_exists(room_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="room not found")
-    return await store.get_room_messages(room_id)
+    history_json = await store.get_room_history_json(room_id)
+    return RawJSONResponse('{"messages":' + history_json + "}")
 
 
 @router.post(
@@ -61,7 +67,7 @@ async def broadcast_to_room(
     payload: BroadcastMessage,
     store: InMemoryStore = Depends(get_store),
     room_manager: RoomManager = Depends(get_room_manager),
-) -> BroadcastResponse:
+) -> RawJSONResponse:
     if not await store.room_exists(room_id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="room not found")
 
@@ -71,9 +77,9 @@ async def broadcast_to_room(
         sender=payload.sender or "system",
         text=payload.messageText,
     )
-    await store.append_room_message(room_id, message)
-    delivered = await room_manager.broadcast(room_id, message)
-    return BroadcastResponse(delivered=delivered, message=message)
+    encoded = await store.append_room_message(room_id, message)
+    delivered = await room_manager.broadcast(room_id, encoded)
+    return RawJSONResponse(f'{{"delivered":{delivered},"message":{encoded.json}}}')
 
 
 @router.post(
@@ -81,6 +87,7 @@ async def broadcast_to_room(
     response_model=ChatResponse,
     responses={
         404: {"description": "Nomi or room not found"},
+        429: {"description": "Embeddings worker overloaded"},
     },
 )
 async def chat_nomi(
@@ -89,7 +96,7 @@ async def chat_nomi(
     store: InMemoryStore = Depends(get_store),
     embeddings: EmbeddingsWorker = Depends(get_embeddings_worker),
     room_manager: RoomManager = Depends(get_room_manager),
-) -> ChatResponse:
+) -> RawJSONResponse:
     nomi = await store.get_nomi(nomi_id)
     if not nomi:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="nomi not found")
@@ -97,7 +104,7 @@ async def chat_nomi(
     if payload.roomId and not await store.room_exists(payload.roomId):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="room not found")
 
-    embedding = await embeddings.embed(payload.messageText)
+    embedding = await _embed(embeddings, payload.messageText)
     message = Message(
         id=str(uuid.uuid4()),
         roomId=payload.roomId,
@@ -108,19 +115,66 @@ async def chat_nomi(
     )
 
     if payload.roomId:
-        await store.append_room_message(payload.roomId, message)
-        await room_manager.broadcast(payload.roomId, message)
+        encoded = await store.append_room_message(payload.roomId, message)
+        await room_manager.broadcast(payload.roomId, encoded)
+    else:
+        encoded = EncodedMessage(message)
 
-    return ChatResponse(message=message)
+    return RawJSONResponse('{"message":' + encoded.json + "}")
 
 
 @router.post(
     "/embeddings",
     response_model=EmbeddingResponse,
+    responses={429: {"description": "Embeddings worker overloaded"}},
 )
 async def generate_embedding(
     payload: EmbeddingRequest,
     embeddings: EmbeddingsWorker = Depends(get_embeddings_worker),
 ) -> EmbeddingResponse:
-    vector = await embeddings.embed(payload.text)
+    vector = await _embed(embeddings, payload.text)
     return EmbeddingResponse(embedding=vector)
+
+
+@router.post(
+    "/embeddings/batch",
+    response_model=EmbeddingBatchResponse,
+    responses={429: {"description": "Embeddings worker overloaded"}},
+)
+async def generate_embeddings_batch(
+    payload: EmbeddingBatchRequest,
+    embeddings: EmbeddingsWorker = Depends(get_embeddings_worker),
+) -> EmbeddingBatchResponse:
+    # the whole request is one queue entry: admitted or rejected together and
+    # computed in a single call, so a response is never partly rejected
+    try:
+        vectors = await embeddings.embed_many([item.text for item in payload.items])
+    except EmbeddingsOverloaded:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="embeddings worker overloaded",
+            headers={"Retry-After": "1"},
+        )
+    results = [
+        EmbeddingBatchResult(index=index, embedding=vector, metadata=item.metadata)
+        for index, (item, vector) in enumerate(zip(payload.items, vectors))
+    ]
+    return EmbeddingBatchResponse(results=results)
+
+
+@router.get("/embeddings/cache")
+async def embedding_cache_stats(
+    embeddings: EmbeddingsWorker = Depends(get_embeddings_worker),
+) -> dict:
+    return embeddings.stats()
+
+
+async def _embed(embeddings: EmbeddingsWorker, text: str) -> List[float]:
+    try:
+        return await embeddings.embed(text)
+    except EmbeddingsOverloaded:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="embeddings worker overloaded",
+            headers={"Retry-After": "1"},
+        )
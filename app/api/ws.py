@@ -1,4 +1,5 @@
 import uuid
+from typing import Optional
 
 from fastapi import APIRouter, Depends, WebSocket, WebSocketDisconnect
 
@@ -14,6 +15,7 @@ router = APIRouter()
 async def room_websocket(
     websocket: WebSocket,
     room_id: str,
+    after: Optional[int] = None,
     store: InMemoryStore = Depends(get_store_ws),
     room_manager: RoomManager = Depends(get_room_manager_ws),
 ) -> None:
@@ -21,7 +23,7 @@ async def room_websocket(
         await websocket.close(code=4000)
         return
 
-    await room_manager.connect(room_id, websocket)
+    await room_manager.connect(room_id, websocket, after=after)
     try:
         while True:
             text = await websocket.receive_text()
@@ -31,8 +33,8 @@ async def room_websocket(
                 sender="client",
                 text=text,
             )
-            await store.append_room_message(room_id, message)
-            await room_manager.broadcast(room_id, message)
+            encoded = await store.append_room_message(room_id, message)
+            await room_manager.broadcast(room_id, encoded)
     except WebSocketDisconnect:
         await room_manager.disconnect(room_id, websocket)
     except Exception:
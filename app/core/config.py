@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Literal
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """Runtime configuration for the rooms service."""
+
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="AI_ROOMS_")
+
+    history_limit: int = 50
+    # where embedding batches run: on the event loop, or in a thread/process pool
+    embeddings_executor: Literal["inline", "thread", "process"] = "inline"
+    # per-socket outbound queue, and what happens to a client that overflows it:
+    # its frames are dropped, or it is disconnected with close code 1013
+    room_queue_size: int = 256
+    room_overflow_policy: Literal["drop", "disconnect"] = "drop"
+
+
+@lru_cache()
+def get_settings() -> Settings:
+    return Settings()
@@ -1,19 +1,46 @@
+from typing import Optional
+
 from fastapi import FastAPI
 
 from app.api.http import router as http_router
 from app.api.ws import router as ws_router
+from app.core.config import get_settings
 from app.services.embeddings import EmbeddingsWorker
 from app.services.rooms import RoomManager
 from app.services.store import InMemoryStore
 
 
-def create_app() -> FastAPI:
+def create_app(
+    history_limit: Optional[int] = None,
+    embeddings_executor: Optional[str] = None,
+    room_queue_size: Optional[int] = None,
+    room_overflow_policy: Optional[str] = None,
+) -> FastAPI:
+    """Build the app from ``Settings`` (``AI_ROOMS_*``); arguments that are set override them."""
     app = FastAPI(title="AI Rooms – Minimal Stack", version="0.1.0")
 
-    store = InMemoryStore()
-    room_manager = RoomManager(store)
-    embeddings_worker = EmbeddingsWorker()
+    overrides = {
+        name: value
+        for name, value in (
+            ("history_limit", history_limit),
+            ("embeddings_executor", embeddings_executor),
+            ("room_queue_size", room_queue_size),
+            ("room_overflow_policy", room_overflow_policy),
+        )
+        if value is not None
+    }
+    base_settings = get_settings()
+    settings = base_settings.model_copy(update=overrides) if overrides else base_settings
+
+    store = InMemoryStore(history_limit=settings.history_limit)
+    room_manager = RoomManager(
+        store,
+        queue_size=settings.room_queue_size,
+        overflow_policy=settings.room_overflow_policy,
+    )
+    embeddings_worker = EmbeddingsWorker(executor=settings.embeddings_executor)
 
+    app.state.settings = settings
     app.state.store = store
     app.state.room_manager = room_manager
     app.state.embeddings_worker = embeddings_worker
@@ -1,6 +1,6 @@
 from typing import Dict, List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateNomi(BaseModel):
@@ -9,6 +9,8 @@ class CreateNomi(BaseModel):
 
 
 class Nomi(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     name: str
     persona: Dict[str, str] = Field(default_factory=dict)
@@ -24,6 +26,8 @@ class CreateRoom(BaseModel):
 
 
 class Room(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     id: str
     name: str
 
@@ -41,6 +45,26 @@ class EmbeddingResponse(BaseModel):
     embedding: List[float]
 
 
+class EmbeddingBatchItem(BaseModel):
+    text: str
+    metadata: Dict[str, str] = Field(default_factory=dict)
+
+
+class EmbeddingBatchRequest(BaseModel):
+    items: List[EmbeddingBatchItem] = Field(min_length=1, max_length=1024)
+
+
+class EmbeddingBatchResult(BaseModel):
+    index: int
+    embedding: Optional[List[float]] = None
+    metadata: Dict[str, str] = Field(default_factory=dict)
+    error: Optional[str] = None
+
+
+class EmbeddingBatchResponse(BaseModel):
+    results: List[EmbeddingBatchResult]
+
+
 class Message(BaseModel):
     id: str
     roomId: Optional[str] = None
@@ -48,6 +72,8 @@ class Message(BaseModel):
     text: str
     embedding: Optional[List[float]] = None
     nomiId: Optional[str] = None
+    # per-room sequence number assigned by the store; clients resume with ?after=<seq>
+    seq: Optional[int] = None
 
 
 class BroadcastResponse(BaseModel):
@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+_FLOAT_SIZE = sys.getsizeof(0.0)
+# rough cost of the OrderedDict slot, the (vector, expiry) tuple and the key
+_ENTRY_OVERHEAD = 200
+
+
+class EmbeddingCache:
+    """Thread-safe, content-addressed LRU/TTL cache of embeddings with single-flight loading.
+
+    Entries are keyed by a SHA-256 of the model name and the text, evicted
+    least-recently-used first once ``max_bytes`` is exceeded and ignored once
+    older than ``ttl_seconds``. Concurrent misses for the same key share one
+    computation instead of starting their own, whichever thread or event loop
+    they wait on. Used by the app's ``EmbeddingsWorker`` and by the backend's
+    embedding routes.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[bytes, Tuple[Tuple[float, ...], float]]" = OrderedDict()
+        self._inflight: Dict[bytes, Future] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> bytes:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest()
+
+    async def get_or_compute(
+        self, model: str, text: str, compute: Callable[[], Awaitable[List[float]]]
+    ) -> List[float]:
+        async def compute_one(texts: List[str]) -> List[List[float]]:
+            return [await compute()]
+
+        return (await self.get_or_compute_many(model, [text], compute_one))[0]
+
+    async def get_or_compute_many(
+        self,
+        model: str,
+        texts: Sequence[str],
+        compute: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """Like ``get_or_compute`` for several texts, with one ``compute`` call.
+
+        Hits and keys already in flight are reused; every remaining miss is
+        passed to a single ``compute`` call, so the texts are computed, or
+        fail, together.
+        """
+        keys = [self.key(model, text) for text in texts]
+        found: Dict[bytes, Sequence[float]] = {}
+        waiting: Dict[bytes, Future] = {}
+        missing: Dict[bytes, str] = {}
+        with self._lock:
+            for key, text in zip(keys, texts):
+                if key in found or key in waiting:
+                    continue
+                vector = self._get(key)
+                if vector is not None:
+                    self.hits += 1
+                    found[key] = vector
+                    continue
+                pending = self._inflight.get(key)
+                if pending is None:
+                    self.misses += 1
+                    missing[key] = text
+                    pending = self._inflight[key] = Future()
+                else:
+                    self.coalesced += 1
+                waiting[key] = pending
+        if missing:
+            # the computation is owned by the cache, not by the first caller, so
+            # a cancelled caller does not fail the requests coalesced onto it
+            computed = asyncio.ensure_future(compute(list(missing.values())))
+            computed.add_done_callback(
+                functools.partial(self._settle, [(key, waiting[key]) for key in missing])
+            )
+        for key, pending in waiting.items():
+            found[key] = await asyncio.shield(asyncio.wrap_future(pending))
+        return [list(found[key]) for key in keys]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
+
+    def _get(self, key: bytes) -> Optional[Tuple[float, ...]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        vector, expires_at = entry
+        if expires_at <= self._clock():
+            self._discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _put(self, key: bytes, vector: Sequence[float]) -> None:
+        if key in self._entries:
+            self._discard(key)
+        stored = tuple(vector)
+        size = _entry_size(stored)
+        if size > self._max_bytes:
+            return
+        self._entries[key] = (stored, self._clock() + self._ttl)
+        self._bytes += size
+        while self._bytes > self._max_bytes:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _discard(self, key: bytes) -> None:
+        vector, _ = self._entries.pop(key)
+        self._bytes -= _entry_size(vector)
+
+    def _settle(self, slots: List[Tuple[bytes, Future]], computed: asyncio.Future) -> None:
+        failed = computed.cancelled() or computed.exception() is not None
+        vectors = [] if failed else computed.result()
+        with self._lock:
+            for key, _ in slots:
+                self._inflight.pop(key, None)
+            for (key, _), vector in zip(slots, vectors):
+                self._put(key, vector)
+        for index, (_, pending) in enumerate(slots):
+            if computed.cancelled():
+                pending.cancel()
+            elif failed:
+                pending.set_exception(computed.exception())
+            else:
+                pending.set_result(vectors[index])
+
+
+def _entry_size(vector: Tuple[float, ...]) -> int:
+    return _ENTRY_OVERHEAD + sys.getsizeof(vector) + len(vector) * _FLOAT_SIZE
@@ -3,51 +3,169 @@ from __future__ import annotations
 import asyncio
 import hashlib
 import struct
-from typing import List, Optional, Tuple
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.services.embedding_cache import EmbeddingCache
+from app.services.executors import EXECUTOR_INLINE, create_executor
+
+
+# the texts of one embed/embed_many call and the future for their vectors
+_Request = Tuple[List[str], "asyncio.Future[List[List[float]]]"]
+
+
+class EmbeddingsOverloaded(RuntimeError):
+    """Raised when the embeddings queue is full and the request is rejected."""
 
 
 class EmbeddingsWorker:
-    """Async queue worker that produces deterministic hash-based embeddings."""
+    """Async queue worker that produces deterministic hash-based embeddings.
 
-    def __init__(self) -> None:
-        self._queue: Optional[
-            asyncio.Queue[Tuple[str, asyncio.Future[List[float]]]]
-        ] = None
-        self._task: Optional[asyncio.Task] = None
+    Requests are queued on a bounded queue and consumed by ``runners`` tasks.
+    Each runner drains queued requests until it holds ``max_batch_size`` texts,
+    waiting at most ``max_batch_wait_ms`` for a batch to fill, and computes the
+    whole batch in one call. When the queue is full ``embed`` fails fast with
+    ``EmbeddingsOverloaded`` instead of letting latency grow without bound.
+    ``embed_many`` queues all of its texts as one request, so they are
+    admitted or rejected together and computed in the same call.
+    Results go through an ``EmbeddingCache``, so repeated texts are served
+    from memory and concurrent requests for one text share a queue slot.
+
+    ``executor`` selects where batches are computed: ``"inline"`` on the event
+    loop, or a ``"thread"``/``"process"`` pool of ``executor_workers`` so health
+    checks and WebSocket traffic keep flowing while a batch runs.
+    """
+
+    model = "sha256-hash-v1"
+
+    def __init__(
+        self,
+        max_batch_size: int = 32,
+        max_batch_wait_ms: float = 2.0,
+        runners: int = 1,
+        max_queue_size: int = 1024,
+        cache: Optional[EmbeddingCache] = None,
+        executor: str = EXECUTOR_INLINE,
+        executor_workers: Optional[int] = None,
+    ) -> None:
+        if max_batch_size < 1 or runners < 1 or max_queue_size < 1:
+            raise ValueError("batch size, runners and queue size must be positive")
+        self._max_batch_size = max_batch_size
+        self._max_batch_wait = max_batch_wait_ms / 1000
+        self._runners = runners
+        self._max_queue_size = max_queue_size
+        self._queue: Optional[asyncio.Queue[_Request]] = None
+        self._tasks: List[asyncio.Task] = []
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self._executor_kind = executor
+        self._executor_workers = executor_workers
+        self._executor: Optional[Executor] = None
 
     async def start(self) -> None:
         if self._queue is None:
-            self._queue = asyncio.Queue()
-        if self._task is None or self._task.done():
-            self._task = asyncio.create_task(self._runner())
+            self._queue = asyncio.Queue(maxsize=self._max_queue_size)
+        if self._executor is None:
+            self._executor = create_executor(self._executor_kind, self._executor_workers)
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self._runners:
+            self._tasks.append(asyncio.create_task(self._runner()))
 
     async def shutdown(self) -> None:
-        if self._task:
-            self._task.cancel()
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
             try:
-                await self._task
+                await task
             except asyncio.CancelledError:
                 pass
-            self._task = None
+        self._tasks = []
         self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
     async def embed(self, text: str) -> List[float]:
+        if self._queue is None:
+            raise RuntimeError("Embeddings worker not started")
+        return await self.cache.get_or_compute(self.model, text, lambda: self._enqueue(text))
+
+    async def embed_many(self, texts: Sequence[str]) -> List[List[float]]:
+        if self._queue is None:
+            raise RuntimeError("Embeddings worker not started")
+        return await self.cache.get_or_compute_many(self.model, texts, self._enqueue_many)
+
+    def stats(self) -> Dict[str, int]:
+        return self.cache.stats()
+
+    async def _enqueue(self, text: str) -> List[float]:
+        return (await self._enqueue_many([text]))[0]
+
+    async def _enqueue_many(self, texts: List[str]) -> List[List[float]]:
         if self._queue is None:
             raise RuntimeError("Embeddings worker not started")
         loop = asyncio.get_running_loop()
-        result: asyncio.Future[List[float]] = loop.create_future()
-        await self._queue.put((text, result))
+        result: asyncio.Future[List[List[float]]] = loop.create_future()
+        try:
+            self._queue.put_nowait((texts, result))
+        except asyncio.QueueFull:
+            raise EmbeddingsOverloaded("embeddings queue is full") from None
         return await result
 
     async def _runner(self) -> None:
         assert self._queue is not None
+        loop = asyncio.get_running_loop()
         while True:
-            text, future = await self._queue.get()
+            batch = await self._next_batch(self._queue)
+            texts = [text for request_texts, _ in batch for text in request_texts]
             try:
-                embedding = self._compute_embedding(text)
-                future.set_result(embedding)
+                if self._executor is None:
+                    embeddings = self._compute_batch(texts)
+                    # queue.get() does not yield while items are waiting, so give
+                    # other tasks a turn between back-to-back inline batches
+                    await asyncio.sleep(0)
+                else:
+                    embeddings = await loop.run_in_executor(
+                        self._executor, self._compute_batch, texts
+                    )
             except Exception as exc:  # pragma: no cover - unexpected runtime errors
-                future.set_exception(exc)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            offset = 0
+            for request_texts, future in batch:
+                end = offset + len(request_texts)
+                if not future.done():
+                    future.set_result(embeddings[offset:end])
+                offset = end
+
+    async def _next_batch(self, queue: asyncio.Queue[_Request]) -> List[_Request]:
+        loop = asyncio.get_running_loop()
+        batch = [await queue.get()]
+        size = len(batch[0][0])
+        deadline = loop.time() + self._max_batch_wait
+        # a request larger than max_batch_size is still computed whole
+        while size < self._max_batch_size:
+            if not queue.empty():
+                batch.append(queue.get_nowait())
+                size += len(batch[-1][0])
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter}, timeout=remaining)
+            if not done:
+                # a cancelled get never removes an item, so nothing is lost here
+                getter.cancel()
+                break
+            batch.append(getter.result())
+            size += len(batch[-1][0])
+        return batch
+
+    @classmethod
+    def _compute_batch(cls, texts: Sequence[str]) -> List[List[float]]:
+        return [cls._compute_embedding(text) for text in texts]
 
     @staticmethod
     def _compute_embedding(text: str) -> List[float]:
@@ -0,0 +1,37 @@
+from __future__ import annotations
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+EXECUTOR_INLINE = "inline"
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+EXECUTOR_KINDS = (EXECUTOR_INLINE, EXECUTOR_THREAD, EXECUTOR_PROCESS)
+
+
+def create_executor(
+    kind: str,
+    max_workers: Optional[int] = None,
+    initializer: Optional[Callable[..., Any]] = None,
+    initargs: Tuple[Any, ...] = (),
+) -> Optional[Executor]:
+    """Build the executor that runs CPU-heavy work off the event loop.
+
+    ``"inline"`` returns ``None``: the caller runs the work on the event loop
+    itself. ``initializer`` runs once in every pool worker, which is where a
+    model should be loaded.
+    """
+    if kind == EXECUTOR_INLINE:
+        return None
+    if kind == EXECUTOR_THREAD:
+        return ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="embeddings",
+            initializer=initializer,
+            initargs=initargs,
+        )
+    if kind == EXECUTOR_PROCESS:
+        return ProcessPoolExecutor(
+            max_workers=max_workers, initializer=initializer, initargs=initargs
+        )
+    raise ValueError(f"unknown executor kind: {kind}")
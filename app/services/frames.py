@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Iterable, Optional
+
+from starlette.responses import Response
+
+from app.schemas import Message
+
+try:  # pragma: no cover - exercised implicitly when orjson is installed
+    import orjson
+except ImportError:  # pragma: no cover - stdlib fallback
+    orjson = None
+
+
+def dumps(value: Any) -> str:
+    """Serialize ``value`` to compact JSON text, preferring orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(value).decode("utf-8")
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class EncodedMessage:
+    """Immutable stored form of a ``Message``: its room sequence and wire JSON.
+
+    The JSON is produced exactly once and reused verbatim for every WebSocket
+    recipient, for history replay and for HTTP responses. Only the sequence
+    number and the encoded text are kept, so the memory cost per message is
+    the size of its JSON plus a fixed two-slot object.
+    """
+
+    __slots__ = ("seq", "json")
+
+    seq: Optional[int]
+    json: str
+
+    def __init__(self, message: Message) -> None:
+        object.__setattr__(self, "seq", message.seq)
+        object.__setattr__(self, "json", dumps(message.model_dump()))
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError("EncodedMessage is immutable")
+
+
+def message_frame(encoded: EncodedMessage) -> str:
+    return '{"type":"message","payload":' + encoded.json + "}"
+
+
+def encode_history(messages: Iterable[EncodedMessage]) -> str:
+    """Join already-encoded messages into a JSON array."""
+    return "[" + ",".join(message.json for message in messages) + "]"
+
+
+def history_frame(history_json: str) -> str:
+    return '{"type":"history","payload":' + history_json + "}"
+
+
+# tells a resuming client that its gap is gone; a full history frame follows
+RESYNC_FRAME = '{"type":"resync","payload":{"reason":"history_truncated"}}'
+
+
+class RawJSONResponse(Response):
+    """Response whose body is JSON text that has already been encoded."""
+
+    media_type = "application/json"
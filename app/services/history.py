@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+from typing import Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class RingBuffer(Generic[T]):
+    """Fixed-capacity FIFO that overwrites its oldest entry when full.
+
+    Storage grows on demand up to ``capacity`` and is then reused in place, so
+    appends never shift existing entries. Reads return tuples of the stored
+    references: a consistent snapshot that costs one pointer per entry and
+    never copies the entries themselves.
+    """
+
+    __slots__ = ("_items", "_capacity", "_start")
+
+    def __init__(self, capacity: int) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self._items: List[T] = []
+        self._capacity = capacity
+        self._start = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def append(self, item: T) -> None:
+        if len(self._items) < self._capacity:
+            self._items.append(item)
+            return
+        self._items[self._start] = item
+        self._start = (self._start + 1) % self._capacity
+
+    def first(self) -> Optional[T]:
+        return self._items[self._start] if self._items else None
+
+    def snapshot(self) -> Tuple[T, ...]:
+        """Return every entry, oldest first."""
+        items, start = self._items, self._start
+        return tuple(items[start:] + items[:start]) if start else tuple(items)
+
+    def tail(self, count: int) -> Tuple[T, ...]:
+        """Return the newest ``count`` entries, oldest first."""
+        size = len(self._items)
+        count = max(0, min(count, size))
+        if count == 0:
+            return ()
+        begin = (self._start + size - count) % size
+        end = begin + count
+        if end <= size:
+            return tuple(self._items[begin:end])
+        return tuple(self._items[begin:] + self._items[: end - size])
@@ -1,58 +1,176 @@
 from __future__ import annotations
 
 import asyncio
-import json
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set, Tuple
 
 from fastapi import WebSocket
 
-from app.schemas import Message, RoomMessagesResponse
+from app.services.frames import RESYNC_FRAME, EncodedMessage, history_frame, message_frame
 from app.services.store import InMemoryStore
 
+OVERFLOW_DROP = "drop"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP, OVERFLOW_DISCONNECT)
+
+# close code sent to consumers evicted by the "disconnect" overflow policy
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+
+class _Connection:
+    """A room socket with its bounded outbound queue of ``(seq, frame)`` and writer task."""
+
+    __slots__ = ("websocket", "queue", "writer", "replayed_through")
+
+    def __init__(self, websocket: WebSocket, queue_size: int) -> None:
+        self.websocket = websocket
+        self.queue: asyncio.Queue[Tuple[Optional[int], str]] = asyncio.Queue(maxsize=queue_size)
+        self.writer: Optional[asyncio.Task] = None
+        # newest seq already sent in the history frame; queued frames up to it are skipped
+        self.replayed_through = 0
+
 
 class RoomManager:
-    """Maintains WebSocket connections per room and handles fan-out."""
+    """Maintains WebSocket connections per room and handles fan-out.
 
-    def __init__(self, store: InMemoryStore) -> None:
+    Every connection owns a bounded outbound queue drained by its own writer
+    task, so ``broadcast`` only enqueues and never waits on a slow client. When
+    a queue is full the ``overflow_policy`` decides whether the frame is dropped
+    for that client (``"drop"``) or the client is disconnected
+    (``"disconnect"``).
+    """
+
+    def __init__(
+        self,
+        store: InMemoryStore,
+        queue_size: int = 256,
+        overflow_policy: str = OVERFLOW_DROP,
+    ) -> None:
+        if queue_size < 1:
+            raise ValueError("queue_size must be positive")
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"unknown overflow policy: {overflow_policy}")
         self._store = store
-        self._rooms: Dict[str, Set[WebSocket]] = {}
+        self._queue_size = queue_size
+        self._overflow_policy = overflow_policy
+        self._rooms: Dict[str, Dict[WebSocket, _Connection]] = {}
+        self._dropped: Dict[str, int] = {}
+        self._disconnected: Dict[str, int] = {}
+        # the loop only keeps weak references to tasks, so evicted sockets'
+        # close tasks are held here until they finish
+        self._closing: Set[asyncio.Task] = set()
         self._lock = asyncio.Lock()
 
-    async def connect(self, room_id: str, websocket: WebSocket) -> None:
+    async def connect(
+        self, room_id: str, websocket: WebSocket, after: Optional[int] = None
+    ) -> None:
+        """Register ``websocket`` and replay history.
+
+        With ``after`` set, only messages with a higher ``seq`` are replayed; if
+        they are no longer retained a resync frame precedes the full history.
+        The socket is registered before the history is read, so nothing
+        broadcast in between is missed; live frames the history already
+        contained are skipped, and each message reaches the client once.
+        """
         await websocket.accept()
+        connection = _Connection(websocket, self._queue_size)
+        async with self._lock:
+            self._rooms.setdefault(room_id, {})[websocket] = connection
+        # live frames queue up while history goes out; the writer starts after
+        try:
+            connection.replayed_through = await self._send_history(room_id, websocket, after)
+        except Exception:
+            await self._remove(room_id, websocket)
+            raise
         async with self._lock:
-            connections = self._rooms.setdefault(room_id, set())
-            connections.add(websocket)
-        await self._send_history(room_id, websocket)
+            if self._rooms.get(room_id, {}).get(websocket) is not connection:
+                return  # evicted while the history was being sent
+            connection.writer = asyncio.create_task(self._writer(room_id, connection))
 
     async def disconnect(self, room_id: str, websocket: WebSocket) -> None:
-        async with self._lock:
-            connections = self._rooms.get(room_id)
-            if not connections:
-                return
-            connections.discard(websocket)
-            if not connections:
-                self._rooms.pop(room_id, None)
+        connection = await self._remove(room_id, websocket)
+        if connection and connection.writer:
+            connection.writer.cancel()
 
-    async def broadcast(self, room_id: str, message: Message) -> int:
+    async def broadcast(self, room_id: str, message: EncodedMessage) -> int:
         async with self._lock:
-            connections: List[WebSocket] = list(self._rooms.get(room_id, set()))
+            connections: List[_Connection] = list(self._rooms.get(room_id, {}).values())
         if not connections:
             return 0
 
-        payload = json.dumps({"type": "message", "payload": message.model_dump()})
+        payload = message_frame(message)
         delivered = 0
-        for websocket in connections:
+        for connection in connections:
             try:
-                await websocket.send_text(payload)
+                connection.queue.put_nowait((message.seq, payload))
                 delivered += 1
-            except RuntimeError:
-                # the connection is dead; it will be cleaned up at the next event
-                continue
+            except asyncio.QueueFull:
+                self._dropped[room_id] = self._dropped.get(room_id, 0) + 1
+                if self._overflow_policy == OVERFLOW_DISCONNECT:
+                    await self._evict(room_id, connection)
         return delivered
 
-    async def _send_history(self, room_id: str, websocket: WebSocket) -> None:
-        history: RoomMessagesResponse = await self._store.get_room_messages(room_id)
-        for message in history.messages:
-            payload = json.dumps({"type": "history", "payload": message.model_dump()})
-            await websocket.send_text(payload)
+    def room_stats(self, room_id: str) -> Dict[str, int]:
+        """Return fan-out counters for a room."""
+        connections = self._rooms.get(room_id, {}).values()
+        return {
+            "connections": len(connections),
+            "queue_depth": sum(connection.queue.qsize() for connection in connections),
+            "dropped": self._dropped.get(room_id, 0),
+            "disconnected": self._disconnected.get(room_id, 0),
+        }
+
+    async def _writer(self, room_id: str, connection: _Connection) -> None:
+        try:
+            while True:
+                seq, payload = await connection.queue.get()
+                if seq is not None and seq <= connection.replayed_through:
+                    continue
+                await connection.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the connection is dead; stop fanning out to it immediately
+            await self._remove(room_id, connection.websocket)
+
+    async def _evict(self, room_id: str, connection: _Connection) -> None:
+        if not await self._remove(room_id, connection.websocket):
+            return
+        self._disconnected[room_id] = self._disconnected.get(room_id, 0) + 1
+        if connection.writer:
+            connection.writer.cancel()
+        # closing may block on the slow peer, so keep it off the broadcast path
+        closing = asyncio.create_task(self._close(connection.websocket))
+        self._closing.add(closing)
+        closing.add_done_callback(self._closing.discard)
+
+    async def _remove(self, room_id: str, websocket: WebSocket) -> Optional[_Connection]:
+        async with self._lock:
+            connections = self._rooms.get(room_id)
+            if not connections:
+                return None
+            connection = connections.pop(websocket, None)
+            if not connections:
+                self._rooms.pop(room_id, None)
+            return connection
+
+    @staticmethod
+    async def _close(websocket: WebSocket) -> None:
+        try:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE)
+        except Exception:  # pragma: no cover - peer already gone
+            pass
+
+    async def _send_history(
+        self, room_id: str, websocket: WebSocket, after: Optional[int]
+    ) -> int:
+        """Send the history frame(s) and return the newest ``seq`` they cover."""
+        if after is not None:
+            gap = await self._store.get_room_history_after(room_id, after)
+            if gap is not None:
+                gap_json, through = gap
+                await websocket.send_text(history_frame(gap_json))
+                return through
+            await websocket.send_text(RESYNC_FRAME)
+        history_json, through = await self._store.get_room_history_json_through(room_id)
+        await websocket.send_text(history_frame(history_json))
+        return through
@@ -2,57 +2,113 @@ from __future__ import annotations
 
 import asyncio
 import uuid
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 
-from app.schemas import CreateNomi, CreateRoom, Message, Nomi, Room, RoomMessagesResponse
+from app.schemas import CreateNomi, CreateRoom, Message, Nomi, Room
+from app.services.frames import EncodedMessage, encode_history
+from app.services.history import RingBuffer
 
 
 class InMemoryStore:
-    """Thread-safe-ish in-memory data store for prototypes."""
+    """Thread-safe-ish in-memory data store for prototypes.
 
-    def __init__(self, history_limit: int = 50) -> None:
+    Nomis and rooms are immutable once created, so they are published with a
+    single dict assignment and read without locking. Message history is
+    guarded by a fixed set of lock stripes picked by room id, so writers to
+    unrelated rooms do not queue behind each other.
+
+    Each room keeps its newest ``history_limit`` messages in a ring buffer of
+    immutable ``EncodedMessage`` records, and reads hand out snapshots of
+    those records instead of copies.
+    """
+
+    def __init__(self, history_limit: int = 50, lock_stripes: int = 64) -> None:
+        if history_limit < 1:
+            raise ValueError("history_limit must be positive")
+        if lock_stripes < 1:
+            raise ValueError("lock_stripes must be positive")
         self._nomis: Dict[str, Nomi] = {}
         self._rooms: Dict[str, Room] = {}
-        self._messages: Dict[str, List[Message]] = {}
+        self._messages: Dict[str, RingBuffer[EncodedMessage]] = {}
+        # pre-encoded JSON array of each room's history, rebuilt lazily after appends
+        self._history_json: Dict[str, str] = {}
+        self._last_seq: Dict[str, int] = {}
         self._history_limit = history_limit
-        self._lock = asyncio.Lock()
+        self._locks = [asyncio.Lock() for _ in range(lock_stripes)]
+
+    def _room_lock(self, room_id: str) -> asyncio.Lock:
+        return self._locks[hash(room_id) % len(self._locks)]
 
     async def create_nomi(self, payload: CreateNomi) -> Nomi:
         nomi_id = str(uuid.uuid4())
         nomi = Nomi(id=nomi_id, name=payload.name, persona=payload.persona)
-        async with self._lock:
-            self._nomis[nomi_id] = nomi
+        self._nomis[nomi_id] = nomi
         return nomi
 
     async def get_nomi(self, nomi_id: str) -> Optional[Nomi]:
-        async with self._lock:
-            return self._nomis.get(nomi_id)
+        return self._nomis.get(nomi_id)
 
     async def create_room(self, payload: CreateRoom) -> Room:
         room_id = str(uuid.uuid4())
         room = Room(id=room_id, name=payload.name)
-        async with self._lock:
-            self._rooms[room_id] = room
-            self._messages.setdefault(room_id, [])
+        self._rooms[room_id] = room
         return room
 
     async def room_exists(self, room_id: str) -> bool:
-        async with self._lock:
-            return room_id in self._rooms
+        return room_id in self._rooms
 
     async def list_rooms(self) -> List[Room]:
-        async with self._lock:
-            return list(self._rooms.values())
-
-    async def get_room_messages(self, room_id: str) -> RoomMessagesResponse:
-        async with self._lock:
-            messages = self._messages.get(room_id, [])
-            # copy to avoid accidental external mutation
-            return RoomMessagesResponse(messages=[msg.model_copy() for msg in messages])
-
-    async def append_room_message(self, room_id: str, message: Message) -> None:
-        async with self._lock:
-            history = self._messages.setdefault(room_id, [])
-            history.append(message)
-            if len(history) > self._history_limit:
-                del history[:-self._history_limit]
+        return list(self._rooms.values())
+
+    async def get_room_messages(self, room_id: str) -> Tuple[EncodedMessage, ...]:
+        """Return a snapshot of the room history, oldest first."""
+        async with self._room_lock(room_id):
+            history = self._messages.get(room_id)
+            return history.snapshot() if history else ()
+
+    async def get_room_history_json(self, room_id: str) -> str:
+        """Return the room history as one JSON array, encoded at most once per change."""
+        history_json, _ = await self.get_room_history_json_through(room_id)
+        return history_json
+
+    async def get_room_history_json_through(self, room_id: str) -> Tuple[str, int]:
+        """Like ``get_room_history_json``, with the ``seq`` of the newest message in it."""
+        async with self._room_lock(room_id):
+            history_json = self._history_json.get(room_id)
+            if history_json is None:
+                history = self._messages.get(room_id)
+                history_json = encode_history(history.snapshot() if history else ())
+                self._history_json[room_id] = history_json
+            return history_json, self._last_seq.get(room_id, 0)
+
+    async def get_room_history_after(
+        self, room_id: str, after: int
+    ) -> Optional[Tuple[str, int]]:
+        """Return messages with ``seq > after`` as a JSON array, and the newest ``seq``.
+
+        Returns ``None`` when some of those messages have already been trimmed
+        from the retained window (or ``after`` is ahead of this room), meaning
+        the caller has to resync from the full history.
+        """
+        async with self._room_lock(room_id):
+            last_seq = self._last_seq.get(room_id, 0)
+            if after == last_seq:
+                return "[]", last_seq
+            history = self._messages.get(room_id)
+            if after > last_seq or not history or history.first().seq > after + 1:
+                return None
+            # seqs are contiguous within the window, so the gap is a suffix
+            return encode_history(history.tail(last_seq - after)), last_seq
+
+    async def append_room_message(self, room_id: str, message: Message) -> EncodedMessage:
+        async with self._room_lock(room_id):
+            seq = self._last_seq.get(room_id, 0) + 1
+            self._last_seq[room_id] = seq
+            message.seq = seq
+            encoded = EncodedMessage(message)
+            history = self._messages.get(room_id)
+            if history is None:
+                history = self._messages[room_id] = RingBuffer(self._history_limit)
+            history.append(encoded)
+            self._history_json.pop(room_id, None)
+        return encoded
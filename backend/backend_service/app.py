@@ -1,26 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
 from fastapi import FastAPI
 
-from backend.backend_service import models
-from backend.backend_service.config import get_settings
-from backend.backend_service.database import create_session_factory
+from app.services.embedding_cache import EmbeddingCache
+from backend.backend_service.config import Settings, get_settings
+from backend.backend_service.database import create_async_session_factory, create_session_factory
+from backend.backend_service.dependencies import open_store
+from backend.backend_service.migrations import prepare_database
 from backend.backend_service.routers import auth, embeddings, models as models_router, nomis, rooms, system
+from backend.backend_service.services.http_cache import ResponseCache
+from backend.backend_service.services.ivf_index import IVFIndex
+from backend.backend_service.services.membership import MembershipCache
+from backend.backend_service.services.passwords import PasswordHasher
+from backend.backend_service.services.pool_metrics import PoolMetrics
+from backend.backend_service.services.principals import PrincipalCache, install_invalidation
+from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.usage import UsageBatch, UsageRecorder
+from backend.backend_service.services.vector_index import SearchIndex, VectorIndex
+from backend.backend_service.services.versions import VersionCounters
+
 
+def create_vector_index(settings: Settings) -> SearchIndex:
+    if settings.vector_index == "exact":
+        return VectorIndex()
+    if settings.vector_index == "ivf":
+        return IVFIndex(
+            path=settings.vector_index_path,
+            n_lists=settings.ivf_lists,
+            nprobe=settings.ivf_nprobe,
+        )
+    raise ValueError(f"unknown vector index: {settings.vector_index}")
 
-def create_app(database_url: str | None = None) -> FastAPI:
+
+def create_app(database_url: str | None = None, database_async: bool | None = None) -> FastAPI:
     base_settings = get_settings()
-    settings = (
-        base_settings.model_copy(update={"database_url": database_url})
-        if database_url
-        else base_settings
-    )
+    overrides = {}
+    if database_url:
+        overrides["database_url"] = database_url
+    if database_async is not None:
+        overrides["database_async"] = database_async
+    settings = base_settings.model_copy(update=overrides) if overrides else base_settings
+    if settings.database_async is None:
+        settings = settings.model_copy(
+            update={"database_async": not settings.database_url.startswith("sqlite")}
+        )
     app = FastAPI(title="AI Rooms Backend API", version="1.0.0")
 
-    engine, session_factory = create_session_factory(settings.database_url)
-    models.Base.metadata.create_all(bind=engine)
+    if settings.database_async:
+        # the schema is prepared at startup, where the async engine can be awaited
+        engine, async_session_factory = create_async_session_factory(
+            settings.database_url, settings
+        )
+        app.state.async_session_factory = async_session_factory
+        app.state.pool_metrics = PoolMetrics(engine.sync_engine)
+    else:
+        engine, session_factory = create_session_factory(settings.database_url, settings)
+        app.state.pool_metrics = PoolMetrics(engine)
+        with engine.begin() as connection:
+            prepare_database(connection, settings.vector_encoding)
+        app.state.session_factory = session_factory
 
     app.state.engine = engine
-    app.state.session_factory = session_factory
+    app.state.principal_cache = PrincipalCache(
+        max_entries=settings.principal_cache_max_entries,
+        ttl_seconds=settings.principal_cache_ttl_seconds,
+    )
+    install_invalidation(
+        async_session_factory if settings.database_async else session_factory,
+        app.state.principal_cache,
+    )
     app.state.settings = settings
+    app.state.embedding_cache = EmbeddingCache(
+        max_bytes=settings.embedding_cache_max_bytes,
+        ttl_seconds=settings.embedding_cache_ttl_seconds,
+    )
+    app.state.vector_index = create_vector_index(settings)
+    app.state.password_hasher = PasswordHasher(
+        rounds=settings.bcrypt_rounds,
+        threads=settings.password_hash_threads,
+        max_pending=settings.password_hash_max_pending,
+    )
+    app.state.usage_recorder = UsageRecorder()
+    app.state.versions = VersionCounters()
+    app.state.response_cache = ResponseCache(
+        max_bytes=settings.response_cache_max_bytes,
+        ttl_seconds=settings.response_cache_ttl_seconds,
+    )
+    app.state.membership_cache = MembershipCache(
+        max_entries=settings.membership_cache_max_entries,
+        ttl_seconds=settings.membership_cache_ttl_seconds,
+    )
+    app.state.search_executor = ThreadPoolExecutor(
+        max_workers=settings.search_threads, thread_name_prefix="search"
+    )
+
+    minute_retention = timedelta(hours=settings.usage_minute_retention_hours)
+
+    async def persist_usage(batch: UsageBatch) -> None:
+        async with open_store(app.state) as store:
+            await store.run(DatabaseStore.add_usage, batch, minute_retention)
+
+    @app.on_event("startup")
+    async def on_startup() -> None:
+        if settings.database_async:
+            async with engine.begin() as connection:
+                await connection.run_sync(prepare_database, settings.vector_encoding)
+        app.state.usage_recorder.start(persist_usage, settings.usage_flush_seconds)
+
+    @app.on_event("shutdown")
+    async def on_shutdown() -> None:
+        await app.state.usage_recorder.stop(persist_usage)
+        app.state.search_executor.shutdown(wait=False)
+        app.state.password_hasher.shutdown()
+        if isinstance(app.state.vector_index, IVFIndex):
+            app.state.vector_index.flush()
+        if settings.database_async:
+            await engine.dispose()
 
     # Include routers
     app.include_router(system.router)
@@ -1,21 +1,69 @@
 from __future__ import annotations
 
 from functools import lru_cache
+from typing import Optional
 
-from pydantic import BaseSettings, Field
+from pydantic import AliasChoices, Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     """Runtime configuration for the backend service."""
 
-    secret_key: str = Field("change-me", env="SECRET_KEY")
+    model_config = SettingsConfigDict(env_file=".env", env_prefix="AI_ROOMS_")
+
+    secret_key: str = Field(
+        "change-me", validation_alias=AliasChoices("AI_ROOMS_SECRET_KEY", "SECRET_KEY")
+    )
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
-    database_url: str = Field("sqlite:///./ai_rooms.db", env="DATABASE_URL")
-
-    class Config:
-        env_file = ".env"
-        env_prefix = "AI_ROOMS_"
+    database_url: str = Field(
+        "sqlite:///./ai_rooms.db",
+        validation_alias=AliasChoices("AI_ROOMS_DATABASE_URL", "DATABASE_URL"),
+    )
+    # async engine (aiosqlite/asyncpg) for request handling, or the sync Session
+    # path that runs store calls on threadpool threads; unset picks async for
+    # networked databases and sync for SQLite, which has no I/O wait to overlap
+    database_async: Optional[bool] = None
+    # connection pool: persistent connections, extra ones allowed under load,
+    # max connection age (-1 keeps them), liveness check on checkout, and how
+    # long a request waits for a free connection before failing
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_recycle: int = -1
+    db_pool_pre_ping: bool = False
+    db_pool_timeout: float = 30.0
+    # bcrypt cost for new hashes (older ones are rehashed at login), threads that
+    # run it, and hash jobs admitted before signup/login answer 503
+    bcrypt_rounds: int = 12
+    password_hash_threads: int = 2
+    password_hash_max_pending: int = 32
+    # bearer token -> user principal cache; entries also expire with the token
+    principal_cache_max_entries: int = 10_000
+    principal_cache_ttl_seconds: float = 60.0
+    # (room, user) membership checks on the message routes
+    membership_cache_max_entries: int = 50_000
+    membership_cache_ttl_seconds: float = 60.0
+    # serialized bodies of the polled list endpoints, keyed by data version
+    response_cache_max_bytes: int = 32 * 1024 * 1024
+    # also how long a write through another replica can go unseen by polls
+    response_cache_ttl_seconds: float = 2.0
+    embedding_cache_max_bytes: int = 64 * 1024 * 1024
+    embedding_cache_ttl_seconds: float = 3600.0
+    # "float32" or "int8" (quantized, a quarter of the size) vector blobs
+    vector_encoding: str = "float32"
+    # "exact" scans every vector, "ivf" probes the closest inverted lists
+    vector_index: str = "exact"
+    vector_index_path: Optional[str] = None
+    ivf_lists: int = 0
+    ivf_nprobe: int = 8
+    # usage counts are buffered in memory and written this often; minute
+    # buckets are kept this long, hour buckets and totals indefinitely
+    usage_flush_seconds: float = 5.0
+    usage_minute_retention_hours: float = 48.0
+    # per-source candidate cap for mode=hybrid search, and threads that run it
+    hybrid_candidates: int = 50
+    search_threads: int = 4
 
 
 @lru_cache()
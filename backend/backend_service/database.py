@@ -1,20 +1,234 @@
 from __future__ import annotations
 
-from typing import Tuple
+import re
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Connection, Table, create_engine, make_url, text, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import StaticPool
 
+from backend.backend_service.services.pool_metrics import (
+    TimedAsyncAdaptedQueuePool,
+    TimedQueuePool,
+)
 
-def create_session_factory(database_url: str):
+# tables with a ``text`` column that get a full-text index
+FULL_TEXT_TABLES = ("embeddings", "messages")
+_TERM = re.compile(r"\w+")
+
+
+def pool_options(settings: Any = None) -> Dict[str, Any]:
+    """Queue-pool keyword arguments for ``create_engine`` from the ``db_pool_*`` settings."""
+    if settings is None:
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
+
+def create_session_factory(database_url: str, settings: Any = None):
     connect_args = {}
-    engine_kwargs = {}
+    engine_kwargs: Dict[str, Any] = {"poolclass": TimedQueuePool, **pool_options(settings)}
     if database_url.startswith("sqlite"):
         connect_args["check_same_thread"] = False
         if database_url.endswith(":memory:") or database_url.startswith("sqlite:///:memory"):
-            engine_kwargs["poolclass"] = StaticPool
+            # one shared connection; queue-pool sizing does not apply
+            engine_kwargs = {"poolclass": StaticPool}
 
     engine = create_engine(database_url, connect_args=connect_args, **engine_kwargs)
-    SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    # loaded objects outlive the per-call commits of ``services/store_runner.py``
+    SessionLocal = sessionmaker(
+        bind=engine, autoflush=False, autocommit=False, expire_on_commit=False
+    )
     return engine, SessionLocal
+
+
+# async driver for each sync dialect the service supports
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def create_async_session_factory(database_url: str, settings: Any = None):
+    """Async counterpart of ``create_session_factory`` for the same ``database_url``.
+
+    The sync driver in the URL is swapped for its async one (aiosqlite,
+    asyncpg). Objects stay loaded after commit, as with the sync factory; here
+    it is required, because an expired attribute touched outside
+    ``AsyncSession.run_sync`` cannot lazy-load.
+    """
+    url = make_url(database_url)
+    driver = _ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"no async driver for {url.get_backend_name()}")
+    url = url.set(drivername=f"{url.get_backend_name()}+{driver}")
+    engine_kwargs: Dict[str, Any] = {
+        "poolclass": TimedAsyncAdaptedQueuePool,
+        **pool_options(settings),
+    }
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        engine_kwargs = {"poolclass": StaticPool}
+    engine = create_async_engine(url, **engine_kwargs)
+    AsyncSessionLocal = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    return engine, AsyncSessionLocal
+
+
+def install_full_text_search(
+    connection: Connection, tables: Sequence[str] = FULL_TEXT_TABLES
+) -> None:
+    """Create the full-text index for ``tables`` that suits the dialect.
+
+    SQLite gets an external-content FTS5 table per source table, kept in sync
+    by triggers; Postgres gets a GIN index on ``to_tsvector('english', text)``.
+    Other dialects get nothing and ``full_text_search`` falls back to ``LIKE``.
+    """
+    dialect = connection.dialect.name
+    for table in tables:
+        if dialect == "sqlite":
+            _install_fts5(connection, table)
+        elif dialect == "postgresql":
+            connection.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS ix_{table}_text_fts "
+                    f"ON {table} USING GIN (to_tsvector('english', text))"
+                )
+            )
+
+
+def full_text_search(
+    session: Session,
+    table: str,
+    query: str,
+    limit: int,
+    where: Optional[Dict[str, Any]] = None,
+) -> List[Tuple[str, float]]:
+    """Return ``(id, score)`` for rows of ``table`` matching ``query``, best first.
+
+    ``where`` adds equality filters on columns of ``table``. Scores are only
+    comparable within one dialect: negated BM25 on SQLite, ``ts_rank`` on
+    Postgres.
+    """
+    if table not in FULL_TEXT_TABLES:
+        raise ValueError(f"no full-text index on {table}")
+    terms = _TERM.findall(query.lower())
+    if not terms or limit <= 0:
+        return []
+    params: Dict[str, Any] = {"limit": limit}
+    filters = ""
+    for column, value in (where or {}).items():
+        filters += f" AND src.{column} = :where_{column}"
+        params[f"where_{column}"] = value
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        # quoting every term keeps FTS5 operators in user input from being parsed
+        params["match"] = " ".join(f'"{term}"' for term in terms)
+        statement = (
+            f"SELECT src.id, -bm25({table}_fts) AS score FROM {table}_fts "
+            f"JOIN {table} src ON src.rowid = {table}_fts.rowid "
+            f"WHERE {table}_fts MATCH :match{filters} ORDER BY score DESC LIMIT :limit"
+        )
+    elif dialect == "postgresql":
+        params["query"] = query
+        statement = (
+            f"SELECT src.id, ts_rank(to_tsvector('english', src.text), q) AS score "
+            f"FROM {table} src, websearch_to_tsquery('english', :query) q "
+            f"WHERE to_tsvector('english', src.text) @@ q{filters} "
+            f"ORDER BY score DESC LIMIT :limit"
+        )
+    else:
+        likes = ""
+        for position, term in enumerate(terms):
+            likes += f" AND lower(src.text) LIKE :term_{position}"
+            params[f"term_{position}"] = f"%{term}%"
+        statement = (
+            f"SELECT src.id, 1.0 AS score FROM {table} src "
+            f"WHERE 1 = 1{likes}{filters} LIMIT :limit"
+        )
+    rows = session.execute(text(statement), params).all()
+    return [(row.id, float(row.score)) for row in rows]
+
+
+# dialects whose ``insert()`` supports ``ON CONFLICT`` clauses
+_CONFLICT_INSERTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def conflict_insert(session: Session, table: Table) -> Optional[Any]:
+    """Dialect ``insert(table)`` with ``on_conflict_do_*`` methods; None if there is none."""
+    factory = _CONFLICT_INSERTS.get(session.get_bind().dialect.name)
+    return factory(table) if factory is not None else None
+
+
+def upsert_increment(
+    session: Session,
+    table: Table,
+    key_columns: Sequence[str],
+    counter: str,
+    rows: Sequence[Dict[str, Any]],
+) -> None:
+    """Add each row's ``counter`` to the stored row with the same key, inserting missing keys.
+
+    SQLite and Postgres run one ``INSERT ... ON CONFLICT DO UPDATE SET counter =
+    counter + excluded.counter`` over all rows, so concurrent writers never
+    lose an increment. Other dialects update first and insert when no row
+    matched.
+    """
+    if not rows:
+        return
+    statement = conflict_insert(session, table)
+    if statement is not None:
+        statement = statement.on_conflict_do_update(
+            index_elements=list(key_columns),
+            set_={counter: table.c[counter] + statement.excluded[counter]},
+        )
+        session.execute(statement, list(rows))
+        return
+    for row in rows:
+        matched = session.execute(
+            update(table)
+            .where(*(table.c[key] == row[key] for key in key_columns))
+            .values({counter: table.c[counter] + row[counter]})
+        ).rowcount
+        if not matched:
+            session.execute(table.insert().values(row))
+
+
+def _install_fts5(connection: Connection, table: str) -> None:
+    fts = f"{table}_fts"
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": fts}
+    ).first()
+    # rowids of tables without an INTEGER PRIMARY KEY can change on VACUUM; after
+    # one, re-sync with INSERT INTO <table>_fts(<table>_fts) VALUES ('rebuild')
+    connection.execute(
+        text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} "
+            f"USING fts5(text, content='{table}', content_rowid='rowid')"
+        )
+    )
+    connection.execute(
+        text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.rowid, new.text); END"
+        )
+    )
+    connection.execute(
+        text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.rowid, old.text); END"
+        )
+    )
+    connection.execute(
+        text(
+            f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF text ON {table} BEGIN "
+            f"INSERT INTO {fts}({fts}, rowid, text) VALUES ('delete', old.rowid, old.text); "
+            f"INSERT INTO {fts}(rowid, text) VALUES (new.rowid, new.text); END"
+        )
+    )
+    if not exists:
+        # index rows written before the FTS table existed
+        connection.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
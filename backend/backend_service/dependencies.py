@@ -1,22 +1,75 @@
-from fastapi import Depends, Request
-from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
+from fastapi import Request
+
+from app.services.embedding_cache import EmbeddingCache
 from backend.backend_service.config import Settings
-from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.http_cache import ResponseCache
+from backend.backend_service.services.membership import MembershipCache
+from backend.backend_service.services.passwords import PasswordHasher
+from backend.backend_service.services.principals import PrincipalCache
+from backend.backend_service.services.store_runner import (
+    AsyncStoreRunner,
+    StoreRunner,
+    ThreadedStoreRunner,
+)
+from backend.backend_service.services.usage import UsageRecorder
+from backend.backend_service.services.versions import VersionCounters
 
 
-def get_session(request: Request):
-    session_factory = request.app.state.session_factory
-    session: Session = session_factory()
-    try:
-        yield session
-    finally:
-        session.close()
+@asynccontextmanager
+async def open_store(state: Any) -> AsyncIterator[StoreRunner]:
+    """A store runner on a fresh session, for requests and background tasks alike."""
+    store_options = dict(
+        vector_index=state.vector_index,
+        vector_encoding=state.settings.vector_encoding,
+        search_executor=state.search_executor,
+        versions=state.versions,
+    )
+    if state.settings.database_async:
+        async with state.async_session_factory() as session:
+            yield AsyncStoreRunner(session, **store_options)
+    else:
+        runner = ThreadedStoreRunner(state.session_factory(), **store_options)
+        try:
+            yield runner
+        finally:
+            await runner.close()
 
 
-def get_store(session: Session = Depends(get_session)) -> DatabaseStore:
-    return DatabaseStore(session)
+async def get_store(request: Request) -> AsyncIterator[StoreRunner]:
+    async with open_store(request.app.state) as store:
+        yield store
 
 
 def get_settings_dep(request: Request) -> Settings:
     return request.app.state.settings
+
+
+def get_embedding_cache(request: Request) -> EmbeddingCache:
+    return request.app.state.embedding_cache
+
+
+def get_principal_cache(request: Request) -> PrincipalCache:
+    return request.app.state.principal_cache
+
+
+def get_password_hasher(request: Request) -> PasswordHasher:
+    return request.app.state.password_hasher
+
+
+def get_usage_recorder(request: Request) -> UsageRecorder:
+    return request.app.state.usage_recorder
+
+
+def get_membership_cache(request: Request) -> MembershipCache:
+    return request.app.state.membership_cache
+
+
+def get_versions(request: Request) -> VersionCounters:
+    return request.app.state.versions
+
+
+def get_response_cache(request: Request) -> ResponseCache:
+    return request.app.state.response_cache
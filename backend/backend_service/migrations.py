@@ -0,0 +1,177 @@
+"""In-place schema upgrades for databases created by older releases.
+
+``prepare_database`` runs them after ``create_all`` when the app starts; each
+one checks the live schema first, so running it against an up-to-date database
+is a no-op. Every step takes a sync ``Connection`` so the async app can run it
+through ``AsyncConnection.run_sync``. They can also be run ahead of a deploy::
+
+    python -m backend.backend_service.migrations --database-url sqlite:///./ai_rooms.db
+"""
+
+from __future__ import annotations
+
+import argparse
+from typing import Any, Iterator, List, Sequence
+
+from sqlalchemy import (
+    JSON,
+    Connection,
+    LargeBinary,
+    Row,
+    bindparam,
+    column,
+    inspect,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.sql.expression import TableClause
+
+from backend.backend_service import models
+from backend.backend_service.database import install_full_text_search
+from backend.backend_service.services.vector_codec import (
+    VECTOR_ENCODINGS,
+    VECTOR_FLOAT32,
+    encode_vector,
+)
+
+
+def prepare_database(connection: Connection, vector_encoding: str = VECTOR_FLOAT32) -> None:
+    """Create missing tables and indexes and apply every upgrade below."""
+    models.Base.metadata.create_all(bind=connection)
+    upgrade_embedding_vectors(connection, vector_encoding)
+    create_missing_indexes(connection)
+    install_full_text_search(connection)
+
+
+def upgrade_embedding_vectors(
+    connection: Connection, encoding: str = VECTOR_FLOAT32, chunk_size: int = 1000
+) -> int:
+    """Convert ``embeddings.vector`` from a JSON float list to a packed binary blob.
+
+    Rows are converted in primary-key order ``chunk_size`` at a time, and the
+    blob column is only made NOT NULL once every row has one. SQLite can
+    neither add a NOT NULL column without a default nor tighten one later, and
+    ``DROP COLUMN`` needs 3.35, so there the table is rebuilt: the old one is
+    renamed aside, the current ``embeddings`` table is created and the rows,
+    rowids included so the FTS5 index stays valid, are copied across.
+    Elsewhere the JSON column is renamed aside, a nullable blob column is
+    added and filled, then set NOT NULL and the JSON column dropped. Returns
+    the number of rows converted.
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table("embeddings"):
+        return 0
+    columns = {info["name"]: info["type"] for info in inspector.get_columns("embeddings")}
+    if isinstance(columns.get("vector"), LargeBinary):
+        return 0
+    if connection.dialect.name == "sqlite":
+        return _rebuild_sqlite_embeddings(connection, list(columns), encoding, chunk_size)
+
+    legacy = table(
+        "embeddings",
+        column("id"),
+        column("vector_json", JSON),
+        column("vector", LargeBinary),
+    )
+    blob_type = LargeBinary().compile(dialect=connection.dialect)
+    connection.execute(text("ALTER TABLE embeddings RENAME COLUMN vector TO vector_json"))
+    connection.execute(text(f"ALTER TABLE embeddings ADD COLUMN vector {blob_type}"))
+    fill = (
+        legacy.update()
+        .where(legacy.c.id == bindparam("row_id"))
+        .values(vector=bindparam("blob"))
+    )
+    converted = 0
+    for rows in _chunks(connection, legacy, [legacy.c.id, legacy.c.vector_json], chunk_size):
+        connection.execute(
+            fill,
+            [{"row_id": row.id, "blob": encode_vector(row.vector_json, encoding)} for row in rows],
+        )
+        converted += len(rows)
+    connection.execute(text("ALTER TABLE embeddings ALTER COLUMN vector SET NOT NULL"))
+    connection.execute(text("ALTER TABLE embeddings DROP COLUMN vector_json"))
+    return converted
+
+
+def _rebuild_sqlite_embeddings(
+    connection: Connection, names: List[str], encoding: str, chunk_size: int
+) -> int:
+    current = models.Embedding.__table__
+    kept = [name for name in names if name in current.c and name != "vector"]
+    had_fts = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings_fts'")
+    ).first()
+    # index names are schema-wide, so the old table's must go before the new one's are created
+    for index in inspect(connection).get_indexes("embeddings"):
+        connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+    connection.execute(text("ALTER TABLE embeddings RENAME TO embeddings_legacy"))
+    current.create(connection)
+
+    # untyped columns pass stored values through as they are; only the vector is decoded
+    legacy = table(
+        "embeddings_legacy",
+        column("rowid"),
+        *(column(name) for name in kept),
+        column("vector", JSON),
+    )
+    target = table("embeddings", column("rowid"), column("vector"), *(column(name) for name in kept))
+    converted = 0
+    for rows in _chunks(connection, legacy, list(legacy.c), chunk_size):
+        connection.execute(
+            target.insert(),
+            [
+                {**row._asdict(), "vector": encode_vector(row.vector, encoding)}
+                for row in rows
+            ],
+        )
+        converted += len(rows)
+    # dropping the old table takes its FTS5 sync triggers with it
+    connection.execute(text("DROP TABLE embeddings_legacy"))
+    if had_fts:
+        install_full_text_search(connection, ["embeddings"])
+    return converted
+
+
+def _chunks(
+    connection: Connection, source: TableClause, columns: List[Any], chunk_size: int
+) -> Iterator[Sequence[Row]]:
+    """Yield ``columns`` of ``source`` in primary-key order, ``chunk_size`` rows at a time."""
+    last_id = None
+    while True:
+        query = select(*columns).order_by(source.c.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(source.c.id > last_id)
+        rows = connection.execute(query).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def create_missing_indexes(connection: Connection) -> None:
+    """Create model indexes that ``create_all`` skips because their table already exists."""
+    for table_ in models.Base.metadata.sorted_tables:
+        for index in table_.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def main() -> None:
+    from sqlalchemy import create_engine
+
+    from backend.backend_service.config import get_settings
+
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Upgrade the backend database schema in place.")
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--encoding", choices=VECTOR_ENCODINGS, default=settings.vector_encoding)
+    args = parser.parse_args()
+
+    with create_engine(args.database_url).begin() as connection:
+        converted = upgrade_embedding_vectors(connection, args.encoding)
+        create_missing_indexes(connection)
+    print(f"converted {converted} embedding vectors to {args.encoding} blobs")
+
+
+if __name__ == "__main__":
+    main()
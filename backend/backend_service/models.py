@@ -3,7 +3,17 @@ from __future__ import annotations
 from datetime import datetime
 from typing import List, Optional
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, JSON, String, Text, UniqueConstraint
+from sqlalchemy import (
+    Boolean,
+    DateTime,
+    ForeignKey,
+    Index,
+    JSON,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+)
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -73,6 +83,8 @@ class RoomMember(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    # serves the newest-first history read and keyset paging in both directions
+    __table_args__ = (Index("ix_messages_room_created_id", "room_id", "created_at", "id"),)
 
     id: Mapped[str] = mapped_column(String, primary_key=True)
     room_id: Mapped[str] = mapped_column(ForeignKey("rooms.id"), index=True)
@@ -89,8 +101,10 @@ class Embedding(Base):
 
     id: Mapped[str] = mapped_column(String, primary_key=True)
     text: Mapped[str] = mapped_column(Text, nullable=False)
-    vector: Mapped[List[float]] = mapped_column(JSON, nullable=False)
-    metadata: Mapped[dict] = mapped_column(JSON, default=dict)
+    # packed float32 or int8, see services/vector_codec.py
+    vector: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    # "metadata" is reserved on declarative classes, so the attribute is renamed
+    metadata_: Mapped[dict] = mapped_column("metadata", JSON, default=dict)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
 
@@ -107,3 +121,19 @@ class Usage(Base):
 
     user_id: Mapped[str] = mapped_column(String, primary_key=True)
     count: Mapped[int] = mapped_column(default=0)
+
+
+class UsageBucket(Base):
+    """Usage per user per minute or hour, written by ``services/usage.py``."""
+
+    __tablename__ = "usage_buckets"
+    # serves the minute-bucket retention delete that runs with every usage flush
+    __table_args__ = (
+        Index("ix_usage_buckets_granularity_start", "granularity", "bucket_start"),
+    )
+
+    user_id: Mapped[str] = mapped_column(String, primary_key=True)
+    # "minute" or "hour"
+    granularity: Mapped[str] = mapped_column(String, primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    count: Mapped[int] = mapped_column(default=0)
@@ -1,28 +1,37 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 
 from backend.backend_service.config import Settings
-from backend.backend_service.dependencies import get_settings_dep, get_store
+from backend.backend_service.dependencies import get_password_hasher, get_settings_dep, get_store
 from backend.backend_service.schemas import TokenResponse, UserCreate, UserLogin
-from backend.backend_service.services.security import (
-    create_access_token,
-    get_current_user,
-    get_password_hash,
-    verify_password,
-)
+from backend.backend_service.services.passwords import PasswordHasher, PasswordHasherBusy
+from backend.backend_service.services.security import create_access_token, get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
 
 router = APIRouter(prefix="/api/v1/auth", tags=["auth"])
 
 
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many sign-ins in progress, retry shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
 @router.post("/signup", response_model=TokenResponse, status_code=status.HTTP_201_CREATED)
-def signup(
+async def signup(
     payload: UserCreate,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     settings: Settings = Depends(get_settings_dep),
+    hasher: PasswordHasher = Depends(get_password_hasher),
 ) -> TokenResponse:
-    hashed_password = get_password_hash(payload.password)
     try:
-        user = store.create_user(payload, hashed_password)
+        hashed_password = await hasher.hash(payload.password)
+    except PasswordHasherBusy:
+        raise _busy()
+    try:
+        user = await store.run(DatabaseStore.create_user, payload, hashed_password)
     except ValueError:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="User already exists")
     token = create_access_token(user.email, settings)
@@ -30,20 +39,30 @@ def signup(
 
 
 @router.post("/login", response_model=TokenResponse)
-def login(
+async def login(
     payload: UserLogin,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     settings: Settings = Depends(get_settings_dep),
+    hasher: PasswordHasher = Depends(get_password_hasher),
 ) -> TokenResponse:
-    user = store.get_user_by_email(payload.email)
-    if not user or not verify_password(payload.password, user.hashed_password):
+    user = await store.run(DatabaseStore.get_user_by_email, payload.email)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    try:
+        valid, new_hash = await hasher.verify_and_update(payload.password, user.hashed_password)
+    except PasswordHasherBusy:
+        raise _busy()
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if new_hash is not None:
+        # stored hash predates the configured cost; the plain password is only here now
+        await store.run(DatabaseStore.update_password_hash, user.id, new_hash)
     token = create_access_token(user.email, settings)
     return TokenResponse(access_token=token)
 
 
 @router.post("/keys")
-def create_api_key(
+async def create_api_key(
     current_user=Depends(get_current_user),
 ) -> dict:
     # Placeholder for API key generation. Use user ID to produce deterministic stub.
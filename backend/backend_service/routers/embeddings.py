@@ -1,32 +1,119 @@
-from fastapi import APIRouter, Depends
+from typing import Literal
 
-from backend.backend_service.dependencies import get_store
-from backend.backend_service.schemas import EmbeddingRequest, EmbeddingResponse, SearchResult
-from backend.backend_service.services.embeddings import deterministic_embedding
+from fastapi import APIRouter, Depends, Response
+
+from app.services.embedding_cache import EmbeddingCache
+from backend.backend_service.config import Settings
+from backend.backend_service.dependencies import (
+    get_embedding_cache,
+    get_settings_dep,
+    get_store,
+    get_usage_recorder,
+)
+from backend.backend_service.schemas import (
+    EmbeddingBatchRequest,
+    EmbeddingBatchResponse,
+    EmbeddingBatchResult,
+    EmbeddingRequest,
+    EmbeddingResponse,
+    SearchResult,
+)
+from backend.backend_service.services.embeddings import embed_texts
 from backend.backend_service.services.security import get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
+from backend.backend_service.services.timing import ServerTiming
+from backend.backend_service.services.usage import UsageRecorder
 
 router = APIRouter(prefix="/api/v1", tags=["embeddings"])
 
 
 @router.post("/embeddings", response_model=EmbeddingResponse, status_code=201)
-def create_embedding(
+async def create_embedding(
     payload: EmbeddingRequest,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
+    cache: EmbeddingCache = Depends(get_embedding_cache),
     current_user=Depends(get_current_user),
+    usage: UsageRecorder = Depends(get_usage_recorder),
 ) -> EmbeddingResponse:
-    vector = deterministic_embedding(payload.text)
-    record = store.create_embedding(payload.text, vector, payload.metadata or {})
-    store.increment_usage(current_user.id)
+    [vector] = await embed_texts(cache, [payload.text])
+    record = await store.run(
+        DatabaseStore.create_embedding, payload.text, vector, payload.metadata or {}
+    )
+    usage.record(current_user.id)
     return EmbeddingResponse(id=record.id)
 
 
+@router.post("/embeddings/batch", response_model=EmbeddingBatchResponse, status_code=201)
+async def create_embeddings_batch(
+    payload: EmbeddingBatchRequest,
+    store: StoreRunner = Depends(get_store),
+    cache: EmbeddingCache = Depends(get_embedding_cache),
+    current_user=Depends(get_current_user),
+    usage: UsageRecorder = Depends(get_usage_recorder),
+) -> EmbeddingBatchResponse:
+    results = []
+    accepted = []
+    for index, item in enumerate(payload.items):
+        result = EmbeddingBatchResult(index=index)
+        results.append(result)
+        if not item.text.strip():
+            result.status = "error"
+            result.error = "text must not be empty"
+        else:
+            accepted.append((result, item))
+
+    vectors = await embed_texts(cache, [item.text for _, item in accepted])
+    ids = await store.run(
+        DatabaseStore.create_embeddings,
+        [(item.text, vector, item.metadata or {}) for (_, item), vector in zip(accepted, vectors)],
+    )
+    for (result, _), record_id in zip(accepted, ids):
+        result.id = record_id
+    if accepted:
+        usage.record(current_user.id, len(accepted))
+    return EmbeddingBatchResponse(results=results)
+
+
 @router.get("/search", response_model=list[SearchResult])
-def search_embeddings(
+async def search_embeddings(
     query: str,
+    response: Response,
     k: int = 8,
-    store: DatabaseStore = Depends(get_store),
+    mode: Literal["vector", "text", "hybrid"] = "vector",
+    store: StoreRunner = Depends(get_store),
+    cache: EmbeddingCache = Depends(get_embedding_cache),
+    settings: Settings = Depends(get_settings_dep),
     current_user=Depends(get_current_user),
+    usage: UsageRecorder = Depends(get_usage_recorder),
 ) -> list[SearchResult]:
-    store.increment_usage(current_user.id)
-    return store.search_embeddings(query, k)
+    usage.record(current_user.id)
+    timing = ServerTiming()
+    if mode == "text":
+        with timing.stage("text"):
+            results = await store.run(DatabaseStore.search_embeddings_text, query, k)
+    else:
+        with timing.stage("embed"):
+            [query_vector] = await embed_texts(cache, [query])
+        if mode == "hybrid":
+            results = await store.run(
+                DatabaseStore.search_embeddings_hybrid,
+                query,
+                query_vector,
+                k,
+                candidates=settings.hybrid_candidates,
+                timing=timing,
+            )
+        else:
+            with timing.stage("vector"):
+                results = await store.run(DatabaseStore.search_embeddings, query_vector, k)
+    response.headers["Server-Timing"] = timing.header()
+    return results
+
+
+@router.get("/embeddings/cache")
+async def embedding_cache_stats(
+    cache: EmbeddingCache = Depends(get_embedding_cache),
+    current_user=Depends(get_current_user),
+) -> dict:
+    return cache.stats()
@@ -1,20 +1,23 @@
 from fastapi import APIRouter, Depends
 
-from backend.backend_service.dependencies import get_store
+from backend.backend_service.dependencies import get_store, get_usage_recorder
 from backend.backend_service.schemas import ModelOverride
 from backend.backend_service.services.security import get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
+from backend.backend_service.services.usage import UsageRecorder
 
 router = APIRouter(prefix="/api/v1/models", tags=["models"])
 
 
 @router.post("/{model_id}/override")
-def override_model(
+async def override_model(
     model_id: str,
     payload: ModelOverride,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    usage: UsageRecorder = Depends(get_usage_recorder),
 ) -> dict:
-    store.override_model(model_id, payload)
-    store.increment_usage(current_user.id)
+    await store.run(DatabaseStore.override_model, model_id, payload)
+    usage.record(current_user.id)
     return {"model_id": model_id, "overridden": True}
@@ -1,83 +1,108 @@
 import uuid
+from typing import Dict
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from pydantic import TypeAdapter
 
-from backend.backend_service.dependencies import get_store
+from backend.backend_service.dependencies import (
+    get_response_cache,
+    get_store,
+    get_usage_recorder,
+    get_versions,
+)
 from backend.backend_service.schemas import ChatRequest, ChatResponse, Nomi, NomiCreate, NomiUpdate
+from backend.backend_service.services.http_cache import ResponseCache, conditional_json
 from backend.backend_service.services.security import get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
+from backend.backend_service.services.usage import UsageRecorder
+from backend.backend_service.services.versions import VersionCounters, user_nomis_key
 
 router = APIRouter(prefix="/api/v1/nomis", tags=["nomis"])
 
+_nomis_adapter = TypeAdapter(list[Nomi])
+
 
 @router.get("/", response_model=list[Nomi])
-def list_nomis(
-    store: DatabaseStore = Depends(get_store),
+async def list_nomis(
+    request: Request,
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
-) -> list[Nomi]:
-    return store.list_nomis(current_user.id)
+    versions: VersionCounters = Depends(get_versions),
+    responses: ResponseCache = Depends(get_response_cache),
+) -> Response:
+    async def produce(headers: Dict[str, str]) -> list[Nomi]:
+        return await store.run(DatabaseStore.list_nomis, current_user.id)
+
+    return await conditional_json(
+        request,
+        versions,
+        responses,
+        user_nomis_key(current_user.id),
+        current_user.id,
+        _nomis_adapter,
+        produce,
+    )
 
 
 @router.post("/", response_model=Nomi, status_code=status.HTTP_201_CREATED)
-def create_nomi(
+async def create_nomi(
     payload: NomiCreate,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
 ) -> Nomi:
-    return store.create_nomi(current_user.id, payload)
+    return await store.run(DatabaseStore.create_nomi, current_user.id, payload)
 
 
 @router.get("/{nomi_id}", response_model=Nomi)
-def get_nomi(
+async def get_nomi(
     nomi_id: str,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
 ) -> Nomi:
-    nomi = store.get_nomi(nomi_id, owner_id=current_user.id)
+    nomi = await store.run(DatabaseStore.get_nomi, nomi_id, owner_id=current_user.id)
     if not nomi:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nomi not found")
     return nomi
 
 
 @router.patch("/{nomi_id}", response_model=Nomi)
-def update_nomi(
+async def update_nomi(
     nomi_id: str,
     payload: NomiUpdate,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
 ) -> Nomi:
-    nomi = store.get_nomi(nomi_id, owner_id=current_user.id)
-    if not nomi:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nomi not found")
-    updated = store.update_nomi(nomi_id, payload)
+    updated = await store.run(
+        DatabaseStore.update_nomi, nomi_id, payload, owner_id=current_user.id
+    )
     if not updated:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nomi not found")
     return updated
 
 
 @router.delete("/{nomi_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_nomi(
+async def delete_nomi(
     nomi_id: str,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
 ) -> None:
-    nomi = store.get_nomi(nomi_id, owner_id=current_user.id)
-    if not nomi:
+    if not await store.run(DatabaseStore.delete_nomi, nomi_id, owner_id=current_user.id):
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nomi not found")
-    store.delete_nomi(nomi_id)
 
 
 @router.post("/{nomi_id}/chat", response_model=ChatResponse)
-def chat_with_nomi(
+async def chat_with_nomi(
     nomi_id: str,
     payload: ChatRequest,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    usage: UsageRecorder = Depends(get_usage_recorder),
 ) -> ChatResponse:
-    nomi = store.get_nomi(nomi_id, owner_id=current_user.id)
+    nomi = await store.run(DatabaseStore.get_nomi, nomi_id, owner_id=current_user.id)
     if not nomi:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Nomi not found")
     fake_reply = f"{nomi.name} says: {payload.message}"
     reply_id = str(uuid.uuid4())
-    store.increment_usage(current_user.id)
+    usage.record(current_user.id)
     return ChatResponse(message_id=reply_id, reply=fake_reply)
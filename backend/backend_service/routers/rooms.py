@@ -1,67 +1,171 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, Optional
 
-from backend.backend_service.dependencies import get_store
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from pydantic import TypeAdapter
+
+from backend.backend_service.dependencies import (
+    get_membership_cache,
+    get_response_cache,
+    get_store,
+    get_usage_recorder,
+    get_versions,
+)
 from backend.backend_service.schemas import Message, MessageCreate, Room, RoomCreate
+from backend.backend_service.services.cursors import decode_cursor, encode_cursor
+from backend.backend_service.services.http_cache import ResponseCache, conditional_json
+from backend.backend_service.services.membership import MembershipCache
 from backend.backend_service.services.security import get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
+from backend.backend_service.services.usage import UsageRecorder
+from backend.backend_service.services.versions import (
+    VersionCounters,
+    room_messages_key,
+    user_rooms_key,
+)
 
 router = APIRouter(prefix="/api/v1/rooms", tags=["rooms"])
 
+_rooms_adapter = TypeAdapter(list[Room])
+_messages_adapter = TypeAdapter(list[Message])
+
+
+async def _require_member(
+    store: StoreRunner, memberships: MembershipCache, room_id: str, user_id: str
+) -> None:
+    """404 unless ``user_id`` belongs to ``room_id`` (a missing room has no members)."""
+    is_member = memberships.get(room_id, user_id)
+    if is_member is None:
+        is_member = await store.run(DatabaseStore.is_member, room_id, user_id)
+        memberships.put(room_id, user_id, is_member)
+    if not is_member:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
+
 
 @router.get("/", response_model=list[Room])
-def list_rooms(
-    store: DatabaseStore = Depends(get_store),
+async def list_rooms(
+    request: Request,
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
-) -> list[Room]:
-    return store.list_rooms(current_user.id)
+    versions: VersionCounters = Depends(get_versions),
+    responses: ResponseCache = Depends(get_response_cache),
+) -> Response:
+    async def produce(headers: Dict[str, str]) -> list[Room]:
+        return await store.run(DatabaseStore.list_rooms, current_user.id)
+
+    return await conditional_json(
+        request,
+        versions,
+        responses,
+        user_rooms_key(current_user.id),
+        current_user.id,
+        _rooms_adapter,
+        produce,
+    )
 
 
 @router.post("/", response_model=Room, status_code=status.HTTP_201_CREATED)
-def create_room(
+async def create_room(
     payload: RoomCreate,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
 ) -> Room:
-    return store.create_room(current_user.id, payload)
+    return await store.run(DatabaseStore.create_room, current_user.id, payload)
 
 
 @router.post("/{room_id}/join", response_model=Room)
-def join_room(
+async def join_room(
     room_id: str,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    memberships: MembershipCache = Depends(get_membership_cache),
 ) -> Room:
-    room = store.join_room(room_id, current_user.id)
+    room = await store.run(DatabaseStore.join_room, room_id, current_user.id)
     if not room:
+        memberships.invalidate(room_id, current_user.id)
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
+    # replaces a cached "not a member" left by an earlier probe
+    memberships.put(room_id, current_user.id, True)
     return room
 
 
 @router.get("/{room_id}/messages", response_model=list[Message])
-def get_room_messages(
+async def get_room_messages(
     room_id: str,
-    limit: int = 50,
-    store: DatabaseStore = Depends(get_store),
+    request: Request,
+    limit: int = Query(50, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    memberships: MembershipCache = Depends(get_membership_cache),
+    versions: VersionCounters = Depends(get_versions),
+    responses: ResponseCache = Depends(get_response_cache),
+) -> Response:
+    """Page through history with opaque cursors.
+
+    A full page sets ``X-Next-Cursor``; pass it back as ``before`` to keep
+    scrolling back, or as ``after`` when the page was requested with ``after``.
+    Pages carry an ``ETag`` tied to the room's message version, so a poll
+    with ``If-None-Match`` gets ``304`` until someone posts.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Use either before or after"
+        )
+    try:
+        before_key = decode_cursor(before) if before is not None else None
+        after_key = decode_cursor(after) if after is not None else None
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    await _require_member(store, memberships, room_id, current_user.id)
+
+    async def produce(headers: Dict[str, str]) -> list[Message]:
+        messages = await store.run(
+            DatabaseStore.list_messages, room_id, limit, before=before_key, after=after_key
+        )
+        if len(messages) == limit:
+            edge = messages[-1] if after_key is not None else messages[0]
+            headers["X-Next-Cursor"] = encode_cursor(edge.created_at, edge.id)
+        return messages
+
+    # every member sees the same page, so the cached body is shared per room
+    return await conditional_json(
+        request,
+        versions,
+        responses,
+        room_messages_key(room_id),
+        "room",
+        _messages_adapter,
+        produce,
+    )
+
+
+@router.get("/{room_id}/messages/search", response_model=list[Message])
+async def search_room_messages(
+    room_id: str,
+    q: str,
+    limit: int = 20,
+    store: StoreRunner = Depends(get_store),
+    current_user=Depends(get_current_user),
+    memberships: MembershipCache = Depends(get_membership_cache),
 ) -> list[Message]:
-    room = store.get_room(room_id)
-    if not room or current_user.id not in room.members:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
-    return store.list_messages(room_id, limit)
+    await _require_member(store, memberships, room_id, current_user.id)
+    return await store.run(DatabaseStore.search_messages, room_id, q, limit)
 
 
 @router.post("/{room_id}/messages", response_model=Message, status_code=status.HTTP_201_CREATED)
-def send_message(
+async def send_message(
     room_id: str,
     payload: MessageCreate,
-    store: DatabaseStore = Depends(get_store),
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    memberships: MembershipCache = Depends(get_membership_cache),
+    usage: UsageRecorder = Depends(get_usage_recorder),
 ) -> Message:
-    room = store.get_room(room_id)
-    if not room or current_user.id not in room.members:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
-    message = store.add_message(room_id, current_user.id, payload)
+    await _require_member(store, memberships, room_id, current_user.id)
+    message = await store.run(DatabaseStore.add_message, room_id, current_user.id, payload)
     if not message:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Room not found")
-    store.increment_usage(current_user.id)
+    usage.record(current_user.id)
     return message
@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Literal, Optional
 
-from backend.backend_service.dependencies import get_store
-from backend.backend_service.schemas import UsageResponse
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+
+from backend.backend_service.dependencies import get_store, get_usage_recorder
+from backend.backend_service.schemas import UsageBucketCount, UsageResponse
 from backend.backend_service.services.security import get_current_user
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
+from backend.backend_service.services.usage import UsageRecorder
 
 router = APIRouter(tags=["system"])
 
@@ -18,6 +25,13 @@ async def health_check() -> dict:
     return {"status": "healthy"}
 
 
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request) -> str:
+    # Prometheus text exposition; scraped by monitoring/prometheus.yml
+    state = request.app.state
+    return state.pool_metrics.render() + state.password_hasher.render()
+
+
 @router.get("/models")
 async def get_models() -> dict:
     return {"models": ["gpt-3.5", "local-model"]}
@@ -29,9 +43,40 @@ async def chat(message: str) -> dict:
 
 
 @router.get("/api/v1/usage", response_model=UsageResponse)
-def get_usage(
-    store: DatabaseStore = Depends(get_store),
+async def get_usage(
+    granularity: Optional[Literal["minute", "hour"]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    store: StoreRunner = Depends(get_store),
     current_user=Depends(get_current_user),
+    recorder: UsageRecorder = Depends(get_usage_recorder),
 ) -> UsageResponse:
-    usage = store.get_usage(current_user.id)
-    return UsageResponse(usage=usage)
+    # stored counts plus what this process has not flushed yet
+    usage = await store.run(DatabaseStore.get_usage, current_user.id)
+    usage[current_user.id] += recorder.pending_for(current_user.id)
+    if granularity is None:
+        return UsageResponse(usage=usage)
+
+    until = _naive_utc(until) if until else datetime.utcnow()
+    since = _naive_utc(since) if since else until - _DEFAULT_RANGE[granularity]
+    if since > until:
+        raise HTTPException(status_code=400, detail="since must not be after until")
+    counts = Counter(
+        await store.run(DatabaseStore.get_usage_buckets, current_user.id, granularity, since, until)
+    )
+    for start, amount in recorder.pending_buckets_for(current_user.id, granularity).items():
+        if since <= start <= until:
+            counts[start] += amount
+    buckets = [UsageBucketCount(start=start, count=counts[start]) for start in sorted(counts)]
+    return UsageResponse(usage=usage, granularity=granularity, buckets=buckets)
+
+
+# range returned when ``since`` is omitted: the last 60 buckets
+_DEFAULT_RANGE = {"minute": timedelta(minutes=60), "hour": timedelta(hours=60)}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # buckets are stored as naive UTC, like every other timestamp here
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -117,10 +117,27 @@ class EmbeddingResponse(BaseModel):
     status: str = "created"
 
 
+class EmbeddingBatchRequest(BaseModel):
+    items: List[EmbeddingRequest] = Field(min_length=1, max_length=10_000)
+
+
+class EmbeddingBatchResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: str = "created"
+    error: Optional[str] = None
+
+
+class EmbeddingBatchResponse(BaseModel):
+    results: List[EmbeddingBatchResult]
+
+
 class SearchResult(BaseModel):
     id: str
     text: str
     score: float
+    vector_score: Optional[float] = None
+    text_score: Optional[float] = None
     metadata: Dict[str, str] = Field(default_factory=dict)
 
 
@@ -129,5 +146,13 @@ class ModelOverride(BaseModel):
     config: Optional[Dict[str, str]] = None
 
 
+class UsageBucketCount(BaseModel):
+    start: datetime
+    count: int
+
+
 class UsageResponse(BaseModel):
     usage: Dict[str, int] = Field(default_factory=dict)
+    # filled when /api/v1/usage is asked for a granularity and time range
+    granularity: Optional[str] = None
+    buckets: List[UsageBucketCount] = Field(default_factory=list)
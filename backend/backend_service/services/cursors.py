@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import base64
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_cursor(created_at: datetime, record_id: str) -> str:
+    """Opaque keyset cursor for a row ordered by ``(created_at, id)``."""
+    raw = f"{created_at.isoformat()}|{record_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Inverse of ``encode_cursor``; raises ``ValueError`` for anything it did not produce."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, record_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), record_id
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("invalid cursor") from exc
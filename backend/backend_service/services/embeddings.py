@@ -2,7 +2,13 @@ from __future__ import annotations
 
 import hashlib
 import struct
-from typing import List
+from typing import List, Sequence
+
+from starlette.concurrency import run_in_threadpool
+
+from app.services.embedding_cache import EmbeddingCache
+
+DETERMINISTIC_MODEL = "sha256-hash-v1"
 
 
 def deterministic_embedding(text: str) -> List[float]:
@@ -10,3 +16,20 @@ def deterministic_embedding(text: str) -> List[float]:
     parts = struct.unpack("!8I", digest[:32])
     scale = float(2**32)
     return [round(value / scale, 6) for value in parts]
+
+
+def deterministic_embeddings(texts: Sequence[str]) -> List[List[float]]:
+    return [deterministic_embedding(text) for text in texts]
+
+
+async def embed_texts(cache: EmbeddingCache, texts: Sequence[str]) -> List[List[float]]:
+    """Embed ``texts`` through ``cache``, computing the misses in one threadpool call.
+
+    Neither the computation nor waiting on another request's in-flight
+    computation blocks the event loop.
+    """
+    return await cache.get_or_compute_many(
+        DETERMINISTIC_MODEL,
+        texts,
+        lambda missing: run_in_threadpool(deterministic_embeddings, missing),
+    )
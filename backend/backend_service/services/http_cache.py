@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from backend.backend_service.services.versions import VersionCounters
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    headers: Dict[str, str]
+    etag: str
+    expires_at: float
+
+
+class ResponseCache:
+    """Bounded LRU/TTL of serialized JSON bodies keyed on ``(scope, route, version)``.
+
+    A local write bumps the version, so this process never serves a body
+    older than its own writes. Writes made through another replica are
+    invisible to the version counters; ``ttl_seconds`` bounds how long a
+    body (and the ``304`` answers it backs) can miss them.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_bytes = max_bytes
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at <= self._clock():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: Hashable, body: bytes, headers: Dict[str, str]) -> CachedBody:
+        """Cache ``body`` and return it with its ETag, a digest of the body and ``headers``."""
+        entry = CachedBody(body, headers, _etag(body, headers), self._clock() + self._ttl)
+        if len(body) > self._max_bytes or self._ttl <= 0:
+            return entry
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while self._bytes > self._max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.body)
+
+
+async def conditional_json(
+    request: Request,
+    versions: VersionCounters,
+    responses: ResponseCache,
+    version_key: Hashable,
+    scope: str,
+    adapter: TypeAdapter,
+    produce: Callable[[Dict[str, str]], Awaitable[Any]],
+) -> Response:
+    """Serve a JSON read from ``responses`` or by calling ``produce``, as ``304`` when unchanged.
+
+    ``produce(headers)`` runs the query and may add response headers; its
+    result is serialized with ``adapter`` and cached under the version read
+    before it ran, so a body is never filed under a newer version than the
+    data it holds. The ETag is a digest of the response, so an unchanged page
+    still earns a ``304`` after its cache entry expires, on any replica.
+    """
+    cache_key = (scope, request.url.path, request.url.query, version_key, versions.get(version_key))
+    entry = responses.get(cache_key)
+    if entry is None:
+        headers: Dict[str, str] = {}
+        body = adapter.dump_json(await produce(headers))
+        entry = responses.put(cache_key, body, headers)
+    if entry.etag in _if_none_match(request):
+        return Response(status_code=304, headers={"ETag": entry.etag})
+    return Response(
+        content=entry.body,
+        media_type="application/json",
+        headers={**entry.headers, "ETag": entry.etag},
+    )
+
+
+def _etag(body: bytes, headers: Dict[str, str]) -> str:
+    digest = hashlib.blake2b(body, digest_size=12)
+    # headers such as X-Next-Cursor are part of the representation too
+    for name, value in sorted(headers.items()):
+        digest.update(f"\n{name}: {value}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def _if_none_match(request: Request) -> set:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return set()
+    return {tag.strip() for tag in header.split(",")}
@@ -0,0 +1,422 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.backend_service.services.vector_index import RowsSince, VectorIndex, _normalized
+
+# rows stamped just before a save may commit just after it, so a reload
+# re-reads this much of the table before the save and skips ids it already has
+RELOAD_OVERLAP = timedelta(minutes=5)
+
+_META = "meta.json"
+_CENTROIDS = "centroids.npy"
+_VECTORS = "vectors.npy"
+_OFFSETS = "offsets.npy"
+_IDS = "ids.npy"
+
+
+@dataclass(frozen=True)
+class _InvertedLists:
+    """Vectors grouped by nearest centroid; list ``i`` is ``vectors[offsets[i]:offsets[i + 1]]``."""
+
+    centroids: np.ndarray
+    vectors: np.ndarray
+    offsets: np.ndarray
+    ids: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+
+class IVFIndex:
+    """Approximate cosine top-k search over an inverted-file (IVF) index.
+
+    Vectors are clustered with spherical k-means into ``n_lists`` lists. A
+    query is scored against the centroids and only the ``nprobe`` closest
+    lists are scanned, so raising ``nprobe`` trades speed for recall; with
+    ``nprobe == n_lists`` the search is exact. ``n_lists`` of ``0`` picks
+    about ``sqrt(N)`` lists when the index is trained.
+
+    New vectors go to an exact ``VectorIndex`` delta that is searched
+    alongside the lists. Until ``min_train_size`` vectors exist everything
+    lives in the delta; after that the delta is merged into the lists once
+    it grows past ``merge_fraction`` of them, reusing the trained centroids.
+    A merge runs on a background thread: the delta is set aside (and still
+    searched) while new rows go to a fresh one, and the rebuilt lists are
+    swapped in once they are complete, so inserts never wait for k-means,
+    the re-sort or the save.
+
+    With a ``path`` the lists are saved after every merge and reopened with
+    ``numpy.load(mmap_mode="r")``, so a restart only reads rows newer than
+    the last save from the database. ``path`` is a symlink to the current
+    save, replaced atomically, so several processes can share it. Ids are
+    expected to be unique: the store never re-adds an existing id, so only
+    the rows a reload re-reads from the overlap window are checked against
+    the lists, once, in ``load``.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        n_lists: int = 0,
+        nprobe: int = 8,
+        min_train_size: int = 4096,
+        merge_fraction: float = 0.1,
+        kmeans_iterations: int = 10,
+        seed: int = 0,
+    ) -> None:
+        self.path = path
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self._min_train_size = max(1, min_train_size)
+        self._merge_fraction = merge_fraction
+        self._kmeans_iterations = kmeans_iterations
+        self._rng = np.random.default_rng(seed)
+        self._lists: Optional[_InvertedLists] = None
+        self._delta = VectorIndex()
+        # the delta being merged into the lists, searched until they land
+        self._merging: Optional[VectorIndex] = None
+        self._merger: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def __len__(self) -> int:
+        with self._lock:
+            lists, merging, delta = self._lists, self._merging, self._delta
+        return (
+            (len(lists) if lists is not None else 0)
+            + (len(merging) if merging is not None else 0)
+            + len(delta)
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def trained(self) -> bool:
+        return self._lists is not None
+
+    def load_since(self) -> Optional[datetime]:
+        """Where ``load`` expects its rows to start: just before the last save, if any."""
+        saved_at = self._saved_at() if self.path else None
+        return saved_at - RELOAD_OVERLAP if saved_at is not None else None
+
+    def ensure_loaded(self, rows: RowsSince) -> None:
+        """Open the saved lists if there are any, then read the newer rows from ``rows(since)``."""
+        if not self._loaded:
+            self.load(rows(self.load_since()))
+
+    def load(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        """Open the saved lists and add ``items`` (rows from ``load_since()``), unless already loaded.
+
+        As in ``VectorIndex.load``, the lists are opened and the rows indexed
+        without holding the lock; it is only taken to swap them in. Until
+        then, an index with a ``path`` does not merge, so the saved lists
+        cannot change under a load.
+        """
+        if self._loaded:
+            return
+        saved = self._open() if self.path else None
+        base = saved[0] if saved is not None else self._lists
+        built = VectorIndex()
+        built.add_many(_unseen(items, base))
+        with self._lock:
+            if self._loaded:
+                return
+            if (self._lists is not None and self._lists is not base) or self._merging is not None:
+                # rows added before the first load were merged, or are being
+                # merged, meanwhile (no path)
+                matrix, ids = built.snapshot()
+                rows = _unseen(zip(ids, matrix), self._lists)
+                if self._merging is not None:
+                    merging_ids = set(self._merging.snapshot()[1])
+                    rows = [row for row in rows if row[0] not in merging_ids]
+                built = VectorIndex()
+                built.add_many(rows)
+            elif base is not None:
+                self._lists = base
+            # rows added while loading
+            matrix, ids = self._delta.snapshot()
+            built.add_many(zip(ids, matrix))
+            self._delta = built
+            self._loaded = True
+            self._maybe_merge()
+
+    def add(self, record_id: str, vector: Sequence[float]) -> None:
+        self.add_many([(record_id, vector)])
+
+    def add_many(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        with self._lock:
+            self._add_rows(items)
+
+    def flush(self) -> None:
+        """Merge pending vectors into the lists and save them, if the index is trained.
+
+        Waits for a background merge to land first; the final merge runs on
+        the calling thread.
+        """
+        while True:
+            self.wait_for_merge()
+            with self._lock:
+                if self._merging is not None:
+                    continue
+                if self._lists is None or not len(self._delta):
+                    return
+                lists, pending = self._begin_merge()
+            self._finish_merge(lists, pending)
+            return
+
+    def wait_for_merge(self) -> None:
+        """Block until no background merge is running."""
+        # a merge that lands may start the next one, so look again after each
+        while (merger := self._merger) is not None and merger.is_alive():
+            merger.join()
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(id, cosine similarity)`` pairs, best first."""
+        with self._lock:
+            lists, merging, delta = self._lists, self._merging, self._delta
+        hits = delta.search(query, k)
+        if merging is not None:
+            hits.extend(merging.search(query, k))
+        if lists is None or k <= 0 or len(lists) == 0:
+            hits.sort(key=lambda hit: hit[1], reverse=True)
+            return hits[:k]
+        vector = _normalized(query, lists.vectors.shape[1])
+        nprobe = min(max(1, self.nprobe), len(lists.centroids))
+        centroid_scores = lists.centroids @ vector
+        probe = np.argpartition(centroid_scores, len(centroid_scores) - nprobe)[-nprobe:]
+        scores, positions = [], []
+        for list_no in probe:
+            start, end = int(lists.offsets[list_no]), int(lists.offsets[list_no + 1])
+            if start < end:
+                scores.append(lists.vectors[start:end] @ vector)
+                positions.append(np.arange(start, end))
+        if scores:
+            candidate_scores = np.concatenate(scores)
+            candidates = np.concatenate(positions)
+            if k < len(candidates):
+                top = np.argpartition(candidate_scores, len(candidates) - k)[-k:]
+            else:
+                top = np.arange(len(candidates))
+            hits.extend(
+                (str(lists.ids[candidates[i]]), float(candidate_scores[i])) for i in top
+            )
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:k]
+
+    # Building ---------------------------------------------------------------
+    def _add_rows(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        # no check against the lists: that would sort every stored id under the lock
+        self._delta.add_many(items)
+        self._maybe_merge()
+
+    def _maybe_merge(self) -> None:
+        if self._merging is not None:
+            # one merge at a time; the next check runs when it lands
+            return
+        if self.path and not self._loaded:
+            # merging would save over lists that ``load`` has yet to open
+            return
+        lists = self._lists
+        if lists is None:
+            due = len(self._delta) >= self._min_train_size
+        else:
+            due = len(self._delta) > self._merge_fraction * len(lists)
+        if due:
+            merger = threading.Thread(
+                target=self._finish_merge, args=self._begin_merge(), name="ivf-merge", daemon=True
+            )
+            self._merger = merger
+            merger.start()
+
+    def _begin_merge(self) -> Tuple[Optional[_InvertedLists], VectorIndex]:
+        """Set the delta aside for merging; called under the lock."""
+        pending, self._delta = self._delta, VectorIndex()
+        self._merging = pending
+        return self._lists, pending
+
+    def _finish_merge(self, lists: Optional[_InvertedLists], pending: VectorIndex) -> None:
+        """Build (and save) the merged lists without the lock, then swap them in."""
+        try:
+            merged = self._merged(lists, pending)
+        except BaseException:
+            with self._lock:
+                # put the rows back in front of those added meanwhile
+                restored = VectorIndex()
+                for rows in (pending, self._delta):
+                    matrix, ids = rows.snapshot()
+                    restored.add_many(zip(ids, matrix))
+                self._delta = restored
+                self._merging = None
+            raise
+        with self._lock:
+            self._lists = merged
+            self._merging = None
+            self._maybe_merge()
+
+    def _merged(self, lists: Optional[_InvertedLists], pending: VectorIndex) -> _InvertedLists:
+        new_vectors, delta_ids = pending.snapshot()
+        new_ids = np.asarray(delta_ids)
+        size = len(new_ids)
+        if lists is None:
+            n_lists = self.n_lists or max(1, int(math.sqrt(size)))
+            centroids = _train(new_vectors, min(n_lists, size), self._kmeans_iterations, self._rng)
+            vectors, ids = new_vectors, new_ids
+            assignments = _assign(vectors, centroids)
+        else:
+            centroids = lists.centroids
+            # existing rows keep their lists; only the new rows are assigned
+            old_assignments = np.repeat(np.arange(len(centroids)), np.diff(lists.offsets))
+            vectors = np.concatenate([np.asarray(lists.vectors), new_vectors])
+            ids = np.concatenate([np.asarray(lists.ids), new_ids])
+            assignments = np.concatenate([old_assignments, _assign(new_vectors, centroids)])
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(centroids))
+        merged = _InvertedLists(
+            centroids=centroids,
+            vectors=np.ascontiguousarray(vectors[order]),
+            offsets=np.concatenate([[0], np.cumsum(counts)]).astype(np.int64),
+            ids=ids[order],
+        )
+        if not self.path:
+            return merged
+        self._save(merged)
+        # reopen from disk so the lists are served from the page cache
+        reopened = self._open()
+        return reopened[0] if reopened is not None else merged
+
+    # Persistence ------------------------------------------------------------
+    def _save(self, lists: _InvertedLists) -> None:
+        """Write ``lists`` to a new directory beside ``path`` and repoint ``path`` at it.
+
+        Each save gets its own directory, so processes sharing ``path`` never
+        write into one another's files. ``path`` is a symlink replaced with an
+        atomic rename: readers see the previous save or this one, never a
+        mix. The swap and the removal of the directory it replaced run under
+        a lock file, so concurrent savers do not remove each other's saves.
+        """
+        assert self.path is not None
+        parent, name = os.path.split(os.path.abspath(self.path))
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=f"{name}.", dir=parent)
+        link = f"{staging}.link"
+        try:
+            np.save(os.path.join(staging, _CENTROIDS), lists.centroids)
+            np.save(os.path.join(staging, _VECTORS), lists.vectors)
+            np.save(os.path.join(staging, _OFFSETS), lists.offsets)
+            np.save(os.path.join(staging, _IDS), lists.ids)
+            with open(os.path.join(staging, _META), "w") as handle:
+                json.dump({"saved_at": datetime.utcnow().isoformat(), "count": len(lists)}, handle)
+            os.symlink(os.path.basename(staging), link)
+            with _locked(f"{self.path}.lock"):
+                previous = None
+                if os.path.islink(self.path):
+                    previous = os.path.join(parent, os.readlink(self.path))
+                elif os.path.isdir(self.path):
+                    # a save from before ``path`` became a symlink
+                    previous = tempfile.mkdtemp(prefix=f"{name}.", dir=parent)
+                    os.replace(self.path, previous)
+                os.replace(link, self.path)
+                if previous is not None:
+                    shutil.rmtree(previous, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            if os.path.lexists(link):
+                os.remove(link)
+            raise
+
+    def _saved_at(self, directory: Optional[str] = None) -> Optional[datetime]:
+        assert self.path is not None
+        meta_path = os.path.join(directory or self.path, _META)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as handle:
+            return datetime.fromisoformat(json.load(handle)["saved_at"])
+
+    def _open(self) -> Optional[Tuple[_InvertedLists, datetime]]:
+        assert self.path is not None
+        for _ in range(3):
+            # resolve once, so every file comes from the same save
+            directory = os.path.realpath(self.path)
+            try:
+                saved_at = self._saved_at(directory)
+                if saved_at is None:
+                    return None
+                lists = _InvertedLists(
+                    centroids=np.load(os.path.join(directory, _CENTROIDS)),
+                    vectors=np.load(os.path.join(directory, _VECTORS), mmap_mode="r"),
+                    offsets=np.load(os.path.join(directory, _OFFSETS)),
+                    ids=np.load(os.path.join(directory, _IDS), mmap_mode="r"),
+                )
+            except FileNotFoundError:
+                # another process saved and removed this directory meanwhile
+                continue
+            return lists, saved_at
+        return None
+
+
+@contextmanager
+def _locked(lock_path: str) -> Iterator[None]:
+    with open(lock_path, "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _unseen(
+    items: Iterable[Tuple[str, Sequence[float]]], lists: Optional[_InvertedLists]
+) -> Iterable[Tuple[str, Sequence[float]]]:
+    """Drop the items whose ids ``lists`` already holds (one ``isin`` over all its ids)."""
+    if lists is None:
+        return items
+    pending = list(items)
+    if not pending:
+        return pending
+    known = np.isin([record_id for record_id, _ in pending], lists.ids)
+    return [item for item, seen in zip(pending, known) if not seen]
+
+
+def _train(
+    vectors: np.ndarray, n_lists: int, iterations: int, rng: np.random.Generator
+) -> np.ndarray:
+    """Spherical k-means on a sample of at most 256 points per list."""
+    sample_size = min(len(vectors), 256 * n_lists)
+    sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _assign(sample, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        starts = np.cumsum(counts) - counts
+        empty = counts == 0
+        sums = np.zeros_like(centroids)
+        sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+        # re-seed empty lists from random points rather than leaving them dead
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = sums / np.where(norms == 0, 1, norms)
+    return centroids.astype(np.float32)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray, chunk: int = 16384) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk):
+        block = vectors[start : start + chunk]
+        assignments[start : start + chunk] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
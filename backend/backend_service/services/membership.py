@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+MemberKey = Tuple[str, str]
+
+
+class MembershipCache:
+    """Bounded LRU/TTL cache of ``(room_id, user_id) -> is member``.
+
+    Members are cached for ``ttl_seconds``; non-members only for
+    ``negative_ttl_seconds``, because a join served by another process
+    cannot invalidate this one. The join route overwrites its entry; any
+    leave/kick path must call ``invalidate``.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 50_000,
+        ttl_seconds: float = 60.0,
+        negative_ttl_seconds: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._negative_ttl = min(negative_ttl_seconds, ttl_seconds)
+        self._clock = clock
+        self._entries: "OrderedDict[MemberKey, Tuple[bool, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, room_id: str, user_id: str) -> Optional[bool]:
+        key = (room_id, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= self._clock():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, room_id: str, user_id: str, is_member: bool) -> None:
+        ttl = self._ttl if is_member else self._negative_ttl
+        with self._lock:
+            if self._max_entries <= 0:
+                return
+            self._entries[(room_id, user_id)] = (is_member, self._clock() + ttl)
+            self._entries.move_to_end((room_id, user_id))
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, room_id: str, user_id: str) -> None:
+        with self._lock:
+            self._entries.pop((room_id, user_id), None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, TypeVar
+
+from passlib.context import CryptContext
+
+T = TypeVar("T")
+
+# queue wait buckets in seconds, from an idle executor to a saturated one
+QUEUE_BUCKETS = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised instead of queueing when ``max_pending`` hashes are already admitted."""
+
+
+class PasswordHasher:
+    """bcrypt on its own bounded executor, away from Starlette's shared threadpool.
+
+    At most ``threads`` hashes run at once (bcrypt releases the GIL, so they
+    run in parallel) and at most ``max_pending`` are admitted, running or
+    queued; past that, callers get ``PasswordHasherBusy`` straight away rather
+    than waiting behind a login spike. The time each job spends queued is
+    recorded for ``render()``.
+    """
+
+    def __init__(self, rounds: int = 12, threads: int = 2, max_pending: int = 32) -> None:
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=rounds)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="bcrypt")
+        self._max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._bucket_counts = [0] * len(QUEUE_BUCKETS)
+        self.completed = 0
+        self.rejected = 0
+        self.queue_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check ``password``; on success also return a new hash if ``hashed`` used another cost."""
+        return await self._submit(self.context.verify_and_update, password, hashed)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def render(self, prefix: str = "ai_rooms_password_hash") -> str:
+        with self._lock:
+            pending, completed = self._pending, self.completed
+            rejected, total = self.rejected, self.queue_seconds
+            buckets = list(self._bucket_counts)
+        lines: List[str] = [
+            f"# HELP {prefix}_pending Hash jobs admitted and not yet finished.",
+            f"# TYPE {prefix}_pending gauge",
+            f"{prefix}_pending {pending}",
+            f"# HELP {prefix}_rejected_total Hash jobs refused because the queue was full.",
+            f"# TYPE {prefix}_rejected_total counter",
+            f"{prefix}_rejected_total {rejected}",
+            f"# HELP {prefix}_queue_seconds Time a hash job waited for a bcrypt thread.",
+            f"# TYPE {prefix}_queue_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(QUEUE_BUCKETS, buckets):
+            cumulative += count
+            lines.append(f'{prefix}_queue_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{prefix}_queue_seconds_bucket{{le="+Inf"}} {completed}')
+        lines.append(f"{prefix}_queue_seconds_sum {total}")
+        lines.append(f"{prefix}_queue_seconds_count {completed}")
+        return "\n".join(lines) + "\n"
+
+    async def _submit(self, fn: Callable[..., T], *args: object) -> T:
+        with self._lock:
+            if self._pending >= self._max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy("password hashing queue is full")
+            self._pending += 1
+        queued_at = time.perf_counter()
+
+        def job() -> T:
+            self._observe_queue(time.perf_counter() - queued_at)
+            return fn(*args)
+
+        future = self._executor.submit(job)
+        # released when the job finishes, not when the caller stops waiting: a
+        # cancelled request leaves a running hash behind that still holds a slot
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _observe_queue(self, seconds: float) -> None:
+        with self._lock:
+            self.completed += 1
+            self.queue_seconds += seconds
+            for index, bound in enumerate(QUEUE_BUCKETS):
+                if seconds <= bound:
+                    self._bucket_counts[index] += 1
+                    break
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+from sqlalchemy import Engine, event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# checkout wait buckets in seconds; the last one matches the default pool timeout
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class _TimedCheckout:
+    """Times ``Pool.connect()``: what a caller waits, pool queue included, for a connection."""
+
+    checkout_observer: Optional[Callable[[float, bool], None]] = None
+
+    def connect(self) -> Any:
+        start = time.perf_counter()
+        try:
+            connection = super().connect()  # type: ignore[misc]
+        except exc.TimeoutError:
+            self._observe(time.perf_counter() - start, True)
+            raise
+        self._observe(time.perf_counter() - start, False)
+        return connection
+
+    def recreate(self) -> Any:
+        # engine.dispose() swaps in a fresh pool; listeners carry over, this must too
+        pool = super().recreate()  # type: ignore[misc]
+        pool.checkout_observer = self.checkout_observer
+        return pool
+
+    def _observe(self, seconds: float, timed_out: bool) -> None:
+        if self.checkout_observer is not None:
+            self.checkout_observer(seconds, timed_out)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class PoolMetrics:
+    """Connection-pool pressure for one engine, rendered in the Prometheus text format.
+
+    Checkout wait comes from ``TimedQueuePool``; connects and invalidations
+    are counted from pool events; in-use and overflow are read from the
+    engine's current pool when scraped. Pools without a queue (``StaticPool``)
+    only report counters. Pass ``AsyncEngine.sync_engine`` for async engines.
+    """
+
+    def __init__(self, engine: Engine) -> None:
+        self._lock = threading.Lock()
+        self._bucket_counts = [0] * len(CHECKOUT_BUCKETS)
+        self.checkout_count = 0
+        self.checkout_seconds = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self._engine = engine
+        pool = engine.pool
+        if isinstance(pool, _TimedCheckout):
+            pool.checkout_observer = self.observe_checkout
+        event.listen(pool, "connect", self._on_connect)
+        event.listen(pool, "invalidate", self._on_invalidate)
+
+    def observe_checkout(self, seconds: float, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkout_count += 1
+            self.checkout_seconds += seconds
+            position = bisect.bisect_left(CHECKOUT_BUCKETS, seconds)
+            if position < len(self._bucket_counts):
+                self._bucket_counts[position] += 1
+
+    def snapshot(self) -> dict:
+        pool = self._engine.pool
+        queued = isinstance(pool, QueuePool)
+        with self._lock:
+            return {
+                "size": pool.size() if queued else None,
+                "in_use": pool.checkedout() if queued else None,
+                "overflow": max(0, pool.overflow()) if queued else None,
+                "checkouts": self.checkout_count,
+                "checkout_seconds": self.checkout_seconds,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "buckets": list(self._bucket_counts),
+            }
+
+    def render(self, prefix: str = "ai_rooms_db_pool") -> str:
+        stats = self.snapshot()
+        lines: List[str] = []
+
+        def metric(name: str, kind: str, help_text: str, value: Optional[float]) -> None:
+            if value is None:
+                return
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            lines.append(f"{prefix}_{name} {value}")
+
+        metric("size", "gauge", "Configured persistent connections.", stats["size"])
+        metric("in_use", "gauge", "Connections checked out right now.", stats["in_use"])
+        metric("overflow", "gauge", "Connections open beyond pool_size.", stats["overflow"])
+        metric("timeouts_total", "counter", "Checkouts that hit pool_timeout.", stats["timeouts"])
+        metric("connects_total", "counter", "New DBAPI connections opened.", stats["connects"])
+        metric(
+            "invalidations_total", "counter", "Connections invalidated.", stats["invalidations"]
+        )
+
+        name = f"{prefix}_checkout_seconds"
+        lines.append(f"# HELP {name} Time spent waiting for a pooled connection.")
+        lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, count in zip(CHECKOUT_BUCKETS, stats["buckets"]):
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{le="+Inf"}} {stats["checkouts"]}')
+        lines.append(f"{name}_sum {stats['checkout_seconds']}")
+        lines.append(f"{name}_count {stats['checkouts']}")
+        return "\n".join(lines) + "\n"
+
+    def _on_connect(self, dbapi_connection: Any, connection_record: Any) -> None:
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, dbapi_connection: Any, connection_record: Any, exception: Any) -> None:
+        with self._lock:
+            self.invalidations += 1
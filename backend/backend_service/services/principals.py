@@ -0,0 +1,150 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from backend.backend_service import models
+
+_CACHE_KEY = "principal_cache"
+_PENDING_KEY = "principal_cache_pending"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as routes see it: plain values, no session attached."""
+
+    id: str
+    email: str
+    display_name: Optional[str] = None
+
+
+class PrincipalCache:
+    """Bounded LRU/TTL cache of bearer token -> ``Principal``.
+
+    An entry lives for ``ttl_seconds`` or until the token's own ``exp``,
+    whichever comes first, so a cached token never outlives its signature
+    check. ``invalidate(email)`` drops every token of a user; a lookup that
+    started before an invalidation is not cached (see ``generation``).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        ttl_seconds: float = 60.0,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._tokens_by_email: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            principal, expires_at = entry
+            if expires_at <= self._clock():
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return principal
+
+    def put(
+        self, token: str, principal: Principal, token_expires_at: float, generation: int
+    ) -> None:
+        """Cache ``principal`` unless a user changed since ``generation`` was read."""
+        expires_at = min(self._clock() + self._ttl, token_expires_at)
+        with self._lock:
+            if generation != self._generation or self._max_entries <= 0:
+                return
+            self._remove(token)
+            self._entries[token] = (principal, expires_at)
+            self._tokens_by_email.setdefault(principal.email, set()).add(token)
+            while len(self._entries) > self._max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, email: str) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            for token in self._tokens_by_email.pop(email, set()):
+                self._entries.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tokens_by_email.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        tokens = self._tokens_by_email.get(entry[0].email)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_email[entry[0].email]
+
+
+def install_invalidation(session_factory: Any, cache: PrincipalCache) -> None:
+    """Invalidate ``cache`` when sessions from ``session_factory`` commit a user change.
+
+    Works for ``sessionmaker`` and ``async_sessionmaker``: the cache rides in
+    ``Session.info``. Updated and deleted ``User`` rows are collected at flush
+    (with the old email, if it changed) and invalidated after commit. Bulk
+    ``update()``/``delete()`` statements bypass the ORM and must call
+    ``cache.invalidate`` themselves.
+    """
+    session_factory.configure(info={_CACHE_KEY: cache})
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session: Session, flush_context: Any) -> None:
+    if _CACHE_KEY not in session.info:
+        return
+    emails = session.info.setdefault(_PENDING_KEY, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.User):
+            continue
+        emails.add(obj.email)
+        history = inspect(obj).attrs.email.history
+        emails.update(email for email in history.deleted or () if email)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    cache = session.info.get(_CACHE_KEY)
+    emails = session.info.pop(_PENDING_KEY, None)
+    if cache is None or not emails:
+        return
+    for email in emails:
+        cache.invalidate(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -6,22 +6,19 @@ from typing import Any, Dict, Optional
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 
 from backend.backend_service.config import Settings
-from backend.backend_service.dependencies import get_settings_dep, get_store
+from backend.backend_service.dependencies import (
+    get_principal_cache,
+    get_settings_dep,
+    get_store,
+)
+from backend.backend_service.services.principals import Principal, PrincipalCache
 from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.store_runner import StoreRunner
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-security_scheme = HTTPBearer()
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+# auto_error=False so a missing token gets the same 401 as an invalid one
+security_scheme = HTTPBearer(auto_error=False)
 
 
 def create_access_token(
@@ -40,17 +37,25 @@ def create_access_token(
     return jwt.encode(to_encode, settings.secret_key, algorithm=settings.algorithm)
 
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security_scheme),
-    store: DatabaseStore = Depends(get_store),
+async def get_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(security_scheme),
+    store: StoreRunner = Depends(get_store),
     settings: Settings = Depends(get_settings_dep),
-):
+    principals: PrincipalCache = Depends(get_principal_cache),
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if credentials is None:
+        raise credentials_exception
     token = credentials.credentials
+    # a cached token was decoded and verified when it was stored, and its
+    # entry expires no later than the token itself
+    principal = principals.get(token)
+    if principal is not None:
+        return principal
     try:
         payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
         email: Optional[str] = payload.get("sub")
@@ -58,7 +63,9 @@ def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = store.get_user_by_email(email)
-    if not user:
+    generation = principals.generation
+    principal = await store.run(DatabaseStore.get_principal, email)
+    if principal is None:
         raise credentials_exception
-    return user
+    principals.put(token, principal, float(payload["exp"]), generation)
+    return principal
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import uuid
-from datetime import datetime
-from typing import Dict, List, Optional
+from concurrent.futures import Executor, Future
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
 
-from sqlalchemy import delete, func, select
-from sqlalchemy.orm import Session, selectinload
+import numpy as np
+from sqlalchemy import Row, delete, exists, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
 
 from backend.backend_service import models
+from backend.backend_service.database import conflict_insert, full_text_search, upsert_increment
 from backend.backend_service.schemas import (
     EmbeddingRecord,
     Message,
@@ -21,32 +24,85 @@ from backend.backend_service.schemas import (
     SearchResult,
     UserCreate,
 )
+from backend.backend_service.services.principals import Principal
+from backend.backend_service.services.timing import ServerTiming
+from backend.backend_service.services.usage import GRANULARITY_MINUTE, UsageBatch
+from backend.backend_service.services.vector_codec import VECTOR_FLOAT32, decode_vector, encode_vector
+from backend.backend_service.services.vector_index import SearchIndex, VectorIndex
+from backend.backend_service.services.versions import (
+    VersionCounters,
+    room_messages_key,
+    user_nomis_key,
+    user_rooms_key,
+)
 
 
-class DatabaseStore:
-    """Persistence layer backed by SQLAlchemy."""
+T = TypeVar("T")
+
 
-    def __init__(self, session: Session) -> None:
+class DatabaseStore:
+    """Persistence layer backed by SQLAlchemy.
+
+    Embedding vectors are stored as packed ``vector_encoding`` blobs and decoded
+    with ``numpy.frombuffer``; they only become float lists in API responses.
+    They are also mirrored into ``vector_index`` (exact or IVF),
+    which is shared across requests and loaded from the ``embeddings`` table
+    on first use.
+
+    Writes that change a cached read bump its counter in ``versions`` after
+    committing (see ``services/versions.py``).
+
+    ``wait_for`` is how this store waits on a ``search_executor`` future.
+    Without it (sync sessions, on a worker thread) index work runs inline and
+    futures are waited on with ``result()``. ``AsyncStoreRunner`` passes a
+    ``wait_for`` that suspends the request instead, and then every index
+    call (search, add, load) runs on ``search_executor`` so neither the
+    NumPy work nor the index lock ever blocks the event loop.
+    """
+
+    def __init__(
+        self,
+        session: Session,
+        vector_index: Optional[SearchIndex] = None,
+        vector_encoding: str = VECTOR_FLOAT32,
+        search_executor: Optional[Executor] = None,
+        versions: Optional[VersionCounters] = None,
+        wait_for: Optional[Callable[[Future], Any]] = None,
+    ) -> None:
         self.session = session
+        self.vector_index = vector_index if vector_index is not None else VectorIndex()
+        self.vector_encoding = vector_encoding
+        self.search_executor = search_executor
+        self.versions = versions if versions is not None else VersionCounters()
+        self.wait_for = wait_for
 
     # Users -----------------------------------------------------------------
-    def create_user(self, payload: UserCreate, hashed_password: str) -> models.User:
-        existing = self.session.execute(
-            select(models.User).where(models.User.email == payload.email)
-        ).scalar_one_or_none()
-        if existing:
+    def create_user(self, payload: UserCreate, hashed_password: str) -> Principal:
+        """Insert the user in one round trip; ``ValueError`` if the email is taken."""
+        row = {
+            "id": str(uuid.uuid4()),
+            "email": payload.email,
+            "display_name": payload.display_name,
+            "hashed_password": hashed_password,
+            "created_at": datetime.utcnow(),
+        }
+        statement = conflict_insert(self.session, models.User.__table__)
+        if statement is not None:
+            inserted = self.session.execute(
+                statement.values(row).on_conflict_do_nothing(index_elements=["email"])
+            ).rowcount
+        else:
+            taken = self.session.execute(
+                select(exists().where(models.User.email == payload.email))
+            ).scalar()
+            inserted = 0
+            if not taken:
+                inserted = self.session.execute(insert(models.User).values(row)).rowcount
+        if not inserted:
+            self.session.rollback()
             raise ValueError("user already exists")
-        user = models.User(
-            id=str(uuid.uuid4()),
-            email=payload.email,
-            display_name=payload.display_name,
-            hashed_password=hashed_password,
-            created_at=datetime.utcnow(),
-        )
-        self.session.add(user)
         self.session.commit()
-        self.session.refresh(user)
-        return user
+        return Principal(row["id"], row["email"], row["display_name"])
 
     def get_user_by_email(self, email: str) -> Optional[models.User]:
         return self.session.execute(
@@ -56,9 +112,24 @@ class DatabaseStore:
     def get_user(self, user_id: str) -> Optional[models.User]:
         return self.session.get(models.User, user_id)
 
+    def update_password_hash(self, user_id: str, hashed_password: str) -> None:
+        user = self.session.get(models.User, user_id)
+        if user is not None:
+            user.hashed_password = hashed_password
+            self.session.commit()
+
+    def get_principal(self, email: str) -> Optional[Principal]:
+        row = self.session.execute(
+            select(models.User.id, models.User.email, models.User.display_name).where(
+                models.User.email == email
+            )
+        ).one_or_none()
+        return Principal(*row) if row is not None else None
+
     # Nomis -----------------------------------------------------------------
     def create_nomi(self, owner_id: str, payload: NomiCreate) -> Nomi:
-        nomi = models.Nomi(
+        now = datetime.utcnow()
+        nomi = Nomi(
             id=str(uuid.uuid4()),
             owner_id=owner_id,
             name=payload.name,
@@ -66,120 +137,172 @@ class DatabaseStore:
             default_model=payload.default_model,
             avatar_url=payload.avatar_url,
             visibility=payload.visibility,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow(),
+            created_at=now,
+            updated_at=now,
         )
-        self.session.add(nomi)
+        # every column is known here, so nothing is read back after the commit
+        self.session.execute(insert(models.Nomi).values(nomi.model_dump()))
         self.session.commit()
-        self.session.refresh(nomi)
-        return _to_schema_nomi(nomi)
+        self.versions.bump(user_nomis_key(owner_id))
+        return nomi
 
     def list_nomis(self, owner_id: str) -> List[Nomi]:
-        nomis = self.session.execute(
-            select(models.Nomi).where(models.Nomi.owner_id == owner_id)
-        ).scalars()
-        return [_to_schema_nomi(nomi) for nomi in nomis]
+        rows = self.session.execute(
+            select(*_NOMI_COLUMNS).where(models.Nomi.owner_id == owner_id)
+        )
+        return [_nomi_from_row(row) for row in rows]
 
     def get_nomi(self, nomi_id: str, owner_id: Optional[str] = None) -> Optional[Nomi]:
-        nomi = self.session.get(models.Nomi, nomi_id)
-        if not nomi:
-            return None
-        if owner_id and nomi.owner_id != owner_id:
-            return None
-        return _to_schema_nomi(nomi)
-
-    def update_nomi(self, nomi_id: str, payload: NomiUpdate) -> Optional[Nomi]:
-        nomi = self.session.get(models.Nomi, nomi_id)
-        if not nomi:
-            return None
-        for field, value in payload.model_dump(exclude_unset=True).items():
-            setattr(nomi, field, value)
-        nomi.updated_at = datetime.utcnow()
-        self.session.add(nomi)
+        row = self.session.execute(
+            select(*_NOMI_COLUMNS).where(*_nomi_filter(nomi_id, owner_id))
+        ).first()
+        return _nomi_from_row(row) if row is not None else None
+
+    def update_nomi(
+        self, nomi_id: str, payload: NomiUpdate, owner_id: Optional[str] = None
+    ) -> Optional[Nomi]:
+        """Apply ``payload``; with ``owner_id``, a nomi owned by someone else is not found."""
+        values = payload.model_dump(exclude_unset=True)
+        values["updated_at"] = datetime.utcnow()
+        statement = update(models.Nomi).where(*_nomi_filter(nomi_id, owner_id)).values(values)
+        if self.session.get_bind().dialect.update_returning:
+            row = self.session.execute(statement.returning(*_NOMI_COLUMNS)).one_or_none()
+        else:
+            row = None
+            if self.session.execute(statement).rowcount:
+                row = self.session.execute(
+                    select(*_NOMI_COLUMNS).where(models.Nomi.id == nomi_id)
+                ).one()
         self.session.commit()
-        self.session.refresh(nomi)
-        return _to_schema_nomi(nomi)
-
-    def delete_nomi(self, nomi_id: str) -> bool:
-        result = self.session.execute(
-            delete(models.Nomi).where(models.Nomi.id == nomi_id)
-        )
+        if row is None:
+            return None
+        self.versions.bump(user_nomis_key(row.owner_id))
+        return _nomi_from_row(row)
+
+    def delete_nomi(self, nomi_id: str, owner_id: Optional[str] = None) -> bool:
+        if owner_id is None:
+            owner_id = self.session.execute(
+                select(models.Nomi.owner_id).where(models.Nomi.id == nomi_id)
+            ).scalar()
+            if owner_id is None:
+                return False
+        result = self.session.execute(delete(models.Nomi).where(*_nomi_filter(nomi_id, owner_id)))
         self.session.commit()
-        return result.rowcount > 0
+        if not result.rowcount:
+            return False
+        self.versions.bump(user_nomis_key(owner_id))
+        return True
 
     # Rooms -----------------------------------------------------------------
     def create_room(self, owner_id: str, payload: RoomCreate) -> Room:
-        room = models.Room(
+        room = Room(
             id=str(uuid.uuid4()),
             owner_id=owner_id,
             name=payload.name,
             is_group=payload.is_group,
+            members=[owner_id],
             created_at=datetime.utcnow(),
         )
-        self.session.add(room)
-        self.session.flush()
-        membership = models.RoomMember(room_id=room.id, user_id=owner_id)
-        self.session.add(membership)
+        self.session.execute(
+            insert(models.Room).values(room.model_dump(exclude={"members"}))
+        )
+        self.session.execute(insert(models.RoomMember).values(room_id=room.id, user_id=owner_id))
         self.session.commit()
-        self.session.refresh(room)
-        return _to_schema_room(room, members=[owner_id])
+        self.versions.bump(user_rooms_key(owner_id))
+        return room
 
     def list_rooms(self, user_id: str) -> List[Room]:
-        rooms = (
-            self.session.execute(
-                select(models.Room)
-                .join(models.RoomMember, models.RoomMember.room_id == models.Room.id)
-                .where(models.RoomMember.user_id == user_id)
-                .options(selectinload(models.Room.members))
-                .distinct()
-            )
-            .scalars()
-            .all()
-        )
-        return [_to_schema_room(room) for room in rooms]
+        rows = self.session.execute(
+            select(*_ROOM_COLUMNS)
+            .join(models.RoomMember, models.RoomMember.room_id == models.Room.id)
+            .where(models.RoomMember.user_id == user_id)
+        ).all()
+        return self._rooms_with_members(rows)
 
     def get_room(self, room_id: str) -> Optional[Room]:
-        room = (
-            self.session.execute(
-                select(models.Room)
-                .where(models.Room.id == room_id)
-                .options(selectinload(models.Room.members))
+        rows = self.session.execute(
+            select(*_ROOM_COLUMNS).where(models.Room.id == room_id)
+        ).all()
+        rooms = self._rooms_with_members(rows)
+        return rooms[0] if rooms else None
+
+    def _rooms_with_members(self, rows: Sequence[Row]) -> List[Room]:
+        """Build ``Room`` models from ``_ROOM_COLUMNS`` rows plus one query for all their members."""
+        if not rows:
+            return []
+        members: Dict[str, List[str]] = {row[0]: [] for row in rows}
+        for room_id, member_id in self.session.execute(
+            select(models.RoomMember.room_id, models.RoomMember.user_id)
+            .where(models.RoomMember.room_id.in_(list(members)))
+            .order_by(models.RoomMember.id)
+        ):
+            members[room_id].append(member_id)
+        return [
+            Room(
+                id=room_id,
+                owner_id=owner_id,
+                name=name,
+                is_group=is_group,
+                members=members[room_id],
+                created_at=created_at,
             )
-            .scalars()
-            .first()
+            for room_id, owner_id, name, is_group, created_at in rows
+        ]
+
+    def is_member(self, room_id: str, user_id: str) -> bool:
+        # one probe of the (room_id, user_id) unique index, whatever the room size
+        return bool(
+            self.session.execute(
+                select(
+                    exists().where(
+                        models.RoomMember.room_id == room_id,
+                        models.RoomMember.user_id == user_id,
+                    )
+                )
+            ).scalar()
         )
-        if not room:
-            return None
-        return _to_schema_room(room)
 
     def join_room(self, room_id: str, user_id: str) -> Optional[Room]:
-        room = self.session.get(models.Room, room_id)
-        if not room:
-            return None
-        existing = self.session.execute(
-            select(models.RoomMember).where(
-                models.RoomMember.room_id == room_id,
-                models.RoomMember.user_id == user_id,
+        """Add ``user_id`` to the room; one round trip when already a member, two otherwise."""
+        room, member = models.Room, models.RoomMember
+        rows = self.session.execute(
+            select(
+                room.id, room.owner_id, room.name, room.is_group, room.created_at, member.user_id
             )
-        ).scalar_one_or_none()
-        if not existing:
-            self.session.add(models.RoomMember(room_id=room_id, user_id=user_id))
+            .outerjoin(member, member.room_id == room.id)
+            .where(room.id == room_id)
+            .order_by(member.id)
+        ).all()
+        if not rows:
+            return None
+        members = [row.user_id for row in rows if row.user_id is not None]
+        if user_id not in members:
+            statement = conflict_insert(self.session, member.__table__)
+            values = {"room_id": room_id, "user_id": user_id}
+            if statement is not None:
+                # a concurrent join of the same user is a no-op, not an IntegrityError
+                statement = statement.values(values).on_conflict_do_nothing(
+                    index_elements=["room_id", "user_id"]
+                )
+            else:
+                statement = insert(member).values(values)
+            self.session.execute(statement)
             self.session.commit()
-        room = (
-            self.session.execute(
-                select(models.Room)
-                .where(models.Room.id == room_id)
-                .options(selectinload(models.Room.members))
-            )
-            .scalars()
-            .first()
+            members.append(user_id)
+            # every member's room list shows the member ids
+            self.versions.bump(*(user_rooms_key(member_id) for member_id in members))
+        first = rows[0]
+        return Room(
+            id=first.id,
+            owner_id=first.owner_id,
+            name=first.name,
+            is_group=first.is_group,
+            members=members,
+            created_at=first.created_at,
         )
-        return _to_schema_room(room) if room else None
 
     def add_message(self, room_id: str, user_id: str, payload: MessageCreate) -> Optional[Message]:
-        if not self.session.get(models.Room, room_id):
-            return None
-        message = models.Message(
+        message = Message(
             id=str(uuid.uuid4()),
             room_id=room_id,
             sender_id=user_id,
@@ -187,79 +310,246 @@ class DatabaseStore:
             content=payload.content,
             created_at=datetime.utcnow(),
         )
-        self.session.add(message)
+        # INSERT ... SELECT ... WHERE EXISTS (room): the room check and the write
+        # are one statement, and nothing is read back afterwards
+        table = models.Message.__table__
+        values = message.model_dump()
+        inserted = self.session.execute(
+            insert(table).from_select(
+                list(values),
+                select(*(literal(values[name], table.c[name].type) for name in values)).where(
+                    exists().where(models.Room.id == room_id)
+                ),
+            )
+        ).rowcount
+        if not inserted:
+            self.session.rollback()
+            return None
         self.session.commit()
-        self.session.refresh(message)
-        return _to_schema_message(message)
-
-    def list_messages(self, room_id: str, limit: int = 50) -> List[Message]:
-        messages = (
-            self.session.execute(
-                select(models.Message)
-                .where(models.Message.room_id == room_id)
-                .order_by(models.Message.created_at.desc())
-                .limit(limit)
+        self.versions.bump(room_messages_key(room_id))
+        return message
+
+    def list_messages(
+        self,
+        room_id: str,
+        limit: int = 50,
+        before: Optional[Tuple[datetime, str]] = None,
+        after: Optional[Tuple[datetime, str]] = None,
+    ) -> List[Message]:
+        """Return up to ``limit`` messages in ascending order.
+
+        Without a cursor these are the newest messages. ``before``/``after`` are
+        ``(created_at, id)`` keys: the page holds the messages immediately older
+        or newer than that key. Every page is one range scan of
+        ``ix_messages_room_created_id``, however deep it is.
+        """
+        created_at, message_id = models.Message.created_at, models.Message.id
+        statement = select(*_MESSAGE_COLUMNS).where(models.Message.room_id == room_id)
+        if after is not None:
+            # "<=/>= and then tie-break" rather than a row-value comparison keeps
+            # created_at usable as the index range bound on every dialect
+            statement = statement.where(
+                created_at >= after[0], or_(created_at > after[0], message_id > after[1])
+            ).order_by(created_at.asc(), message_id.asc())
+        else:
+            if before is not None:
+                statement = statement.where(
+                    created_at <= before[0], or_(created_at < before[0], message_id < before[1])
+                )
+            statement = statement.order_by(created_at.desc(), message_id.desc())
+        messages = [_message_from_row(row) for row in self.session.execute(statement.limit(limit))]
+        if after is None:
+            messages.reverse()
+        return messages
+
+    def search_messages(self, room_id: str, query: str, limit: int = 20) -> List[Message]:
+        """Return messages in ``room_id`` matching ``query``, best match first."""
+        hits = full_text_search(self.session, "messages", query, limit, where={"room_id": room_id})
+        if not hits:
+            return []
+        rows = self.session.execute(
+            select(*_MESSAGE_COLUMNS).where(
+                models.Message.id.in_([message_id for message_id, _ in hits])
             )
-            .scalars()
-            .all()
         )
-        messages.reverse()
-        return [_to_schema_message(message) for message in messages]
+        messages = {row[0]: _message_from_row(row) for row in rows}
+        return [messages[message_id] for message_id, _ in hits if message_id in messages]
 
     # Embeddings ------------------------------------------------------------
     def create_embedding(self, text: str, vector: List[float], metadata: Dict[str, str]) -> EmbeddingRecord:
-        record = models.Embedding(
-            id=str(uuid.uuid4()),
+        blob = encode_vector(vector, self.vector_encoding)
+        row = {
+            "id": str(uuid.uuid4()),
+            "text": text,
+            "vector": blob,
+            "metadata_": metadata,
+            "created_at": datetime.utcnow(),
+        }
+        self.session.execute(insert(models.Embedding), [row])
+        self.session.commit()
+        # index what a reload would read back, which differs from ``vector`` for int8
+        stored = decode_vector(blob)
+        self._offload(self.vector_index.add, row["id"], stored)
+        return EmbeddingRecord(
+            id=row["id"],
             text=text,
-            vector=vector,
+            vector=stored.tolist(),
             metadata=metadata,
-            created_at=datetime.utcnow(),
+            created_at=row["created_at"],
         )
-        self.session.add(record)
-        self.session.commit()
-        self.session.refresh(record)
-        return _to_schema_embedding(record)
 
-    def search_embeddings(self, query: str, k: int = 8) -> List[SearchResult]:
-        query_lower = query.lower()
-        embeddings = (
-            self.session.execute(
-                select(models.Embedding).where(
-                    func.lower(models.Embedding.text).contains(query_lower)
-                )
+    def create_embeddings(
+        self,
+        items: Sequence[Tuple[str, List[float], Dict[str, str]]],
+        chunk_size: int = 500,
+    ) -> List[str]:
+        """Bulk-insert ``(text, vector, metadata)`` rows, one statement and commit per chunk.
+
+        Returns the new ids in input order.
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "text": text,
+                "vector": encode_vector(vector, self.vector_encoding),
+                "metadata_": metadata,
+                "created_at": now,
+            }
+            for text, vector, metadata in items
+        ]
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start : start + chunk_size]
+            self.session.execute(insert(models.Embedding), chunk)
+            self.session.commit()
+            self._offload(
+                self.vector_index.add_many,
+                [(row["id"], decode_vector(row["vector"])) for row in chunk],
             )
-            .scalars()
-            .all()
+        return [row["id"] for row in rows]
+
+    def search_embeddings(self, query_vector: Sequence[float], k: int = 8) -> List[SearchResult]:
+        """Return the ``k`` embeddings with the highest cosine similarity to ``query_vector``."""
+        self._ensure_index_loaded()
+        hits = self._offload(self.vector_index.search, query_vector, k)
+        return self._embedding_results(hits, vector_scores=dict(hits))
+
+    def search_embeddings_text(self, query: str, k: int = 8) -> List[SearchResult]:
+        """Return the ``k`` embeddings whose text best matches ``query``, via the full-text index."""
+        hits = full_text_search(self.session, "embeddings", query, k)
+        return self._embedding_results(hits, text_scores=dict(hits))
+
+    def search_embeddings_hybrid(
+        self,
+        query: str,
+        query_vector: Sequence[float],
+        k: int = 8,
+        candidates: int = 50,
+        timing: Optional[ServerTiming] = None,
+    ) -> List[SearchResult]:
+        """Fuse vector and full-text hits with reciprocal-rank fusion.
+
+        Each source contributes at most ``max(k, candidates)`` hits, so fusion
+        cost does not grow with the corpus. The vector search only touches the
+        in-memory index, so it runs on ``search_executor`` while this session
+        runs the full-text query. ``score`` is the fused score; the per-source
+        scores are reported alongside it.
+        """
+        timing = timing if timing is not None else ServerTiming()
+        limit = max(k, candidates)
+        with timing.stage("load"):
+            self._ensure_index_loaded()
+
+        def vector_search() -> List[Tuple[str, float]]:
+            with timing.stage("vector"):
+                return self.vector_index.search(query_vector, limit)
+
+        pending = (
+            self.search_executor.submit(vector_search) if self.search_executor is not None else None
         )
-        results: List[SearchResult] = []
-        for record in embeddings:
-            if len(record.text) == 0:
-                continue
-            score = len(query_lower) / len(record.text)
-            results.append(
-                SearchResult(
-                    id=record.id,
-                    text=record.text,
-                    score=round(score, 4),
-                    metadata=record.metadata or {},
-                )
+        with timing.stage("text"):
+            text_hits = full_text_search(self.session, "embeddings", query, limit)
+        vector_hits = self._wait(pending) if pending is not None else vector_search()
+        with timing.stage("fuse"):
+            fused = _reciprocal_rank_fusion([vector_hits, text_hits])[:k]
+        with timing.stage("fetch"):
+            return self._embedding_results(
+                fused, vector_scores=dict(vector_hits), text_scores=dict(text_hits)
             )
-        results.sort(key=lambda item: item.score, reverse=True)
-        return results[:k]
+
+    def _embedding_results(
+        self,
+        hits: List[Tuple[str, float]],
+        vector_scores: Optional[Dict[str, float]] = None,
+        text_scores: Optional[Dict[str, float]] = None,
+    ) -> List[SearchResult]:
+        if not hits:
+            return []
+        vector_scores = vector_scores or {}
+        text_scores = text_scores or {}
+        rows = self.session.execute(
+            select(models.Embedding.id, models.Embedding.text, models.Embedding.metadata_).where(
+                models.Embedding.id.in_([record_id for record_id, _ in hits])
+            )
+        ).all()
+        records = {row.id: row for row in rows}
+        return [
+            SearchResult(
+                id=record_id,
+                text=records[record_id].text,
+                score=round(score, 4),
+                vector_score=_rounded(vector_scores.get(record_id)),
+                text_score=_rounded(text_scores.get(record_id)),
+                metadata=records[record_id].metadata_ or {},
+            )
+            for record_id, score in hits
+            if record_id in records
+        ]
+
+    def _ensure_index_loaded(self) -> None:
+        index = self.vector_index
+        if index.loaded:
+            return
+        # the rows are read on this session; only building the index is offloaded
+        rows = list(self._embedding_rows(index.load_since()))
+        self._offload(index.load, rows)
+
+    def _offload(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run CPU-bound index work on ``search_executor`` when ``wait_for`` can await it."""
+        if self.wait_for is None or self.search_executor is None:
+            return fn(*args)
+        return self._wait(self.search_executor.submit(fn, *args))
+
+    def _wait(self, future: Future) -> Any:
+        return self.wait_for(future) if self.wait_for is not None else future.result()
+
+    def _embedding_rows(self, since: Optional[datetime]) -> Iterable[Tuple[str, np.ndarray]]:
+        statement = select(models.Embedding.id, models.Embedding.vector)
+        if since is not None:
+            statement = statement.where(models.Embedding.created_at >= since)
+        rows = self.session.execute(statement.execution_options(yield_per=5000))
+        return ((row.id, decode_vector(row.vector)) for row in rows)
 
     # Models ----------------------------------------------------------------
     def override_model(self, model_id: str, override: ModelOverride) -> None:
-        existing = self.session.get(models.ModelOverride, model_id)
-        if existing:
-            existing.config = override.config or {}
-            existing.updated_at = datetime.utcnow()
-        else:
-            existing = models.ModelOverride(
-                model_id=model_id,
-                config=override.config or {},
-                updated_at=datetime.utcnow(),
+        row = {
+            "model_id": model_id,
+            "config": override.config or {},
+            "updated_at": datetime.utcnow(),
+        }
+        statement = conflict_insert(self.session, models.ModelOverride.__table__)
+        if statement is not None:
+            self.session.execute(
+                statement.values(row).on_conflict_do_update(
+                    index_elements=["model_id"],
+                    set_={
+                        "config": statement.excluded.config,
+                        "updated_at": statement.excluded.updated_at,
+                    },
+                )
             )
-            self.session.add(existing)
+        else:
+            self.session.merge(models.ModelOverride(**row))
         self.session.commit()
 
     # Usage -----------------------------------------------------------------
@@ -267,13 +557,52 @@ class DatabaseStore:
         usage = self.session.get(models.Usage, user_id)
         return {user_id: usage.count if usage else 0}
 
-    def increment_usage(self, user_id: str, amount: int = 1) -> None:
-        usage = self.session.get(models.Usage, user_id)
-        if usage:
-            usage.count += amount
-        else:
-            usage = models.Usage(user_id=user_id, count=amount)
-            self.session.add(usage)
+    def get_usage_buckets(
+        self, user_id: str, granularity: str, since: datetime, until: datetime
+    ) -> Dict[datetime, int]:
+        bucket = models.UsageBucket
+        rows = self.session.execute(
+            select(bucket.bucket_start, bucket.count)
+            .where(
+                bucket.user_id == user_id,
+                bucket.granularity == granularity,
+                bucket.bucket_start >= since,
+                bucket.bucket_start <= until,
+            )
+            .order_by(bucket.bucket_start)
+        ).all()
+        return {row.bucket_start: row.count for row in rows}
+
+    def add_usage(self, batch: UsageBatch, minute_retention: Optional[timedelta] = None) -> None:
+        """Apply a ``UsageRecorder`` batch as atomic increments in one transaction.
+
+        Minute buckets older than ``minute_retention`` are deleted on the way;
+        hour buckets and totals are kept.
+        """
+        upsert_increment(
+            self.session,
+            models.Usage.__table__,
+            ["user_id"],
+            "count",
+            [{"user_id": user_id, "count": n} for user_id, n in sorted(batch.totals.items())],
+        )
+        upsert_increment(
+            self.session,
+            models.UsageBucket.__table__,
+            ["user_id", "granularity", "bucket_start"],
+            "count",
+            [
+                {"user_id": user_id, "granularity": kind, "bucket_start": start, "count": n}
+                for (user_id, kind, start), n in sorted(batch.buckets.items())
+            ],
+        )
+        if minute_retention is not None:
+            self.session.execute(
+                delete(models.UsageBucket).where(
+                    models.UsageBucket.granularity == GRANULARITY_MINUTE,
+                    models.UsageBucket.bucket_start < datetime.utcnow() - minute_retention,
+                )
+            )
         self.session.commit()
 
 
@@ -281,49 +610,83 @@ class DatabaseStore:
 # Helpers                                                                     #
 # --------------------------------------------------------------------------- #
 
+# the usual RRF damping constant; it keeps the top rank of one list from
+# outweighing agreement between lists
+RRF_K = 60
 
-def _to_schema_nomi(record: models.Nomi) -> Nomi:
-    return Nomi(
-        id=record.id,
-        owner_id=record.owner_id,
-        name=record.name,
-        persona=record.persona or {},
-        default_model=record.default_model,
-        avatar_url=record.avatar_url,
-        visibility=record.visibility,
-        created_at=record.created_at,
-        updated_at=record.updated_at,
-    )
 
+def _reciprocal_rank_fusion(rankings: Sequence[List[Tuple[str, float]]]) -> List[Tuple[str, float]]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, (record_id, _) in enumerate(ranking, start=1):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
 
-def _to_schema_room(record: models.Room, members: Optional[List[str]] = None) -> Room:
-    member_ids = members if members is not None else [member.user_id for member in record.members]
-    return Room(
-        id=record.id,
-        owner_id=record.owner_id,
-        name=record.name,
-        is_group=record.is_group,
-        members=member_ids,
-        created_at=record.created_at,
-    )
 
+def _rounded(score: Optional[float]) -> Optional[float]:
+    return None if score is None else round(score, 4)
 
-def _to_schema_message(record: models.Message) -> Message:
-    return Message(
-        id=record.id,
-        room_id=record.room_id,
-        sender_id=record.sender_id,
-        text=record.text,
-        content=record.content,
-        created_at=record.created_at,
+
+def _nomi_filter(nomi_id: str, owner_id: Optional[str]) -> list:
+    # ownership is part of the WHERE clause, so no read is needed to check it
+    criteria = [models.Nomi.id == nomi_id]
+    if owner_id is not None:
+        criteria.append(models.Nomi.owner_id == owner_id)
+    return criteria
+
+
+# List reads select these columns as plain rows and build the response
+# model straight from each tuple, skipping ORM identity-map hydration.
+_NOMI_COLUMNS = (
+    models.Nomi.id,
+    models.Nomi.owner_id,
+    models.Nomi.name,
+    models.Nomi.persona,
+    models.Nomi.default_model,
+    models.Nomi.avatar_url,
+    models.Nomi.visibility,
+    models.Nomi.created_at,
+    models.Nomi.updated_at,
+)
+_ROOM_COLUMNS = (
+    models.Room.id,
+    models.Room.owner_id,
+    models.Room.name,
+    models.Room.is_group,
+    models.Room.created_at,
+)
+_MESSAGE_COLUMNS = (
+    models.Message.id,
+    models.Message.room_id,
+    models.Message.sender_id,
+    models.Message.text,
+    models.Message.content,
+    models.Message.created_at,
+)
+
+
+def _nomi_from_row(row: Row) -> Nomi:
+    nomi_id, owner_id, name, persona, default_model, avatar_url, visibility, created, updated = row
+    return Nomi(
+        id=nomi_id,
+        owner_id=owner_id,
+        name=name,
+        persona=persona or {},
+        default_model=default_model,
+        avatar_url=avatar_url,
+        visibility=visibility,
+        created_at=created,
+        updated_at=updated,
     )
 
 
-def _to_schema_embedding(record: models.Embedding) -> EmbeddingRecord:
-    return EmbeddingRecord(
-        id=record.id,
-        text=record.text,
-        vector=record.vector,
-        metadata=record.metadata or {},
-        created_at=record.created_at,
+def _message_from_row(row: Row) -> Message:
+    message_id, room_id, sender_id, text, content, created_at = row
+    return Message(
+        id=message_id,
+        room_id=room_id,
+        sender_id=sender_id,
+        text=text,
+        content=content,
+        created_at=created_at,
     )
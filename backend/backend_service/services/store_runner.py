@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import Future
+from typing import Any, Callable, Concatenate, ParamSpec, Protocol, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from starlette.concurrency import run_in_threadpool
+
+from backend.backend_service.services.store import DatabaseStore
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class StoreRunner(Protocol):
+    """Runs ``DatabaseStore`` calls for an async route.
+
+    Routes call ``await store.run(DatabaseStore.get_room, room_id)``; the
+    runner decides whether the sync store code runs on a worker thread or
+    on the event loop against an async driver.
+    """
+
+    async def run(
+        self, fn: Callable[Concatenate[DatabaseStore, P], T], *args: P.args, **kwargs: P.kwargs
+    ) -> T: ...
+
+
+class ThreadedStoreRunner:
+    """Sync ``Session`` path: every call holds one of Starlette's threadpool threads.
+
+    Each call ends its transaction before returning. A request waiting for a
+    thread between calls must not hold a pooled connection: once every pooled
+    connection is held by a request parked in that gap, the threads that could
+    finish those requests block in pool checkout until it times out.
+    """
+
+    def __init__(self, session: Session, **store_options: Any) -> None:
+        self.store = DatabaseStore(session, **store_options)
+
+    async def run(
+        self, fn: Callable[Concatenate[DatabaseStore, P], T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        return await run_in_threadpool(_call, self.store, fn, *args, **kwargs)
+
+    async def close(self) -> None:
+        await run_in_threadpool(self.store.session.close)
+
+
+class AsyncStoreRunner:
+    """``AsyncSession`` path: calls run via ``run_sync`` on the event loop.
+
+    The store code is unchanged, but each query inside it suspends the request
+    while the async driver waits on the database, instead of blocking a thread.
+    As on the threaded path, each call ends its transaction before returning,
+    so a request awaiting something else between calls (a bcrypt hash, another
+    service) does not keep a pooled connection checked out meanwhile.
+    Because the store code runs on the loop thread, it must never block: work
+    it hands to an executor is awaited through ``_await_future``.
+    """
+
+    def __init__(self, session: AsyncSession, **store_options: Any) -> None:
+        self.session = session
+        self.store = DatabaseStore(
+            session.sync_session, wait_for=_await_future, **store_options
+        )
+
+    async def run(
+        self, fn: Callable[Concatenate[DatabaseStore, P], T], *args: P.args, **kwargs: P.kwargs
+    ) -> T:
+        return await self.session.run_sync(lambda _: _call(self.store, fn, *args, **kwargs))
+
+
+def _await_future(future: Future) -> Any:
+    # ``run_sync`` runs the store in a greenlet; this suspends it (and only it)
+    # until ``future`` resolves, the same way the async driver waits on I/O
+    return await_only(asyncio.wrap_future(future))
+
+
+def _call(store: DatabaseStore, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    try:
+        result = fn(store, *args, **kwargs)
+    except BaseException:
+        store.session.rollback()
+        raise
+    store.session.commit()
+    return result
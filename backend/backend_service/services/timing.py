@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class ServerTiming:
+    """Per-stage wall-clock durations, rendered as a ``Server-Timing`` header.
+
+    Stages may be timed from several threads; a stage timed twice accumulates.
+    """
+
+    def __init__(self) -> None:
+        self.durations: Dict[str, float] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed
+
+    def header(self) -> str:
+        return ", ".join(f"{name};dur={ms:.2f}" for name, ms in self.durations.items())
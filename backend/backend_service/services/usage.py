@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+GRANULARITY_MINUTE = "minute"
+GRANULARITY_HOUR = "hour"
+GRANULARITIES = (GRANULARITY_MINUTE, GRANULARITY_HOUR)
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == GRANULARITY_MINUTE:
+        return at.replace(second=0, microsecond=0)
+    if granularity == GRANULARITY_HOUR:
+        return at.replace(minute=0, second=0, microsecond=0)
+    raise ValueError(f"unknown usage granularity: {granularity}")
+
+
+@dataclass
+class UsageBatch:
+    """Increments collected since the last flush: per-user totals and per-bucket counts."""
+
+    totals: Counter = field(default_factory=Counter)
+    buckets: Counter = field(default_factory=Counter)
+
+    def __bool__(self) -> bool:
+        return bool(self.totals)
+
+    def merge(self, other: "UsageBatch") -> None:
+        self.totals.update(other.totals)
+        self.buckets.update(other.buckets)
+
+
+class UsageRecorder:
+    """Write-behind usage counter shared by every request of one process.
+
+    ``record`` only touches memory. ``flush`` hands everything recorded so
+    far to ``persist`` (``DatabaseStore.add_usage``, which applies it as
+    ``count = count + n`` upserts), and ``start`` flushes every
+    ``interval`` seconds until ``stop``. A failed flush keeps its batch for
+    the next one. Counts not yet flushed are lost if the process dies, which
+    is the trade for taking usage writes off the request path.
+    """
+
+    def __init__(self, clock: Callable[[], datetime] = datetime.utcnow) -> None:
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._pending = UsageBatch()
+        # drained but not yet committed; still counted by ``pending_for``
+        self._inflight: List[UsageBatch] = []
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: str, amount: int = 1) -> None:
+        if amount <= 0:
+            return
+        now = self._clock()
+        with self._lock:
+            self._pending.totals[user_id] += amount
+            for granularity in GRANULARITIES:
+                key = (user_id, granularity, bucket_start(now, granularity))
+                self._pending.buckets[key] += amount
+
+    def pending_for(self, user_id: str) -> int:
+        with self._lock:
+            return self._pending.totals[user_id] + sum(
+                batch.totals[user_id] for batch in self._inflight
+            )
+
+    def pending_buckets_for(self, user_id: str, granularity: str) -> Dict[datetime, int]:
+        counts: Counter = Counter()
+        with self._lock:
+            for batch in (self._pending, *self._inflight):
+                for (owner, kind, start), amount in batch.buckets.items():
+                    if owner == user_id and kind == granularity:
+                        counts[start] += amount
+        return dict(counts)
+
+    async def flush(self, persist: Callable[[UsageBatch], Awaitable[None]]) -> int:
+        """Persist everything recorded so far; returns the number of increments written."""
+        async with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, UsageBatch()
+                if not batch:
+                    return 0
+                self._inflight.append(batch)
+            try:
+                await persist(batch)
+            except BaseException:
+                with self._lock:
+                    self._inflight.remove(batch)
+                    self._pending.merge(batch)
+                raise
+            with self._lock:
+                self._inflight.remove(batch)
+            return sum(batch.totals.values())
+
+    def start(self, persist: Callable[[UsageBatch], Awaitable[None]], interval: float) -> None:
+        async def loop() -> None:
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.flush(persist)
+                except Exception:
+                    logger.exception("usage flush failed; retrying next interval")
+
+        self._task = asyncio.get_running_loop().create_task(loop())
+
+    async def stop(self, persist: Callable[[UsageBatch], Awaitable[None]]) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(persist)
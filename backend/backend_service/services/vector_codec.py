@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+import struct
+from typing import Sequence
+
+import numpy as np
+
+VECTOR_FLOAT32 = "float32"
+VECTOR_INT8 = "int8"
+VECTOR_ENCODINGS = (VECTOR_FLOAT32, VECTOR_INT8)
+
+# every blob starts with a 4-byte tag so float32 payloads stay 4-byte aligned
+_FLOAT32_TAG = b"f32\0"
+_INT8_TAG = b"i8\0\0"
+_SCALE = struct.Struct("<f")
+
+
+def encode_vector(vector: Sequence[float], encoding: str = VECTOR_FLOAT32) -> bytes:
+    """Pack ``vector`` as little-endian float32, or as int8 with one float32 scale.
+
+    int8 uses a symmetric per-vector scale (``max(|v|) / 127``), a quarter of
+    the float32 size for a small loss of precision.
+    """
+    array = np.asarray(vector, dtype="<f4")
+    if encoding == VECTOR_FLOAT32:
+        return _FLOAT32_TAG + array.tobytes()
+    if encoding == VECTOR_INT8:
+        peak = float(np.abs(array).max()) if array.size else 0.0
+        scale = peak / 127 if peak else 1.0
+        quantized = np.clip(np.rint(array / scale), -127, 127).astype(np.int8)
+        return _INT8_TAG + _SCALE.pack(scale) + quantized.tobytes()
+    raise ValueError(f"unknown vector encoding: {encoding}")
+
+
+def decode_vector(blob: bytes) -> np.ndarray:
+    """Return the float32 vector stored in ``blob``.
+
+    float32 blobs are returned as a read-only ``numpy.frombuffer`` view of the
+    bytes, without copying; int8 blobs are dequantized into a new array.
+    """
+    tag = bytes(blob[:4])
+    if tag == _FLOAT32_TAG:
+        return np.frombuffer(blob, dtype="<f4", offset=4)
+    if tag == _INT8_TAG:
+        (scale,) = _SCALE.unpack_from(blob, 4)
+        return np.frombuffer(blob, dtype=np.int8, offset=8).astype(np.float32) * np.float32(scale)
+    raise ValueError("unrecognised vector blob")
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Protocol, Sequence, Tuple
+
+import numpy as np
+
+# ``rows(since)`` yields ``(id, vector)`` for rows created at or after ``since``,
+# or for every row when ``since`` is ``None``
+RowsSince = Callable[[Optional[datetime]], Iterable[Tuple[str, Sequence[float]]]]
+
+
+class SearchIndex(Protocol):
+    """What ``DatabaseStore`` needs from a vector index."""
+
+    @property
+    def loaded(self) -> bool: ...
+
+    def load_since(self) -> Optional[datetime]: ...
+
+    def load(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None: ...
+
+    def ensure_loaded(self, rows: RowsSince) -> None: ...
+
+    def add(self, record_id: str, vector: Sequence[float]) -> None: ...
+
+    def add_many(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None: ...
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[str, float]]: ...
+
+
+class VectorIndex:
+    """Exact cosine top-k search over an in-memory float32 matrix.
+
+    Rows are L2-normalized on insert so a query is one matrix-vector product
+    followed by ``argpartition`` to pick the top ``k`` without sorting the
+    whole corpus. Storage grows by doubling and rows are append-only, so a
+    search works on a ``(matrix, size)`` snapshot taken under the lock and
+    does the arithmetic without blocking inserts from other threads.
+    """
+
+    def __init__(self, initial_capacity: int = 1024) -> None:
+        self._capacity = max(1, initial_capacity)
+        self._matrix: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self._matrix is None else self._matrix.shape[1]
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load_since(self) -> Optional[datetime]:
+        """Where ``load`` expects its rows to start: always the whole table."""
+        return None
+
+    def ensure_loaded(self, rows: RowsSince) -> None:
+        """Fill the index from ``rows(load_since())`` the first time it is needed."""
+        if not self._loaded:
+            self.load(rows(self.load_since()))
+
+    def load(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        """Build the index from ``items`` and swap it in, unless already loaded.
+
+        ``items`` is consumed and the matrix built without holding the lock,
+        which is only taken for the swap: a lock held while rows stream from
+        the database would block every search for the whole load, and on the
+        async path (where the rows arrive on the event loop) stall the loop
+        for good. Concurrent cold loads each build a copy and the first swap
+        wins; rows added while loading are carried over.
+        """
+        if self._loaded:
+            return
+        built = VectorIndex(initial_capacity=self._capacity)
+        built.add_many(items)
+        with self._lock:
+            if self._loaded:
+                return
+            size = len(self._ids)
+            if size:
+                built.add_many(zip(self._ids, self._matrix[:size]))
+            self._matrix, self._ids, self._positions = built._matrix, built._ids, built._positions
+            self._loaded = True
+
+    def add(self, record_id: str, vector: Sequence[float]) -> None:
+        with self._lock:
+            self._add(record_id, vector)
+
+    def add_many(self, items: Iterable[Tuple[str, Sequence[float]]]) -> None:
+        with self._lock:
+            for record_id, vector in items:
+                self._add(record_id, vector)
+
+    def search(self, query: Sequence[float], k: int) -> List[Tuple[str, float]]:
+        """Return up to ``k`` ``(id, cosine similarity)`` pairs, best first."""
+        with self._lock:
+            matrix, ids = self._matrix, self._ids
+            size = len(ids)
+        if matrix is None or size == 0 or k <= 0:
+            return []
+        vector = _normalized(query, matrix.shape[1])
+        scores = matrix[:size] @ vector
+        if k < size:
+            top = np.argpartition(scores, size - k)[size - k :]
+        else:
+            top = np.arange(size)
+        top = top[np.argsort(scores[top])[::-1]]
+        return [(ids[position], float(scores[position])) for position in top]
+
+    def snapshot(self) -> Tuple[np.ndarray, List[str]]:
+        """Return the filled rows of the matrix and their ids."""
+        with self._lock:
+            size = len(self._ids)
+            if self._matrix is None:
+                return np.zeros((0, 0), dtype=np.float32), []
+            return self._matrix[:size], list(self._ids)
+
+    def _add(self, record_id: str, vector: Sequence[float]) -> None:
+        if self._matrix is None:
+            self._matrix = np.zeros((self._capacity, len(vector)), dtype=np.float32)
+        row = _normalized(vector, self._matrix.shape[1])
+        position = self._positions.get(record_id)
+        if position is None:
+            position = len(self._ids)
+            if position == self._matrix.shape[0]:
+                grown = np.zeros((position * 2, self._matrix.shape[1]), dtype=np.float32)
+                grown[:position] = self._matrix
+                self._matrix = grown
+            self._matrix[position] = row
+            # append-only: rows below a reader's snapshot size never move
+            self._ids.append(record_id)
+            self._positions[record_id] = position
+        else:
+            self._matrix[position] = row
+
+
+def _normalized(vector: Sequence[float], dim: int) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    if array.shape != (dim,):
+        raise ValueError(f"expected a vector of dimension {dim}, got {array.shape}")
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import threading
+from typing import Dict, Hashable, Tuple
+
+
+def room_messages_key(room_id: str) -> Tuple[str, str]:
+    return ("room-messages", room_id)
+
+
+def user_rooms_key(user_id: str) -> Tuple[str, str]:
+    return ("user-rooms", user_id)
+
+
+def user_nomis_key(user_id: str) -> Tuple[str, str]:
+    return ("user-nomis", user_id)
+
+
+class VersionCounters:
+    """In-process version per cached resource, bumped by ``DatabaseStore`` after each commit.
+
+    A bump makes this process's cached bodies for the resource unreachable
+    at once. The counters only see writes made by this process; writes
+    through another replica are picked up when the cached body expires
+    (see ``ResponseCache``).
+    """
+
+    def __init__(self) -> None:
+        self._versions: Dict[Hashable, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, *keys: Hashable) -> None:
+        with self._lock:
+            for key in keys:
+                self._versions[key] = self._versions.get(key, 0) + 1
@@ -0,0 +1,78 @@
+"""Recall@k against queries per second for ``IVFIndex`` compared with exact search.
+
+The corpus is drawn around ``--clusters`` random centres, as real embeddings
+are, and queries are perturbed corpus points. Recall@k is the share of the
+exact top-k that the IVF index returns. The index is built once, saved to a
+temporary directory and reopened memory-mapped, so the build and reopen
+times are reported as well.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_ann_search --size 200000 --nprobe 1 4 16 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from backend.backend_service.services.ivf_index import IVFIndex
+from backend.backend_service.services.vector_index import VectorIndex
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--lists", type=int, default=0, help="0 picks about sqrt(size)")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centres = rng.standard_normal((args.clusters, args.dim), dtype=np.float32)
+    labels = rng.integers(0, args.clusters, args.size)
+    corpus = centres[labels] + 1.0 * rng.standard_normal((args.size, args.dim), dtype=np.float32)
+    picks = rng.integers(0, args.size, args.queries)
+    queries = corpus[picks] + 0.5 * rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    items = [(f"id-{i}", row) for i, row in enumerate(corpus)]
+
+    exact = VectorIndex(initial_capacity=args.size)
+    exact.add_many(items)
+    start = time.perf_counter()
+    truth = [{hit for hit, _ in exact.search(query, args.k)} for query in queries]
+    exact_qps = args.queries / (time.perf_counter() - start)
+    print(f"exact     {exact_qps:9.0f} qps  recall@{args.k} 1.000")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = f"{directory}/ivf"
+        start = time.perf_counter()
+        built = IVFIndex(path=path, n_lists=args.lists, min_train_size=args.size)
+        built.ensure_loaded(lambda since: items)
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index = IVFIndex(path=path, n_lists=args.lists)
+        index.ensure_loaded(lambda since: [])
+        reopen_ms = (time.perf_counter() - start) * 1000
+        print(f"ivf build {build_s:.2f} s, memory-mapped reopen {reopen_ms:.1f} ms")
+
+        for nprobe in args.nprobe:
+            index.nprobe = nprobe
+            start = time.perf_counter()
+            results = [{hit for hit, _ in index.search(query, args.k)} for query in queries]
+            qps = args.queries / (time.perf_counter() - start)
+            recall = np.mean([len(found & exact_hits) / args.k for found, exact_hits in zip(results, truth)])
+            print(
+                f"nprobe {nprobe:>3} {qps:8.0f} qps  recall@{args.k} {recall:.3f}  "
+                f"({qps / exact_qps:.1f}x exact)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Backend throughput and latency with 500 requests in flight: async engine against sync sessions.
+
+One app is built per mode on the same temporary SQLite file. Each request is
+an authenticated ``GET /api/v1/rooms/{id}/messages`` (a room lookup and a
+history page; the bearer token resolves from the principal cache). ``--concurrency`` requests are kept in flight
+through ``httpx.ASGITransport``, so the numbers leave out sockets and
+uvicorn and compare only how each mode schedules database work.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_backend_concurrency --requests 5000 --concurrency 500
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+import httpx
+
+from backend.backend_service import create_app
+
+
+async def _seed(client: httpx.AsyncClient) -> tuple[dict, str]:
+    await client.post(
+        "/api/v1/auth/signup",
+        json={"email": "bench@example.com", "password": "secret", "display_name": "Bench"},
+    )
+    login = await client.post(
+        "/api/v1/auth/login", json={"email": "bench@example.com", "password": "secret"}
+    )
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+    room = await client.post("/api/v1/rooms", json={"name": "bench"}, headers=headers)
+    room_id = room.json()["id"]
+    for n in range(200):
+        await client.post(
+            f"/api/v1/rooms/{room_id}/messages", json={"text": f"message {n}"}, headers=headers
+        )
+    return headers, room_id
+
+
+async def _run(database_url: str, database_async: bool, args: argparse.Namespace) -> None:
+    app = create_app(database_url=database_url, database_async=database_async)
+    await app.router.startup()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", follow_redirects=True
+    ) as client:
+        headers, room_id = await _seed(client)
+        gate = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one() -> None:
+            async with gate:
+                start = time.perf_counter()
+                resp = await client.get(
+                    f"/api/v1/rooms/{room_id}/messages", params={"limit": 20}, headers=headers
+                )
+                latencies.append(time.perf_counter() - start)
+                assert resp.status_code == 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(args.requests)))
+        elapsed = time.perf_counter() - start
+    pool = app.state.pool_metrics.snapshot()
+    await app.router.shutdown()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    mode = "async" if database_async else "sync "
+    print(
+        f"{mode}: {args.requests / elapsed:7.0f} req/s, "
+        f"p50 {p50:7.1f} ms, p99 {p99:7.1f} ms at {args.concurrency} in flight; "
+        f"pool checkout {pool['checkout_seconds'] / max(pool['checkouts'], 1) * 1000:.2f} ms avg, "
+        f"{pool['timeouts']} timeouts"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=500)
+    args = parser.parse_args()
+
+    for database_async in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            asyncio.run(_run(f"sqlite:///{directory}/bench.db", database_async, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Encode cost per delivered message: per-recipient ``json.dumps`` vs. encode-once.
+
+A single message is broadcast to ``--recipients`` live sockets, replayed as
+history to ``--replays`` reconnecting clients and returned once over HTTP. The
+baseline mirrors the previous code path (``model_dump`` + ``json.dumps`` for the
+broadcast frame, again for every history replay, and FastAPI's own encoding for
+the HTTP body); the new path encodes the message once with
+``app.services.frames``.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_frame_encoding --recipients 2000 --replays 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+import uuid
+
+from fastapi.encoders import jsonable_encoder
+
+from app.schemas import BroadcastResponse, Message
+from app.services import frames
+
+
+def _message() -> Message:
+    return Message(
+        id=str(uuid.uuid4()),
+        roomId=str(uuid.uuid4()),
+        sender="nomi:Echo",
+        text="Echo echoes: " + "hello there " * 8,
+        embedding=[0.123456] * 8,
+        nomiId=str(uuid.uuid4()),
+    )
+
+
+def baseline(message: Message, recipients: int, replays: int) -> None:
+    payload = json.dumps({"type": "message", "payload": message.model_dump()})
+    for _ in range(recipients):
+        _ = payload
+    for _ in range(replays):
+        json.dumps({"type": "history", "payload": message.model_dump()})
+    json.dumps(jsonable_encoder(BroadcastResponse(delivered=recipients, message=message)))
+
+
+def encode_once(message: Message, recipients: int, replays: int) -> None:
+    encoded = frames.EncodedMessage(message)
+    payload = frames.message_frame(encoded)
+    for _ in range(recipients):
+        _ = payload
+    history_json = frames.encode_history([encoded])
+    for _ in range(replays):
+        frames.history_frame(history_json)
+    f'{{"delivered":{recipients},"message":{encoded.json}}}'
+
+
+def _measure(fn, messages, recipients: int, replays: int) -> float:
+    start = time.perf_counter()
+    for message in messages:
+        fn(message, recipients, replays)
+    elapsed = time.perf_counter() - start
+    delivered = len(messages) * (recipients + replays + 1)
+    return elapsed / delivered * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--recipients", type=int, default=100)
+    parser.add_argument("--replays", type=int, default=50)
+    args = parser.parse_args()
+
+    messages = [_message() for _ in range(args.messages)]
+    encoder = "orjson" if frames.orjson is not None else "json (stdlib)"
+    before = _measure(baseline, messages, args.recipients, args.replays)
+    after = _measure(encode_once, messages, args.recipients, args.replays)
+    print(f"encoder: {encoder}")
+    print(f"before: {before:8.1f} ns per delivered message")
+    print(f"after:  {after:8.1f} ns per delivered message ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
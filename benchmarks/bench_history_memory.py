@@ -0,0 +1,83 @@
+"""Bytes per retained message for the old and new room history layouts.
+
+The old layout kept a Python list of ``(Message, json)`` pairs per room and
+trimmed it with ``del history[:-limit]``. The new layout keeps a
+``RingBuffer`` of immutable ``EncodedMessage`` records holding only the
+sequence number and the wire JSON. Both are measured with ``tracemalloc``
+after filling ``--rooms`` rooms to ``--limit`` messages each.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_history_memory --limit 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tracemalloc
+import uuid
+from typing import Callable, List, Tuple
+
+from app.schemas import Message
+from app.services.frames import EncodedMessage, dumps
+from app.services.history import RingBuffer
+
+
+def _message(room_id: str, seq: int) -> Message:
+    return Message(
+        id=str(uuid.uuid4()),
+        roomId=room_id,
+        sender="client",
+        text=f"message number {seq} in this room",
+        seq=seq,
+    )
+
+
+def old_layout(rooms: int, limit: int) -> List[List[Tuple[Message, str]]]:
+    histories = []
+    for _ in range(rooms):
+        room_id = str(uuid.uuid4())
+        history: List[Tuple[Message, str]] = []
+        for seq in range(1, limit + 1):
+            message = _message(room_id, seq)
+            history.append((message, dumps(message.model_dump())))
+            if len(history) > limit:
+                del history[:-limit]
+        histories.append(history)
+    return histories
+
+
+def new_layout(rooms: int, limit: int) -> List[RingBuffer[EncodedMessage]]:
+    histories = []
+    for _ in range(rooms):
+        room_id = str(uuid.uuid4())
+        history: RingBuffer[EncodedMessage] = RingBuffer(limit)
+        for seq in range(1, limit + 1):
+            history.append(EncodedMessage(_message(room_id, seq)))
+        histories.append(history)
+    return histories
+
+
+def _bytes_per_message(build: Callable[[int, int], object], rooms: int, limit: int) -> float:
+    tracemalloc.start()
+    histories = build(rooms, limit)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del histories
+    return current / (rooms * limit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=10_000)
+    args = parser.parse_args()
+
+    before = _bytes_per_message(old_layout, args.rooms, args.limit)
+    after = _bytes_per_message(new_layout, args.rooms, args.limit)
+    print(f"old layout (list of Message + json): {before:7.0f} bytes/message")
+    print(f"new layout (ring of EncodedMessage): {after:7.0f} bytes/message")
+
+
+if __name__ == "__main__":
+    main()
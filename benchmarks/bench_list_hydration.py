@@ -0,0 +1,142 @@
+"""Cost of listing a large room: ORM hydration against column-projected rows.
+
+One room is filled with ``--messages`` rows in a temporary SQLite database
+and listed in a single page. The baseline loads ``models.Message`` objects
+and copies them field by field into ``schemas.Message``, as the store used
+to; ``DatabaseStore.list_messages`` selects the columns as tuples and builds
+each model in one pass. Both results are then serialized the way the route
+does. For each path the benchmark prints latency, the peak memory traced
+while building the page, and how many bytes and memory blocks the finished
+page still holds, with the three source files that allocated most of those
+blocks; the difference from the peak is what hydration allocated and threw
+away.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_list_hydration --messages 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+
+from backend.backend_service import models
+from backend.backend_service.database import create_session_factory
+from backend.backend_service.migrations import create_missing_indexes
+from backend.backend_service.schemas import Message
+from backend.backend_service.services.store import DatabaseStore
+
+_adapter = TypeAdapter(list[Message])
+
+
+def _orm_page(session, limit: int) -> list:
+    session.expunge_all()
+    records = session.execute(
+        select(models.Message)
+        .where(models.Message.room_id == "r")
+        .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        .limit(limit)
+    ).scalars().all()
+    records.reverse()
+    return [
+        Message(
+            id=record.id,
+            room_id=record.room_id,
+            sender_id=record.sender_id,
+            text=record.text,
+            content=record.content,
+            created_at=record.created_at,
+        )
+        for record in records
+    ]
+
+
+def _measure(build, repeat: int) -> tuple:
+    build()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        build()
+    build_ms = (time.perf_counter() - start) / repeat * 1000
+    page = build()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        _adapter.dump_json(page)
+    serialize_ms = (time.perf_counter() - start) / repeat * 1000
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    page = build()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    retained = sum(stat.size_diff for stat in diff)
+    blocks = sum(stat.count_diff for stat in diff)
+    top = sorted(diff, key=lambda stat: stat.count_diff, reverse=True)[:3]
+    del page
+    return build_ms, serialize_ms, peak, retained, blocks, top
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory = create_session_factory(f"sqlite:///{directory}/bench.db")
+        models.Base.metadata.create_all(bind=engine)
+        create_missing_indexes(engine)
+        session = session_factory()
+        session.add(models.User(id="u", email="u@example.com", hashed_password="x"))
+        session.add(models.Room(id="r", owner_id="u", name="bench"))
+        session.commit()
+        start_time = datetime(2024, 1, 1)
+        session.execute(
+            insert(models.Message),
+            [
+                {
+                    "id": str(uuid.uuid4()),
+                    "room_id": "r",
+                    "sender_id": "u",
+                    "text": f"message {n}",
+                    "content": {"kind": "text"} if n % 2 else None,
+                    "created_at": start_time + timedelta(milliseconds=n),
+                }
+                for n in range(args.messages)
+            ],
+        )
+        session.commit()
+
+        store = DatabaseStore(session)
+        paths = {
+            "orm objects": lambda: _orm_page(session, args.messages),
+            "column rows": lambda: store.list_messages("r", args.messages),
+        }
+        assert paths["orm objects"]() == paths["column rows"]()
+        for label, build in paths.items():
+            build_ms, serialize_ms, peak, retained, blocks, top = _measure(build, args.repeat)
+            print(
+                f"{label}: build {build_ms:7.1f} ms, serialize {serialize_ms:6.1f} ms, "
+                f"peak {peak / 1e6:6.1f} MB, page holds {retained / 1e6:5.1f} MB "
+                f"in {blocks} blocks ({blocks / args.messages:.1f} per message)"
+            )
+            for stat in top:
+                print(
+                    f"    {stat.count_diff:8d} blocks {stat.size_diff / 1e6:5.1f} MB  "
+                    f"{stat.traceback[0].filename}"
+                )
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Cost of one history page at increasing depth: keyset cursors against OFFSET.
+
+One room is filled with ``--messages`` rows in a temporary SQLite database.
+For each depth, the page that starts that far back is fetched with
+``DatabaseStore.list_messages(before=...)`` and with the equivalent
+``ORDER BY ... OFFSET`` query. Keyset pages should cost the same at every
+depth; OFFSET pages grow with the number of rows skipped.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_message_pages --messages 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, select
+
+from backend.backend_service import models
+from backend.backend_service.database import create_session_factory
+from backend.backend_service.migrations import create_missing_indexes
+from backend.backend_service.services.store import DatabaseStore
+
+
+def _timed(fn, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--page", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_factory = create_session_factory(f"sqlite:///{directory}/bench.db")
+        models.Base.metadata.create_all(bind=engine)
+        create_missing_indexes(engine)
+        session = session_factory()
+        session.add(models.User(id="u", email="u@example.com", hashed_password="x"))
+        session.add(models.Room(id="r", owner_id="u", name="bench"))
+        session.commit()
+        start_time = datetime(2024, 1, 1)
+        for start in range(0, args.messages, 50_000):
+            session.execute(
+                insert(models.Message),
+                [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "room_id": "r",
+                        "sender_id": "u",
+                        "text": f"message {n}",
+                        "created_at": start_time + timedelta(milliseconds=n),
+                    }
+                    for n in range(start, min(start + 50_000, args.messages))
+                ],
+            )
+        session.commit()
+
+        store = DatabaseStore(session)
+        ordered = (
+            select(models.Message)
+            .where(models.Message.room_id == "r")
+            .order_by(models.Message.created_at.desc(), models.Message.id.desc())
+        )
+        for fraction in (0.0, 0.1, 0.5, 0.99):
+            depth = int(args.messages * fraction)
+            edge = session.execute(ordered.offset(depth).limit(1)).scalar_one()
+            key = (edge.created_at, edge.id)
+            keyset_ms = _timed(lambda: store.list_messages("r", args.page, before=key), args.repeat)
+            offset_ms = _timed(
+                lambda: session.execute(ordered.offset(depth + 1).limit(args.page)).scalars().all(),
+                args.repeat,
+            )
+            print(
+                f"depth {depth:>9}: keyset {keyset_ms:7.2f} ms/page, offset {offset_ms:7.2f} ms/page"
+            )
+        session.close()
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Throughput of ``InMemoryStore`` under many rooms and many concurrent writers.
+
+Each writer task repeats the hot path of the broadcast endpoint: check that a
+room exists, look up a nomi, then append a message to the room. The
+"single lock" store reproduces the previous concurrency model, where every
+method (reads included) serialized on one ``asyncio.Lock``; the "striped"
+store is the current ``InMemoryStore``.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_store_contention --rooms 512 --writers 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Optional
+
+from app.schemas import CreateNomi, CreateRoom, Message, Nomi
+from app.services.store import InMemoryStore
+
+
+class SingleLockStore(InMemoryStore):
+    """Previous model: one store-wide lock around every read and write."""
+
+    def __init__(self, history_limit: int = 50) -> None:
+        super().__init__(history_limit=history_limit, lock_stripes=1)
+        self._global_lock = self._locks[0]
+
+    async def get_nomi(self, nomi_id: str) -> Optional[Nomi]:
+        async with self._global_lock:
+            return self._nomis.get(nomi_id)
+
+    async def room_exists(self, room_id: str) -> bool:
+        async with self._global_lock:
+            return room_id in self._rooms
+
+
+async def _run(store: InMemoryStore, rooms: int, writers: int, ops: int) -> float:
+    room_ids: List[str] = [
+        (await store.create_room(CreateRoom(name=f"room-{index}"))).id for index in range(rooms)
+    ]
+    nomi_id = (await store.create_nomi(CreateNomi(name="bench"))).id
+    rng = random.Random(0)
+    plan = [[rng.choice(room_ids) for _ in range(ops)] for _ in range(writers)]
+
+    async def writer(targets: List[str]) -> None:
+        for room_id in targets:
+            await store.room_exists(room_id)
+            await store.get_nomi(nomi_id)
+            await store.append_room_message(
+                room_id, Message(id="m", roomId=room_id, sender="bench", text="hello")
+            )
+            # give other writers a turn, as a request handler would between awaits
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(writer(targets) for targets in plan))
+    return writers * ops / (time.perf_counter() - start)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rooms", type=int, default=512)
+    parser.add_argument("--writers", type=int, default=1000)
+    parser.add_argument("--ops", type=int, default=50, help="appends per writer")
+    args = parser.parse_args()
+
+    for label, store in (
+        ("single lock", SingleLockStore()),
+        ("striped", InMemoryStore()),
+    ):
+        throughput = asyncio.run(_run(store, args.rooms, args.writers, args.ops))
+        print(f"{label:>12}: {throughput:10.0f} appends/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Query latency and memory of the exact ``VectorIndex`` at 100k and 1M vectors.
+
+For each corpus size the index is filled with random vectors, then timed on
+``--queries`` random queries with ``argpartition`` top-k (the index) and with
+a full ``argsort`` over all scores for comparison. Memory is the size of the
+float32 matrix plus the id bookkeeping, measured with ``tracemalloc``.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_vector_search --dim 384 --sizes 100000 1000000
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+
+from backend.backend_service.services.vector_index import VectorIndex
+
+
+def _fill(size: int, dim: int, rng: np.random.Generator) -> VectorIndex:
+    index = VectorIndex(initial_capacity=size)
+    chunk = 50_000
+    for start in range(0, size, chunk):
+        block = rng.standard_normal((min(chunk, size - start), dim), dtype=np.float32)
+        index.add_many((f"id-{start + offset}", row) for offset, row in enumerate(block))
+    return index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for size in args.sizes:
+        tracemalloc.start()
+        index = _fill(size, args.dim, rng)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        start = time.perf_counter()
+        for query in queries:
+            index.search(query, args.k)
+        top_k_ms = (time.perf_counter() - start) / args.queries * 1000
+
+        matrix = index._matrix[: len(index)]
+        start = time.perf_counter()
+        for query in queries:
+            np.argsort(matrix @ (query / np.linalg.norm(query)))[::-1][: args.k]
+        full_sort_ms = (time.perf_counter() - start) / args.queries * 1000
+
+        print(
+            f"{size:>9} vectors x {args.dim}: "
+            f"argpartition {top_k_ms:7.2f} ms/query, full argsort {full_sort_ms:7.2f} ms/query, "
+            f"memory {memory / 2**20:8.1f} MiB"
+        )
+        del index, matrix
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,125 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from sentence_transformers import SentenceTransformer
-import numpy as np
+
+MODEL_NAME = os.getenv("EMBEDDINGS_MODEL", "all-MiniLM-L6-v2")
+# "inline" runs inference on the event loop, "thread"/"process" run it in a pool
+EXECUTOR_KIND = os.getenv("EMBEDDINGS_EXECUTOR", "process")
+EXECUTOR_WORKERS = int(os.getenv("EMBEDDINGS_WORKERS", "1"))
 
 app = FastAPI(title="AI Rooms Embeddings Worker", version="1.0.0")
 
 class EmbedRequest(BaseModel):
     text: str
-    model: str = "all-MiniLM-L6-v2"
+    model: str = MODEL_NAME
 
 class EmbedResponse(BaseModel):
     embeddings: list[float]
 
-# Load model
-model = SentenceTransformer(model)
+class BatchEmbedItem(BaseModel):
+    text: str
+    metadata: dict[str, str] = Field(default_factory=dict)
+
+class BatchEmbedRequest(BaseModel):
+    items: list[BatchEmbedItem] = Field(min_length=1, max_length=1024)
+    model: str = MODEL_NAME
+
+class BatchEmbedResult(BaseModel):
+    index: int
+    embeddings: Optional[list[float]] = None
+    metadata: dict[str, str] = Field(default_factory=dict)
+    error: Optional[str] = None
+
+class BatchEmbedResponse(BaseModel):
+    results: list[BatchEmbedResult]
+
+# Model for this process; each process-pool worker loads its own copy once
+model: Optional[SentenceTransformer] = None
+executor: Optional[Executor] = None
+
+
+def load_model(name: str) -> None:
+    global model
+    model = SentenceTransformer(name)
+
+
+def encode_batch(texts: List[str]) -> List[List[float]]:
+    assert model is not None, "model not loaded in this worker"
+    return model.encode(texts).tolist()
+
+
+def create_executor(kind: str, workers: int) -> Optional[Executor]:
+    if kind == "inline":
+        load_model(MODEL_NAME)
+        return None
+    if kind == "thread":
+        # threads share this process, so the model is loaded once up front
+        load_model(MODEL_NAME)
+        return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embeddings")
+    if kind == "process":
+        return ProcessPoolExecutor(
+            max_workers=workers, initializer=load_model, initargs=(MODEL_NAME,)
+        )
+    raise ValueError(f"unknown executor kind: {kind}")
+
+
+async def run_batch(texts: List[str]) -> List[List[float]]:
+    if executor is None:
+        return encode_batch(texts)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, encode_batch, texts)
+
+
+@app.on_event("startup")
+async def on_startup() -> None:
+    global executor
+    executor = create_executor(EXECUTOR_KIND, EXECUTOR_WORKERS)
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
 
 @app.post("/embed", response_model=EmbedResponse)
 async def embed_text(request: EmbedRequest):
+    if request.model != MODEL_NAME:
+        raise HTTPException(status_code=400, detail=f"model {request.model!r} is not loaded")
     try:
-        embeddings = model.encode(request.text)
-        return EmbedResponse(embeddings=embeddings.tolist())
+        embeddings = await run_batch([request.text])
+        return EmbedResponse(embeddings=embeddings[0])
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/embed/batch", response_model=BatchEmbedResponse)
+async def embed_batch(request: BatchEmbedRequest):
+    if request.model != MODEL_NAME:
+        raise HTTPException(status_code=400, detail=f"model {request.model!r} is not loaded")
+    results = [
+        BatchEmbedResult(index=index, metadata=item.metadata)
+        for index, item in enumerate(request.items)
+    ]
+    accepted = []
+    for result, item in zip(results, request.items):
+        if item.text.strip():
+            accepted.append(result)
+        else:
+            result.error = "text must not be empty"
+    if accepted:
+        # one encode call for the whole request keeps inference vectorized
+        try:
+            vectors = await run_batch([request.items[result.index].text for result in accepted])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        for result, vector in zip(accepted, vectors):
+            result.embeddings = vector
+    return BatchEmbedResponse(results=results)
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -31,4 +128,4 @@ async def health_check():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8003)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8003)
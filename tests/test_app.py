@@ -1,7 +1,22 @@
+import asyncio
+import json
+import threading
+
+import httpx
 import pytest
 from fastapi.testclient import TestClient
 
+from app.core.config import get_settings
 from app.main import create_app
+from app.schemas import CreateNomi, CreateRoom, Message
+from app.services import frames
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embeddings import EmbeddingsOverloaded, EmbeddingsWorker
+from app.services.executors import EXECUTOR_PROCESS, EXECUTOR_THREAD
+from app.services.frames import EncodedMessage
+from app.services.history import RingBuffer
+from app.services.rooms import SLOW_CONSUMER_CLOSE_CODE, RoomManager
+from app.services.store import InMemoryStore
 
 
 @pytest.fixture()
@@ -56,3 +71,459 @@ def test_end_to_end_flow(client: TestClient) -> None:
     vector = embed_resp.json()["embedding"]
     assert isinstance(vector, list)
     assert len(vector) == 8
+
+
+def test_room_websocket_receives_broadcast(client: TestClient) -> None:
+    room_id = client.post("/api/v1/rooms", json={"name": "Live"}).json()["id"]
+    client.post(f"/api/v1/rooms/{room_id}/broadcast", json={"messageText": "earlier"})
+
+    with client.websocket_connect(f"/ws/rooms/{room_id}") as websocket:
+        history = websocket.receive_json()
+        assert history["type"] == "history"
+        assert [item["text"] for item in history["payload"]] == ["earlier"]
+
+        broadcast_resp = client.post(
+            f"/api/v1/rooms/{room_id}/broadcast",
+            json={"messageText": "ping"},
+        )
+        assert broadcast_resp.json()["delivered"] == 1
+        frame = websocket.receive_json()
+        assert frame["type"] == "message"
+        assert frame["payload"]["text"] == "ping"
+
+
+class _StalledWebSocket:
+    """Fake socket that takes the history frame, then stops reading like a stuck client."""
+
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+        self.closed_with = None
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, payload: str) -> None:
+        if self.sent:
+            await asyncio.Event().wait()
+        self.sent.append(payload)
+
+    async def close(self, code: int = 1000) -> None:
+        self.closed_with = code
+
+
+def test_room_manager_overflow_policies() -> None:
+    closing: list[int] = []
+
+    async def scenario(policy: str) -> tuple[dict, _StalledWebSocket]:
+        manager = RoomManager(InMemoryStore(), queue_size=2, overflow_policy=policy)
+        websocket = _StalledWebSocket()
+        await manager.connect("room", websocket)
+        message = EncodedMessage(Message(id="m", roomId="room", sender="system", text="hi"))
+        for _ in range(5):
+            await manager.broadcast("room", message)
+        # close tasks are held by the manager until they finish
+        closing.append(len(manager._closing))
+        await asyncio.sleep(0)
+        await asyncio.gather(*manager._closing)
+        closing.append(len(manager._closing))
+        return manager.room_stats("room"), websocket
+
+    stats, websocket = asyncio.run(scenario("drop"))
+    # two frames fit the queue and the rest are dropped; the writer holds one
+    assert stats == {"connections": 1, "queue_depth": 1, "dropped": 3, "disconnected": 0}
+    assert websocket.closed_with is None
+
+    stats, websocket = asyncio.run(scenario("disconnect"))
+    assert stats["connections"] == 0
+    assert stats["disconnected"] == 1
+    assert websocket.closed_with == SLOW_CONSUMER_CLOSE_CODE
+    assert closing == [0, 0, 1, 0]
+
+
+class _RecordingWebSocket:
+    def __init__(self) -> None:
+        self.sent: list[dict] = []
+
+    async def accept(self) -> None:
+        pass
+
+    async def send_text(self, payload: str) -> None:
+        self.sent.append(json.loads(payload))
+
+
+def test_room_connect_skips_live_frames_already_in_history(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def scenario() -> _RecordingWebSocket:
+        store = InMemoryStore()
+        manager = RoomManager(store)
+        read_history = store.get_room_history_json_through
+
+        async def racing_read(room_id: str) -> tuple:
+            # a message posted after the socket registered but before history is
+            # read is both in the history and queued as a live frame
+            encoded = await store.append_room_message(
+                room_id, Message(id="m1", roomId=room_id, sender="system", text="one")
+            )
+            history = await read_history(room_id)
+            await manager.broadcast(room_id, encoded)
+            return history
+
+        monkeypatch.setattr(store, "get_room_history_json_through", racing_read)
+        websocket = _RecordingWebSocket()
+        await manager.connect("room", websocket)
+        encoded = await store.append_room_message(
+            "room", Message(id="m2", roomId="room", sender="system", text="two")
+        )
+        await manager.broadcast("room", encoded)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        await manager.disconnect("room", websocket)
+        return websocket
+
+    websocket = asyncio.run(scenario())
+    assert [frame["type"] for frame in websocket.sent] == ["history", "message"]
+    assert [item["id"] for item in websocket.sent[0]["payload"]] == ["m1"]
+    assert websocket.sent[1]["payload"]["id"] == "m2"
+
+
+def test_room_fan_out_settings_reach_the_room_manager(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setenv("AI_ROOMS_ROOM_QUEUE_SIZE", "8")
+    monkeypatch.setenv("AI_ROOMS_ROOM_OVERFLOW_POLICY", "disconnect")
+    get_settings.cache_clear()
+    try:
+        manager = create_app().state.room_manager
+        assert (manager._queue_size, manager._overflow_policy) == (8, "disconnect")
+        manager = create_app(room_queue_size=4, room_overflow_policy="drop").state.room_manager
+        assert (manager._queue_size, manager._overflow_policy) == (4, "drop")
+    finally:
+        get_settings.cache_clear()
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_encoded_message_matches_model(monkeypatch: pytest.MonkeyPatch, use_orjson: bool) -> None:
+    if not use_orjson:
+        monkeypatch.setattr(frames, "orjson", None)
+    message = Message(id="m", roomId="r", sender="système", text="hi", embedding=[0.5])
+    encoded = EncodedMessage(message)
+    assert json.loads(encoded.json) == message.model_dump()
+    assert json.loads(frames.message_frame(encoded)) == {
+        "type": "message",
+        "payload": message.model_dump(),
+    }
+
+
+def test_history_json_is_cached_until_next_append() -> None:
+    async def scenario() -> None:
+        store = InMemoryStore()
+        first = await store.get_room_history_json("room")
+        assert first == "[]"
+        assert await store.get_room_history_json("room") is first
+
+        await store.append_room_message(
+            "room", Message(id="m", roomId="room", sender="system", text="hi")
+        )
+        updated = await store.get_room_history_json("room")
+        assert [item["id"] for item in json.loads(updated)] == ["m"]
+        assert await store.get_room_history_json("room") is updated
+
+    asyncio.run(scenario())
+
+
+def test_history_after_sequence() -> None:
+    async def scenario() -> None:
+        store = InMemoryStore(history_limit=3)
+        for index in range(5):
+            await store.append_room_message(
+                "room", Message(id=f"m{index}", roomId="room", sender="system", text="hi")
+            )
+        # seqs 3..5 are retained
+        gap, through = await store.get_room_history_after("room", 3)
+        assert [item["seq"] for item in json.loads(gap)] == [4, 5]
+        assert through == 5
+        assert await store.get_room_history_after("room", 5) == ("[]", 5)
+        assert await store.get_room_history_after("room", 1) is None
+        assert await store.get_room_history_after("room", 9) is None
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("lock_stripes", [1, 3, 64])
+def test_room_history_keeps_per_room_order_across_lock_stripes(lock_stripes: int) -> None:
+    rooms = [f"room-{index}" for index in range(8)]
+
+    async def write(store: InMemoryStore, room_id: str) -> None:
+        for index in range(20):
+            await store.append_room_message(
+                room_id, Message(id=f"{room_id}/{index}", roomId=room_id, sender="system", text="hi")
+            )
+            await asyncio.sleep(0)
+
+    async def read(store: InMemoryStore, snapshots: list) -> None:
+        for _ in range(40):
+            for room_id in rooms:
+                snapshots.append([item.seq for item in await store.get_room_messages(room_id)])
+            await asyncio.sleep(0)
+
+    async def scenario() -> tuple:
+        store = InMemoryStore(lock_stripes=lock_stripes)
+        snapshots: list = []
+        await asyncio.gather(
+            *(write(store, room_id) for room_id in rooms), read(store, snapshots)
+        )
+        histories = {room_id: await store.get_room_messages(room_id) for room_id in rooms}
+        return histories, snapshots
+
+    histories, snapshots = asyncio.run(scenario())
+    for room_id, history in histories.items():
+        assert [item.seq for item in history] == list(range(1, 21))
+        assert [json.loads(item.json)["id"] for item in history] == [
+            f"{room_id}/{index}" for index in range(20)
+        ]
+    # every snapshot taken mid-write is a gap-free prefix of its room's history
+    assert all(seqs == list(range(1, len(seqs) + 1)) for seqs in snapshots)
+
+
+def test_store_reads_do_not_wait_on_room_locks() -> None:
+    async def scenario() -> None:
+        store = InMemoryStore(lock_stripes=4)
+        nomi = await store.create_nomi(CreateNomi(name="Echo"))
+        room = await store.create_room(CreateRoom(name="Lobby"))
+        busy = "busy"
+        idle = next(
+            f"room-{index}"
+            for index in range(100)
+            if store._room_lock(f"room-{index}") is not store._room_lock(busy)
+        )
+        async with store._room_lock(busy):
+            # another stripe is unaffected, and nomis and rooms take no lock at all
+            assert await asyncio.wait_for(store.get_room_messages(idle), 1) == ()
+            for lock in store._locks:
+                if not lock.locked():
+                    await lock.acquire()
+            assert await asyncio.wait_for(store.get_nomi(nomi.id), 1) == nomi
+            assert await asyncio.wait_for(store.room_exists(room.id), 1)
+            assert await asyncio.wait_for(store.list_rooms(), 1) == [room]
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(store.get_room_messages(busy), 0.05)
+            for lock in store._locks:
+                if lock is not store._room_lock(busy):
+                    lock.release()
+        assert await store.get_room_messages(busy) == ()
+
+    asyncio.run(scenario())
+
+
+def test_room_websocket_resume(client: TestClient) -> None:
+    room_id = client.post("/api/v1/rooms", json={"name": "Resume"}).json()["id"]
+    for text in ("one", "two", "three"):
+        client.post(f"/api/v1/rooms/{room_id}/broadcast", json={"messageText": text})
+
+    with client.websocket_connect(f"/ws/rooms/{room_id}?after=2") as websocket:
+        gap = websocket.receive_json()
+        assert gap["type"] == "history"
+        assert [(item["seq"], item["text"]) for item in gap["payload"]] == [(3, "three")]
+
+
+def test_ring_buffer_wraps_and_snapshots() -> None:
+    ring: RingBuffer[int] = RingBuffer(3)
+    for value in range(5):
+        ring.append(value)
+    assert len(ring) == 3
+    assert ring.first() == 2
+    assert ring.snapshot() == (2, 3, 4)
+    assert ring.tail(2) == (3, 4)
+    assert ring.tail(10) == (2, 3, 4)
+
+    encoded = EncodedMessage(Message(id="m", sender="system", text="hi", seq=7))
+    with pytest.raises(AttributeError):
+        encoded.json = "{}"
+
+
+def test_embeddings_worker_batches_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    batch_sizes: list[int] = []
+    compute_batch = EmbeddingsWorker._compute_batch.__func__
+
+    def recording_batch(cls, texts):
+        batch_sizes.append(len(texts))
+        return compute_batch(cls, texts)
+
+    monkeypatch.setattr(EmbeddingsWorker, "_compute_batch", classmethod(recording_batch))
+
+    async def scenario() -> list:
+        worker = EmbeddingsWorker(max_batch_size=4, runners=2)
+        await worker.start()
+        try:
+            return await asyncio.gather(*(worker.embed(f"text {i}") for i in range(10)))
+        finally:
+            await worker.shutdown()
+
+    vectors = asyncio.run(scenario())
+    assert vectors == [EmbeddingsWorker._compute_embedding(f"text {i}") for i in range(10)]
+    assert sum(batch_sizes) == 10
+    assert max(batch_sizes) == 4
+
+
+def test_embeddings_worker_rejects_when_full(client: TestClient) -> None:
+    async def scenario() -> list:
+        worker = EmbeddingsWorker(max_queue_size=2)
+        await worker.start()
+        try:
+            return await asyncio.gather(
+                *(worker.embed(f"text {i}") for i in range(3)), return_exceptions=True
+            )
+        finally:
+            await worker.shutdown()
+
+    results = asyncio.run(scenario())
+    assert isinstance(results[2], EmbeddingsOverloaded)
+    assert all(isinstance(result, list) for result in results[:2])
+
+    async def overloaded(text: str) -> list:
+        raise EmbeddingsOverloaded("embeddings queue is full")
+
+    client.app.state.embeddings_worker.embed = overloaded
+    resp = client.post("/api/v1/embeddings", json={"text": "ping"})
+    assert resp.status_code == 429
+
+
+def test_embedding_cache_hits_and_coalesces() -> None:
+    async def scenario() -> EmbeddingsWorker:
+        worker = EmbeddingsWorker()
+        await worker.start()
+        try:
+            first, second = await asyncio.gather(worker.embed("hello"), worker.embed("hello"))
+            assert first == second == EmbeddingsWorker._compute_embedding("hello")
+            await worker.embed("hello")
+        finally:
+            await worker.shutdown()
+        return worker
+
+    stats = asyncio.run(scenario()).stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 1, 1)
+    assert stats["entries"] == 1
+
+
+def test_embedding_cache_evicts_by_size_and_age() -> None:
+    now = [0.0]
+    tiny = EmbeddingCache(max_bytes=1)
+    cache = EmbeddingCache(max_bytes=10_000, ttl_seconds=10, clock=lambda: now[0])
+
+    async def compute() -> list:
+        return [0.5] * 8
+
+    async def scenario() -> None:
+        # an entry larger than the whole budget is never stored
+        await tiny.get_or_compute("m", "a", compute)
+        assert tiny.stats()["entries"] == 0
+
+        await cache.get_or_compute("m", "a", compute)
+        await cache.get_or_compute("m", "a", compute)
+        assert cache.hits == 1
+        now[0] = 11.0
+        await cache.get_or_compute("m", "a", compute)
+        assert cache.misses == 2
+
+    asyncio.run(scenario())
+
+
+def test_health_is_served_while_a_batch_is_blocked(monkeypatch: pytest.MonkeyPatch) -> None:
+    started, release = threading.Event(), threading.Event()
+
+    def blocked_batch(cls, texts):
+        # stands in for model inference, which releases the GIL
+        started.set()
+        release.wait(timeout=5)
+        return [cls._compute_embedding(text) for text in texts]
+
+    monkeypatch.setattr(EmbeddingsWorker, "_compute_batch", classmethod(blocked_batch))
+
+    async def scenario() -> tuple[bool, int]:
+        app = create_app()
+        worker = app.state.embeddings_worker = EmbeddingsWorker(executor=EXECUTOR_THREAD)
+        await worker.start()
+        transport = httpx.ASGITransport(app=app)
+        try:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                embedding = asyncio.create_task(http.post("/api/v1/embeddings", json={"text": "t"}))
+                while not started.is_set():
+                    await asyncio.sleep(0.01)
+                assert (await http.get("/health")).status_code == 200
+                # health was answered while the batch was still held in the executor
+                served_while_blocked = not embedding.done()
+                release.set()
+                status_code = (await embedding).status_code
+        finally:
+            release.set()
+            await worker.shutdown()
+        return served_while_blocked, status_code
+
+    assert asyncio.run(scenario()) == (True, 200)
+
+
+def test_process_executor_computes_batches() -> None:
+    async def scenario() -> list:
+        worker = EmbeddingsWorker(executor=EXECUTOR_PROCESS, executor_workers=1)
+        await worker.start()
+        try:
+            return await worker.embed_many([f"text {i}" for i in range(8)])
+        finally:
+            await worker.shutdown()
+
+    vectors = asyncio.run(scenario())
+    assert vectors == [EmbeddingsWorker._compute_embedding(f"text {i}") for i in range(8)]
+
+
+def test_embeddings_batch_preserves_order(client: TestClient) -> None:
+    texts = ["alpha", "beta", "alpha", "gamma"]
+    resp = client.post(
+        "/api/v1/embeddings/batch",
+        json={"items": [{"text": text, "metadata": {"n": str(i)}} for i, text in enumerate(texts)]},
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+    assert [result["metadata"]["n"] for result in results] == ["0", "1", "2", "3"]
+    assert [result["embedding"] for result in results] == [
+        EmbeddingsWorker._compute_embedding(text) for text in texts
+    ]
+    assert all(result["error"] is None for result in results)
+
+
+def test_embeddings_batch_is_admitted_whole(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    batch_sizes: list[int] = []
+    compute_batch = EmbeddingsWorker._compute_batch.__func__
+
+    def recording_batch(cls, texts):
+        batch_sizes.append(len(texts))
+        return compute_batch(cls, texts)
+
+    monkeypatch.setattr(EmbeddingsWorker, "_compute_batch", classmethod(recording_batch))
+
+    async def scenario() -> list:
+        worker = EmbeddingsWorker(max_batch_size=4, max_queue_size=1)
+        await worker.start()
+        try:
+            return await asyncio.gather(
+                worker.embed_many([f"a{i}" for i in range(10)]),
+                worker.embed_many([f"b{i}" for i in range(10)]),
+                return_exceptions=True,
+            )
+        finally:
+            await worker.shutdown()
+
+    first, second = asyncio.run(scenario())
+    # the first batch takes the only queue slot and is computed in one call;
+    # the second is rejected as a whole rather than item by item
+    assert first == [EmbeddingsWorker._compute_embedding(f"a{i}") for i in range(10)]
+    assert isinstance(second, EmbeddingsOverloaded)
+    assert batch_sizes == [10]
+
+    async def overloaded(texts: list) -> list:
+        raise EmbeddingsOverloaded("embeddings queue is full")
+
+    client.app.state.embeddings_worker.embed_many = overloaded
+    resp = client.post("/api/v1/embeddings/batch", json={"items": [{"text": "ping"}]})
+    assert resp.status_code == 429
@@ -1,12 +1,43 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import numpy as np
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, insert, inspect, select, text
+from sqlalchemy.exc import TimeoutError as SQLAlchemyTimeoutError
 
+from app.services.embedding_cache import EmbeddingCache
 from backend.backend_service import create_app
+from backend.backend_service.config import Settings
+from backend.backend_service.database import create_session_factory, install_full_text_search
+from backend.backend_service.dependencies import open_store
+from backend.backend_service.migrations import upgrade_embedding_vectors
+from backend.backend_service.models import Base, Embedding, RoomMember, User
+from backend.backend_service.schemas import MessageCreate, NomiCreate, RoomCreate, UserCreate
+from backend.backend_service.services import embeddings as embedding_service
+from backend.backend_service.services.embeddings import DETERMINISTIC_MODEL, deterministic_embedding
+from backend.backend_service.services.cursors import encode_cursor
+from backend.backend_service.services.http_cache import ResponseCache
+from backend.backend_service.services.ivf_index import IVFIndex
+from backend.backend_service.services.passwords import PasswordHasher, PasswordHasherBusy
+from backend.backend_service.services.pool_metrics import PoolMetrics
+from backend.backend_service.services.principals import Principal, PrincipalCache
+from backend.backend_service.services.store import DatabaseStore
+from backend.backend_service.services.usage import UsageBatch, UsageRecorder
+from backend.backend_service.services.vector_codec import VECTOR_INT8, decode_vector, encode_vector
+from backend.backend_service.services.vector_index import VectorIndex
 
 
-@pytest.fixture()
-def client() -> TestClient:
-    app = create_app(database_url="sqlite:///:memory:")
+@pytest.fixture(params=[True, False], ids=["async", "sync"])
+def client(request) -> TestClient:
+    app = create_app(database_url="sqlite:///:memory:", database_async=request.param)
     with TestClient(app) as test_client:
         yield test_client
 
@@ -108,3 +139,931 @@ def test_requires_auth(client: TestClient) -> None:
     _, token = authenticated_client(client)
     authed_resp = client.get("/api/v1/rooms", headers=auth_headers(token))
     assert authed_resp.status_code == 200
+
+
+def test_embedding_cache_single_flight() -> None:
+    cache = EmbeddingCache()
+    release = threading.Event()
+    calls: list[str] = []
+
+    async def slow_embedding() -> list[float]:
+        calls.append("hi")
+        await asyncio.to_thread(release.wait, 5)
+        return deterministic_embedding("hi")
+
+    def embed_on_own_loop() -> list[float]:
+        return asyncio.run(cache.get_or_compute(DETERMINISTIC_MODEL, "hi", slow_embedding))
+
+    # each caller waits on a different thread and event loop
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(embed_on_own_loop) for _ in range(4)]
+        while cache.stats()["coalesced"] < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert calls == ["hi"]
+    assert all(result == deterministic_embedding("hi") for result in results)
+    embed_on_own_loop()
+    stats = cache.stats()
+    assert (stats["misses"], stats["coalesced"], stats["hits"]) == (1, 3, 1)
+
+
+def test_embedding_routes_wait_off_the_event_loop(tmp_path, monkeypatch) -> None:
+    url = f"sqlite:///{tmp_path}/embed.db"
+    with TestClient(create_app(database_url=url)) as client:
+        _, token = authenticated_client(client)
+    started, release = threading.Event(), threading.Event()
+
+    def blocked_embeddings(texts: list[str]) -> list[list[float]]:
+        started.set()
+        release.wait(timeout=5)
+        return [deterministic_embedding(text) for text in texts]
+
+    monkeypatch.setattr(embedding_service, "deterministic_embeddings", blocked_embeddings)
+    app = create_app(database_url=url)
+
+    async def scenario() -> tuple[bool, list[int]]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+            # the second search coalesces onto the first one's computation
+            searches = [
+                asyncio.create_task(
+                    http.get("/api/v1/search", params={"query": "q"}, headers=auth_headers(token))
+                )
+                for _ in range(2)
+            ]
+            while not started.is_set():
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.05)
+            assert (await http.get("/health")).status_code == 200
+            # had either search blocked the loop, health could only be answered
+            # after the release, by which point both searches would be done
+            served_while_blocked = not any(search.done() for search in searches)
+            release.set()
+            statuses = [response.status_code for response in await asyncio.gather(*searches)]
+        app.state.engine.dispose()
+        return served_while_blocked, statuses
+
+    assert asyncio.run(scenario()) == (True, [200, 200])
+    assert app.state.embedding_cache.stats()["coalesced"] == 1
+
+
+def test_embeddings_batch(client: TestClient) -> None:
+    client, token = authenticated_client(client)
+    items = [{"text": f"doc {i}", "metadata": {"n": str(i)}} for i in range(5)]
+    items.insert(2, {"text": "   "})
+
+    resp = client.post(
+        "/api/v1/embeddings/batch",
+        json={"items": items},
+        headers=auth_headers(token),
+    )
+    assert resp.status_code == 201
+    results = resp.json()["results"]
+    assert [result["index"] for result in results] == list(range(6))
+    assert results[2]["status"] == "error"
+    assert results[2]["id"] is None
+    created = [result for result in results if result["status"] == "created"]
+    assert len(created) == 5
+    assert len({result["id"] for result in created}) == 5
+
+    search_resp = client.get(
+        "/api/v1/search", params={"query": "doc 3", "k": 1}, headers=auth_headers(token)
+    )
+    assert search_resp.json()[0]["id"] == results[4]["id"]
+    assert search_resp.json()[0]["metadata"] == {"n": "3"}
+
+
+def test_vector_index_top_k_matches_full_sort() -> None:
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(500, 16)).astype(np.float32)
+    index = VectorIndex(initial_capacity=8)
+    index.add_many((f"v{i}", vector) for i, vector in enumerate(vectors))
+    query = rng.normal(size=16)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(normalized @ (query / np.linalg.norm(query)))[::-1][:10]
+    hits = index.search(query, 10)
+    assert [record_id for record_id, _ in hits] == [f"v{i}" for i in expected]
+    assert hits[0][1] >= hits[-1][1]
+
+    index.add("v0", query)
+    assert index.search(query, 1)[0] == ("v0", pytest.approx(1.0))
+    assert len(index) == 500
+
+
+def _clustered(rng: np.random.Generator, size: int, dim: int = 16) -> np.ndarray:
+    centers = rng.normal(size=(32, dim))
+    return (centers[rng.integers(0, 32, size)] + 0.1 * rng.normal(size=(size, dim))).astype(
+        np.float32
+    )
+
+
+def test_ivf_index_recall_and_exact_with_all_lists() -> None:
+    rng = np.random.default_rng(1)
+    vectors = _clustered(rng, 2000)
+    exact = VectorIndex()
+    ivf = IVFIndex(n_lists=32, nprobe=32, min_train_size=1000)
+    items = [(f"v{i}", vector) for i, vector in enumerate(vectors)]
+    exact.add_many(items)
+    ivf.add_many(items[:1500])
+    ivf.add_many(items[1500:])
+    ivf.wait_for_merge()
+    assert ivf.trained and len(ivf) == 2000
+
+    queries = vectors[:20] + 0.1 * rng.normal(size=(20, 16)).astype(np.float32)
+    for query in queries:
+        assert [hit for hit, _ in ivf.search(query, 10)] == [hit for hit, _ in exact.search(query, 10)]
+
+    ivf.nprobe = 4
+    found = sum(
+        len({hit for hit, _ in ivf.search(query, 10)} & {hit for hit, _ in exact.search(query, 10)})
+        for query in queries
+    )
+    assert found / (10 * len(queries)) >= 0.9
+
+
+def test_ivf_index_reopens_from_disk(tmp_path) -> None:
+    rng = np.random.default_rng(2)
+    vectors = _clustered(rng, 600)
+    path = str(tmp_path / "ivf")
+    first = IVFIndex(path=path, n_lists=8, nprobe=8, min_train_size=500)
+    first.ensure_loaded(lambda since: [(f"v{i}", vector) for i, vector in enumerate(vectors)])
+    first.wait_for_merge()
+    assert first.trained and len(first) == 600
+    first.flush()
+
+    requested = []
+
+    def rows(since):
+        requested.append(since)
+        # the overlap window hands back rows the saved lists already hold
+        return [("v599", vectors[599]), ("late", vectors[0])]
+
+    second = IVFIndex(path=path, n_lists=8, nprobe=8, min_train_size=500)
+    second.ensure_loaded(rows)
+    assert requested[0] is not None
+    assert len(second) == 601
+    assert isinstance(second._lists.vectors, np.memmap)
+    query = vectors[10]
+    assert second.search(query, 5)[:1] == first.search(query, 5)[:1]
+    assert {hit for hit, _ in second.search(vectors[0], 2)} == {"v0", "late"}
+
+
+def test_ivf_merge_runs_off_the_insert_path(tmp_path, monkeypatch) -> None:
+    vectors = _clustered(np.random.default_rng(4), 700)
+    items = [(f"v{i}", vector) for i, vector in enumerate(vectors)]
+    path = str(tmp_path / "ivf")
+    index = IVFIndex(path=path, n_lists=8, nprobe=8, min_train_size=500)
+    index.ensure_loaded(lambda since: [])
+    release = threading.Event()
+    merged = IVFIndex._merged
+
+    def held_merge(self, lists, pending):
+        release.wait(timeout=5)
+        return merged(self, lists, pending)
+
+    monkeypatch.setattr(IVFIndex, "_merged", held_merge)
+    index.add_many(items[:500])
+    # the merge this started is held, yet inserts and searches go on
+    index.add_many(items[500:])
+    assert not index.trained and len(index) == 700
+    assert index.search(vectors[10], 1)[0][0] == "v10"
+    assert index.search(vectors[650], 1)[0][0] == "v650"
+
+    release.set()
+    index.wait_for_merge()
+    assert index.trained and len(index) == 700
+    assert index.search(vectors[650], 1)[0][0] == "v650"
+    # only the current save is left beside the path
+    assert os.path.islink(path)
+    assert sorted(os.listdir(tmp_path)) == sorted(["ivf", "ivf.lock", os.readlink(path)])
+
+
+def test_ivf_saves_to_a_shared_path(tmp_path) -> None:
+    vectors = _clustered(np.random.default_rng(5), 600)
+    path = str(tmp_path / "ivf")
+    writers = [IVFIndex(path=path, n_lists=8, min_train_size=500) for _ in range(4)]
+    for writer in writers:
+        writer.ensure_loaded(lambda since: [])
+    for n, writer in enumerate(writers):
+        writer.add_many((f"w{n}-{i}", vector) for i, vector in enumerate(vectors[: 500 + n]))
+
+    # processes sharing the path save concurrently; each save is whole
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda writer: writer.wait_for_merge(), writers))
+    reader = IVFIndex(path=path, n_lists=8)
+    reader.ensure_loaded(lambda since: [])
+    prefix = {str(record_id).split("-")[0] for record_id in reader._lists.ids}
+    assert len(prefix) == 1
+    assert len(reader) == 500 + int(prefix.pop()[1:])
+    assert sorted(os.listdir(tmp_path)) == sorted(["ivf", "ivf.lock", os.readlink(path)])
+
+
+def test_vector_codec_round_trip() -> None:
+    vector = [0.25, -1.5, 3.0, 0.0]
+    blob = encode_vector(vector)
+    decoded = decode_vector(blob)
+    assert len(blob) == 4 + 4 * len(vector)
+    assert decoded.tolist() == vector
+    assert not decoded.flags.owndata
+
+    quantized = encode_vector(vector, VECTOR_INT8)
+    assert len(quantized) == 8 + len(vector)
+    assert decode_vector(quantized) == pytest.approx(vector, abs=3.0 / 127)
+
+
+def test_legacy_json_vectors_are_migrated(tmp_path) -> None:
+    database_url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(database_url)
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE embeddings (id VARCHAR PRIMARY KEY, text TEXT NOT NULL, "
+                "vector JSON NOT NULL, metadata JSON, created_at DATETIME)"
+            )
+        )
+        connection.execute(
+            text(
+                "INSERT INTO embeddings VALUES "
+                "(:id, :text, :vector, '{}', '2024-01-01 00:00:00')"
+            ),
+            [
+                {"id": "old-1", "text": "doc 1", "vector": json.dumps(deterministic_embedding("doc 1"))},
+                {"id": "old-2", "text": "doc 2", "vector": json.dumps(deterministic_embedding("doc 2"))},
+            ],
+        )
+        install_full_text_search(connection, ["embeddings"])
+    engine.dispose()
+
+    # the async app upgrades the schema on startup
+    with TestClient(create_app(database_url=database_url, database_async=True)) as test_client:
+        test_client, token = authenticated_client(test_client)
+        search_resp = test_client.get(
+            "/api/v1/search", params={"query": "doc 2", "k": 1}, headers=auth_headers(token)
+        )
+        text_resp = test_client.get(
+            "/api/v1/search", params={"query": "2", "mode": "text"}, headers=auth_headers(token)
+        )
+        test_client.post("/api/v1/embeddings", json={"text": "doc 3"}, headers=auth_headers(token))
+        new_resp = test_client.get(
+            "/api/v1/search", params={"query": "3", "mode": "text"}, headers=auth_headers(token)
+        )
+    assert search_resp.json()[0]["id"] == "old-2"
+    # the rebuilt table keeps its rowids and FTS5 triggers
+    assert [hit["id"] for hit in text_resp.json()] == ["old-2"]
+    assert [hit["text"] for hit in new_resp.json()] == ["doc 3"]
+
+    with engine.begin() as connection:
+        columns = {info["name"]: info for info in inspect(connection).get_columns("embeddings")}
+        blobs = connection.execute(
+            text("SELECT id, vector FROM embeddings WHERE id LIKE 'old-%' ORDER BY id")
+        ).all()
+        assert upgrade_embedding_vectors(connection) == 0
+    assert "vector_json" not in columns
+    assert columns["vector"]["nullable"] is False
+    assert [row.id for row in blobs] == ["old-1", "old-2"]
+    assert decode_vector(blobs[1].vector) == pytest.approx(deterministic_embedding("doc 2"))
+
+
+def test_full_text_search(client: TestClient) -> None:
+    client, token = authenticated_client(client)
+    for text_value in ("the quick brown fox", "a lazy dog sleeps", "quick thinking wins"):
+        client.post("/api/v1/embeddings", json={"text": text_value}, headers=auth_headers(token))
+    text_resp = client.get(
+        "/api/v1/search",
+        params={"query": 'QUICK "fox*', "mode": "text"},
+        headers=auth_headers(token),
+    )
+    assert text_resp.status_code == 200
+    assert [hit["text"] for hit in text_resp.json()] == ["the quick brown fox"]
+
+    room_id = client.post(
+        "/api/v1/rooms", json={"name": "General"}, headers=auth_headers(token)
+    ).json()["id"]
+    other_id = client.post(
+        "/api/v1/rooms", json={"name": "Other"}, headers=auth_headers(token)
+    ).json()["id"]
+    posts = ((room_id, "deploy at noon"), (room_id, "lunch?"), (other_id, "deploy now"))
+    for target, text_value in posts:
+        client.post(
+            f"/api/v1/rooms/{target}/messages", json={"text": text_value}, headers=auth_headers(token)
+        )
+    search_resp = client.get(
+        f"/api/v1/rooms/{room_id}/messages/search", params={"q": "deploy"}, headers=auth_headers(token)
+    )
+    assert search_resp.status_code == 200
+    assert [message["text"] for message in search_resp.json()] == ["deploy at noon"]
+
+
+def test_hybrid_search_fuses_both_sources(client: TestClient) -> None:
+    client, token = authenticated_client(client)
+    texts = ["alpha report", "beta notes", "gamma alpha summary"]
+    for text_value in texts:
+        client.post("/api/v1/embeddings", json={"text": text_value}, headers=auth_headers(token))
+
+    resp = client.get(
+        "/api/v1/search",
+        params={"query": "alpha report", "mode": "hybrid", "k": 3},
+        headers=auth_headers(token),
+    )
+    assert resp.status_code == 200
+    hits = resp.json()
+    # the exact text is first in both rankings, so it leads the fused list
+    assert hits[0]["text"] == "alpha report"
+    assert hits[0]["vector_score"] == pytest.approx(1.0)
+    assert hits[0]["text_score"] > 0
+    assert hits[0]["score"] == pytest.approx(2 / 61, abs=1e-4)
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+    stages = [part.split(";")[0] for part in resp.headers["Server-Timing"].split(", ")]
+    assert set(stages) == {"embed", "load", "vector", "text", "fuse", "fetch"}
+
+
+def test_async_cold_index_serves_concurrent_searches(tmp_path) -> None:
+    url = f"sqlite:///{tmp_path}/cold.db"
+    with TestClient(create_app(database_url=url, database_async=True)) as client:
+        _, token = authenticated_client(client)
+    engine = create_engine(url)
+    vectors = np.random.default_rng(3).standard_normal((2000, 8)).astype(np.float32)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(Embedding),
+            [
+                {"id": f"e{n}", "text": f"doc {n}", "vector": encode_vector(vector), "metadata_": {}}
+                for n, vector in enumerate(vectors)
+            ],
+        )
+    engine.dispose()
+
+    # a fresh app, so the first searches find the index cold and race to load it
+    app = create_app(database_url=url, database_async=True)
+    statuses = []
+
+    async def search_concurrently() -> None:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *(
+                    client.get(
+                        "/api/v1/search",
+                        params={"query": f"doc {n}", "mode": mode},
+                        headers=auth_headers(token),
+                    )
+                    for n, mode in enumerate(["vector", "vector", "hybrid", "hybrid"])
+                )
+            )
+        statuses.extend(response.status_code for response in responses)
+        await app.state.engine.dispose()
+
+    # a deadlock would stall the event loop itself, so watch it from this thread
+    worker = threading.Thread(target=asyncio.run, args=(search_concurrently(),), daemon=True)
+    worker.start()
+    worker.join(timeout=30)
+    app.state.search_executor.shutdown(wait=False)
+    assert statuses == [200] * 4
+    assert len(app.state.vector_index) == 2000
+
+
+def test_message_history_keyset_pagination(client: TestClient) -> None:
+    client, token = authenticated_client(client)
+    room_id = client.post(
+        "/api/v1/rooms", json={"name": "General"}, headers=auth_headers(token)
+    ).json()["id"]
+    for n in range(25):
+        client.post(
+            f"/api/v1/rooms/{room_id}/messages", json={"text": f"m{n}"}, headers=auth_headers(token)
+        )
+
+    pages, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"before": cursor} if cursor else {})}
+        resp = client.get(
+            f"/api/v1/rooms/{room_id}/messages", params=params, headers=auth_headers(token)
+        )
+        assert resp.status_code == 200
+        pages.insert(0, [message["text"] for message in resp.json()])
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [5, 10, 10]
+    assert sum(pages, []) == [f"m{n}" for n in range(25)]
+
+    oldest = client.get(
+        f"/api/v1/rooms/{room_id}/messages", params={"limit": 25}, headers=auth_headers(token)
+    ).json()[0]
+    after_cursor = encode_cursor(datetime.fromisoformat(oldest["created_at"]), oldest["id"])
+    resp = client.get(
+        f"/api/v1/rooms/{room_id}/messages",
+        params={"limit": 3, "after": after_cursor},
+        headers=auth_headers(token),
+    )
+    assert [message["text"] for message in resp.json()] == ["m1", "m2", "m3"]
+    assert "X-Next-Cursor" in resp.headers
+
+    bad = client.get(
+        f"/api/v1/rooms/{room_id}/messages", params={"before": "nope"}, headers=auth_headers(token)
+    )
+    assert bad.status_code == 400
+
+
+@pytest.mark.parametrize("database_async", [True, False], ids=["async", "sync"])
+def test_pool_settings_and_metrics(tmp_path, database_async: bool) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/pool.db", database_async=database_async)
+    engine = app.state.engine
+    pool = engine.sync_engine.pool if database_async else engine.pool
+    assert pool.size() == 5
+    assert pool.timeout() == 30.0
+
+    with TestClient(app) as client:
+        authenticated_client(client)
+        body = client.get("/metrics").text
+
+    samples = dict(
+        line.rsplit(" ", 1) for line in body.splitlines() if not line.startswith("#")
+    )
+    assert samples["ai_rooms_db_pool_size"] == "5"
+    assert samples["ai_rooms_db_pool_in_use"] == "0"
+    assert samples["ai_rooms_db_pool_overflow"] == "0"
+    assert int(samples["ai_rooms_db_pool_connects_total"]) >= 1
+    assert int(samples["ai_rooms_db_pool_checkout_seconds_count"]) >= 2
+    assert samples['ai_rooms_db_pool_checkout_seconds_bucket{le="+Inf"}'] == (
+        samples["ai_rooms_db_pool_checkout_seconds_count"]
+    )
+
+
+def test_pool_metrics_count_checkout_timeouts(tmp_path) -> None:
+    settings = Settings(db_pool_size=1, db_max_overflow=0, db_pool_timeout=0.05)
+    engine, _ = create_session_factory(f"sqlite:///{tmp_path}/pool.db", settings)
+    metrics = PoolMetrics(engine)
+    held = engine.connect()
+    with pytest.raises(SQLAlchemyTimeoutError):
+        engine.connect()
+    assert metrics.snapshot()["in_use"] == 1
+    held.close()
+    engine.dispose()
+    with engine.connect():
+        pass
+    stats = metrics.snapshot()
+    assert stats["timeouts"] == 1
+    assert stats["checkouts"] == 2
+    assert stats["in_use"] == 0
+
+
+def test_current_user_is_cached_and_invalidated_on_change(tmp_path) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/auth.db", database_async=False)
+    user_queries = []
+    event.listen(
+        app.state.engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: user_queries.append(statement)
+        if "FROM users" in statement
+        else None,
+    )
+    with TestClient(app) as client:
+        _, token = authenticated_client(client)
+        cache = app.state.principal_cache
+        user_queries.clear()
+        for _ in range(3):
+            assert client.post("/api/v1/auth/keys", headers=auth_headers(token)).status_code == 200
+        assert len(user_queries) == 1
+        assert cache.hits == 2
+
+        with app.state.session_factory() as session:
+            user = session.execute(select(User)).scalar_one()
+            user.display_name = "Renamed"
+            session.commit()
+        assert len(cache) == 0
+        user_queries.clear()
+        assert client.post("/api/v1/auth/keys", headers=auth_headers(token)).status_code == 200
+        assert len(user_queries) == 1
+
+        with app.state.session_factory() as session:
+            session.delete(session.execute(select(User)).scalar_one())
+            session.commit()
+        assert client.post("/api/v1/auth/keys", headers=auth_headers(token)).status_code == 401
+
+
+def test_principal_cache_expires_with_token() -> None:
+    now = [1000.0]
+    cache = PrincipalCache(max_entries=2, ttl_seconds=60.0, clock=lambda: now[0])
+    alice = Principal(id="a", email="a@example.com")
+    cache.put("t1", alice, token_expires_at=1010.0, generation=cache.generation)
+    assert cache.get("t1") is alice
+    now[0] = 1010.0
+    assert cache.get("t1") is None
+
+    stale = cache.generation
+    cache.invalidate("b@example.com")
+    cache.put("t2", alice, token_expires_at=2000.0, generation=stale)
+    assert cache.get("t2") is None
+
+    for token in ("t3", "t4", "t5"):
+        cache.put(token, alice, token_expires_at=2000.0, generation=cache.generation)
+    assert len(cache) == 2 and cache.get("t3") is None
+
+
+def test_login_rehashes_when_bcrypt_cost_changes(tmp_path) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/auth.db", database_async=False)
+    app.state.password_hasher = PasswordHasher(rounds=4)
+    with TestClient(app) as client:
+        authenticated_client(client)
+
+        def stored_hash() -> str:
+            with app.state.session_factory() as session:
+                return session.execute(select(User.hashed_password)).scalar_one()
+
+        assert stored_hash().startswith("$2b$04$")
+        app.state.password_hasher = PasswordHasher(rounds=5)
+        credentials = {"email": "user@example.com", "password": "secret"}
+        assert client.post("/api/v1/auth/login", json=credentials).status_code == 200
+        assert stored_hash().startswith("$2b$05$")
+        wrong = {"email": "user@example.com", "password": "wrong"}
+        assert client.post("/api/v1/auth/login", json=wrong).status_code == 401
+
+
+def test_password_hasher_fails_fast_when_saturated() -> None:
+    hasher = PasswordHasher(rounds=4, threads=1, max_pending=1)
+    release = threading.Event()
+
+    async def scenario() -> None:
+        blocked = asyncio.ensure_future(hasher._submit(release.wait))
+        await asyncio.sleep(0.01)
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.hash("secret")
+        release.set()
+        assert await blocked is True
+        assert hasher.pending == 0
+        valid, new_hash = await hasher.verify_and_update("secret", await hasher.hash("secret"))
+        assert valid and new_hash is None
+
+    asyncio.run(scenario())
+    hasher.shutdown()
+    assert hasher.rejected == 1
+    assert "ai_rooms_password_hash_rejected_total 1" in hasher.render()
+
+
+def test_password_hasher_counts_cancelled_jobs_until_they_finish() -> None:
+    hasher = PasswordHasher(rounds=4, threads=1, max_pending=2)
+    started, release = threading.Event(), threading.Event()
+
+    def blocked() -> bool:
+        started.set()
+        return release.wait(timeout=5)
+
+    async def scenario() -> None:
+        running = asyncio.ensure_future(hasher._submit(blocked))
+        await asyncio.to_thread(started.wait, 5)
+        queued = asyncio.ensure_future(hasher._submit(blocked))
+        await asyncio.sleep(0.01)
+        assert hasher.pending == 2
+
+        # a job still queued is withdrawn with its request
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert hasher.pending == 1
+        # a running one keeps its slot until the hash is done
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        assert hasher.pending == 1
+        release.set()
+        while hasher.pending:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(scenario())
+    hasher.shutdown()
+
+
+@pytest.mark.parametrize("database_async", [True, False], ids=["async", "sync"])
+def test_usage_is_written_behind_with_rollups(tmp_path, database_async: bool) -> None:
+    database_url = f"sqlite:///{tmp_path}/usage.db"
+    with TestClient(create_app(database_url=database_url, database_async=database_async)) as client:
+        _, token = authenticated_client(client)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(
+                pool.map(
+                    lambda n: client.post(
+                        "/api/v1/embeddings", json={"text": f"t{n}"}, headers=auth_headers(token)
+                    ).status_code,
+                    range(20),
+                )
+            )
+        assert statuses == [201] * 20
+        # nothing flushed yet, but the caller still sees its own usage
+        usage = client.get("/api/v1/usage", headers=auth_headers(token)).json()
+        assert list(usage["usage"].values()) == [20]
+
+    engine = create_engine(database_url)
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count FROM usage")).scalar_one() == 20
+        rollups = connection.execute(
+            text("SELECT granularity, sum(count) FROM usage_buckets GROUP BY granularity")
+        ).all()
+        # the retention delete that runs with every flush is an index range, not a scan
+        plan = connection.execute(
+            text(
+                "EXPLAIN QUERY PLAN DELETE FROM usage_buckets "
+                "WHERE granularity = 'minute' AND bucket_start < '2024-01-01'"
+            )
+        ).all()
+    engine.dispose()
+    assert "ix_usage_buckets_granularity_start" in plan[0][-1]
+    assert dict(rollups) == {"hour": 20, "minute": 20}
+
+    with TestClient(create_app(database_url=database_url, database_async=database_async)) as client:
+        login = client.post(
+            "/api/v1/auth/login", json={"email": "user@example.com", "password": "secret"}
+        )
+        headers = auth_headers(login.json()["access_token"])
+        client.post("/api/v1/embeddings", json={"text": "one more"}, headers=headers)
+        usage = client.get("/api/v1/usage", params={"granularity": "hour"}, headers=headers).json()
+        assert list(usage["usage"].values()) == [21]
+        assert usage["granularity"] == "hour"
+        assert sum(bucket["count"] for bucket in usage["buckets"]) == 21
+        inverted = {
+            "granularity": "minute",
+            "since": "2030-01-01T00:00",
+            "until": "2029-01-01T00:00",
+        }
+        assert client.get("/api/v1/usage", params=inverted, headers=headers).status_code == 400
+
+
+def test_usage_recorder_keeps_batch_when_flush_fails() -> None:
+    recorder = UsageRecorder(clock=lambda: datetime(2024, 1, 1, 12, 30, 15))
+    recorder.record("u", 3)
+    written = []
+
+    async def failing(batch: UsageBatch) -> None:
+        raise RuntimeError("database down")
+
+    async def persist(batch: UsageBatch) -> None:
+        written.append(batch)
+
+    async def scenario() -> None:
+        with pytest.raises(RuntimeError):
+            await recorder.flush(failing)
+        assert recorder.pending_for("u") == 3
+        recorder.record("u", 2)
+        assert await recorder.flush(persist) == 5
+        assert await recorder.flush(persist) == 0
+
+    asyncio.run(scenario())
+    assert recorder.pending_for("u") == 0
+    assert written[0].totals == {"u": 5}
+    assert written[0].buckets == {
+        ("u", "minute", datetime(2024, 1, 1, 12, 30)): 5,
+        ("u", "hour", datetime(2024, 1, 1, 12, 0)): 5,
+    }
+
+
+def test_room_membership_check_is_one_cached_probe(tmp_path) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/rooms.db", database_async=False)
+    statements = []
+    event.listen(
+        app.state.engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    with TestClient(app) as client:
+        _, token = authenticated_client(client)
+        room_id = client.post(
+            "/api/v1/rooms", json={"name": "Big", "is_group": True}, headers=auth_headers(token)
+        ).json()["id"]
+        with app.state.session_factory() as session:
+            session.execute(
+                insert(User),
+                [
+                    {"id": f"m{n}", "email": f"m{n}@example.com", "hashed_password": "x"}
+                    for n in range(500)
+                ],
+            )
+            session.execute(
+                insert(RoomMember), [{"room_id": room_id, "user_id": f"m{n}"} for n in range(500)]
+            )
+            session.commit()
+
+        statements.clear()
+        for n in range(3):
+            resp = client.post(
+                f"/api/v1/rooms/{room_id}/messages",
+                json={"text": f"hi {n}"},
+                headers=auth_headers(token),
+            )
+            assert resp.status_code == 201
+        member_queries = [s for s in statements if "room_members" in s]
+        # the first send probes membership with EXISTS, later sends hit the cache
+        assert len(member_queries) == 1 and "EXISTS" in member_queries[0]
+
+        client.post(
+            "/api/v1/auth/signup",
+            json={"email": "other@example.com", "password": "secret", "display_name": "Other"},
+        )
+        other = client.post(
+            "/api/v1/auth/login", json={"email": "other@example.com", "password": "secret"}
+        ).json()["access_token"]
+        messages_url = f"/api/v1/rooms/{room_id}/messages"
+        assert client.get(messages_url, headers=auth_headers(other)).status_code == 404
+        join = client.post(f"/api/v1/rooms/{room_id}/join", headers=auth_headers(other))
+        assert join.status_code == 200
+        assert client.get(messages_url, headers=auth_headers(other)).status_code == 200
+        missing = client.get("/api/v1/rooms/missing/messages", headers=auth_headers(other))
+        assert missing.status_code == 404
+
+
+# statements each write endpoint may issue once the caller's principal is cached
+WRITE_PATH_QUERIES = [
+    ("create room", "post", "/api/v1/rooms", {"name": "Counted"}, 2),
+    ("join as member", "post", "/api/v1/rooms/{room}/join", None, 1),
+    ("send message", "post", "/api/v1/rooms/{room}/messages", {"text": "hi"}, 1),
+    ("create nomi", "post", "/api/v1/nomis", {"name": "Counted"}, 1),
+    ("update nomi", "patch", "/api/v1/nomis/{nomi}", {"name": "Renamed"}, 1),
+    ("create embedding", "post", "/api/v1/embeddings", {"text": "counted"}, 1),
+    ("override model", "post", "/api/v1/models/m/override", {"model": "m", "config": {}}, 1),
+    ("delete nomi", "delete", "/api/v1/nomis/{nomi}", None, 1),
+]
+
+
+@pytest.mark.parametrize("database_async", [True, False], ids=["async", "sync"])
+def test_write_paths_round_trips(tmp_path, database_async: bool) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/writes.db", database_async=database_async)
+    engine = app.state.engine.sync_engine if database_async else app.state.engine
+    statements = []
+    event.listen(
+        engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    with TestClient(app) as client:
+        statements.clear()
+        signup = client.post(
+            "/api/v1/auth/signup",
+            json={"email": "user@example.com", "password": "secret", "display_name": "User"},
+        )
+        assert signup.status_code == 201 and len(statements) == 1
+        headers = auth_headers(signup.json()["access_token"])
+        room = client.post("/api/v1/rooms", json={"name": "Room"}, headers=headers).json()["id"]
+        nomi = client.post("/api/v1/nomis", json={"name": "Nomi"}, headers=headers).json()["id"]
+        client.post(f"/api/v1/rooms/{room}/messages", json={"text": "warm"}, headers=headers)
+
+        for label, method, path, body, expected in WRITE_PATH_QUERIES:
+            statements.clear()
+            resp = client.request(
+                method, path.format(room=room, nomi=nomi), json=body, headers=headers
+            )
+            assert resp.status_code < 300, label
+            assert len(statements) == expected, (label, statements)
+
+        statements.clear()
+        taken = client.post(
+            "/api/v1/auth/signup",
+            json={"email": "user@example.com", "password": "other", "display_name": "Again"},
+        )
+        assert taken.status_code == 400 and len(statements) == 1
+
+
+def test_update_nomi_clears_persona(client: TestClient) -> None:
+    _, token = authenticated_client(client)
+    headers = auth_headers(token)
+    nomi = client.post(
+        "/api/v1/nomis", json={"name": "Nomi", "persona": {"tone": "dry"}}, headers=headers
+    ).json()
+    resp = client.patch(f"/api/v1/nomis/{nomi['id']}", json={"persona": None}, headers=headers)
+    assert resp.status_code == 200 and resp.json()["persona"] == {}
+    assert client.get(f"/api/v1/nomis/{nomi['id']}", headers=headers).json()["persona"] == {}
+
+
+def test_list_endpoints_answer_conditional_gets(tmp_path) -> None:
+    app = create_app(database_url=f"sqlite:///{tmp_path}/etags.db", database_async=False)
+    statements = []
+    event.listen(
+        app.state.engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+    with TestClient(app) as client:
+        _, token = authenticated_client(client)
+        headers = auth_headers(token)
+        room_id = client.post("/api/v1/rooms", json={"name": "Poll"}, headers=headers).json()["id"]
+        client.post("/api/v1/nomis", json={"name": "Nomi"}, headers=headers)
+        client.post(f"/api/v1/rooms/{room_id}/messages", json={"text": "one"}, headers=headers)
+
+        for url in ("/api/v1/rooms/", "/api/v1/nomis/", f"/api/v1/rooms/{room_id}/messages"):
+            first = client.get(url, headers=headers)
+            etag = first.headers["ETag"]
+            statements.clear()
+            again = client.get(url, headers={**headers, "If-None-Match": etag})
+            assert again.status_code == 304 and again.content == b""
+            # the membership probe for messages is cached, so nothing reaches the database
+            assert statements == [], (url, statements)
+            cached = client.get(url, headers=headers)
+            assert cached.json() == first.json() and statements == []
+
+        messages_url = f"/api/v1/rooms/{room_id}/messages"
+        etag = client.get(messages_url, headers=headers).headers["ETag"]
+        assert client.get(f"{messages_url}?limit=1", headers=headers).headers["ETag"] != etag
+        client.post(messages_url, json={"text": "two"}, headers=headers)
+        fresh = client.get(messages_url, headers={**headers, "If-None-Match": etag})
+        assert fresh.status_code == 200 and fresh.headers["ETag"] != etag
+        assert [m["text"] for m in fresh.json()] == ["one", "two"]
+
+        client.post(
+            "/api/v1/auth/signup",
+            json={"email": "other@example.com", "password": "secret", "display_name": "Other"},
+        )
+        other = auth_headers(
+            client.post(
+                "/api/v1/auth/login", json={"email": "other@example.com", "password": "secret"}
+            ).json()["access_token"]
+        )
+        mine = client.get("/api/v1/nomis/", headers=headers).headers["ETag"]
+        theirs = client.get("/api/v1/nomis/", headers={**other, "If-None-Match": mine})
+        assert theirs.status_code == 200 and theirs.json() == []
+        assert theirs.headers["ETag"] != mine
+
+
+def test_conditional_gets_see_other_replicas_writes_after_ttl(tmp_path) -> None:
+    database_url = f"sqlite:///{tmp_path}/replicas.db"
+    first = create_app(database_url=database_url, database_async=False)
+    second = create_app(database_url=database_url, database_async=False)
+    now = [0.0]
+    first.state.response_cache = ResponseCache(ttl_seconds=2.0, clock=lambda: now[0])
+    with TestClient(first) as client_a, TestClient(second) as client_b:
+        _, token = authenticated_client(client_a)
+        headers = auth_headers(token)
+        room_id = client_a.post("/api/v1/rooms", json={"name": "Shared"}, headers=headers).json()[
+            "id"
+        ]
+        url = f"/api/v1/rooms/{room_id}/messages"
+        etag = client_a.get(url, headers=headers).headers["ETag"]
+
+        # another replica's write is invisible to this one's version counters
+        client_b.post(url, json={"text": "elsewhere"}, headers=headers)
+        assert client_a.get(url, headers={**headers, "If-None-Match": etag}).status_code == 304
+
+        now[0] += 2.5
+        fresh = client_a.get(url, headers={**headers, "If-None-Match": etag})
+        assert fresh.status_code == 200 and [m["text"] for m in fresh.json()] == ["elsewhere"]
+        # the ETag is a digest of the body, so both replicas agree on it
+        assert client_b.get(url, headers=headers).headers["ETag"] == fresh.headers["ETag"]
+        now[0] += 2.5
+        unchanged = client_a.get(url, headers={**headers, "If-None-Match": fresh.headers["ETag"]})
+        assert unchanged.status_code == 304
+
+
+def test_list_reads_build_models_from_rows_without_orm_objects(tmp_path) -> None:
+    engine, session_factory = create_session_factory(f"sqlite:///{tmp_path}/rows.db")
+    Base.metadata.create_all(bind=engine)
+    session = session_factory()
+    store = DatabaseStore(session)
+    owner = store.create_user(
+        UserCreate(email="owner@example.com", password="secret", display_name="Owner"), "x"
+    )
+    guest = store.create_user(
+        UserCreate(email="guest@example.com", password="secret", display_name="Guest"), "x"
+    )
+    room = store.create_room(owner.id, RoomCreate(name="Rows"))
+    store.join_room(room.id, guest.id)
+    nomi = store.create_nomi(owner.id, NomiCreate(name="Nomi"))
+    for n in range(3):
+        store.add_message(room.id, guest.id, MessageCreate(text=f"hi {n}", content={"n": str(n)}))
+    session.expunge_all()
+
+    assert [r.members for r in store.list_rooms(guest.id)] == [[owner.id, guest.id]]
+    assert store.get_room(room.id).members == [owner.id, guest.id]
+    assert store.list_nomis(owner.id) == [nomi]
+    assert store.get_nomi(nomi.id, owner_id=guest.id) is None
+    messages = store.list_messages(room.id, 2)
+    assert [m.text for m in messages] == ["hi 1", "hi 2"] and messages[0].content == {"n": "1"}
+    assert len(session.identity_map) == 0
+    session.close()
+    engine.dispose()
+
+
+@pytest.mark.parametrize("database_async", [True, False], ids=["async", "sync"])
+def test_store_runner_releases_connection_between_calls(tmp_path, database_async) -> None:
+    url = f"sqlite:///{tmp_path}/pool.db"
+    create_app(database_url=url).state.engine.dispose()  # prepares the schema
+    app = create_app(database_url=url, database_async=database_async)
+    pool = app.state.engine.pool
+    user = UserCreate(email="pool@example.com", password="secret", display_name="Pool")
+
+    async def scenario() -> list[int]:
+        checked_out = []
+        try:
+            async with open_store(app.state) as store:
+                await store.run(DatabaseStore.get_user_by_email, "nobody@example.com")
+                # what a request holds while it awaits bcrypt or another service
+                checked_out.append(pool.checkedout())
+                await store.run(DatabaseStore.create_user, user, "hash")
+                checked_out.append(pool.checkedout())
+                with pytest.raises(ZeroDivisionError):
+                    await store.run(lambda _: 1 / 0)
+                checked_out.append(pool.checkedout())
+        finally:
+            if database_async:
+                await app.state.engine.dispose()
+        return checked_out
+
+    assert asyncio.run(scenario()) == [0, 0, 0]
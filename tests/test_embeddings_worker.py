@@ -0,0 +1,44 @@
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("sentence_transformers")
+
+from embeddings_worker import main as worker_main  # noqa: E402
+
+
+class PidModel:
+    """Encodes a text as ``[len(text), pid]``, so a result shows which process made it."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def encode(self, texts: list) -> np.ndarray:
+        return np.array([[len(text), os.getpid()] for text in texts], dtype=np.float64)
+
+
+def test_process_executor_loads_the_model_in_each_worker(monkeypatch: pytest.MonkeyPatch) -> None:
+    # pool workers are forked after this, so load_model builds this model there
+    # instead of downloading the real one
+    monkeypatch.setattr(worker_main, "SentenceTransformer", PidModel)
+    monkeypatch.setattr(worker_main, "EXECUTOR_KIND", "process")
+    monkeypatch.setattr(worker_main, "model", None)
+    monkeypatch.setattr(worker_main, "executor", None)
+
+    with TestClient(worker_main.app) as client:
+        resp = client.post(
+            "/embed/batch",
+            json={"items": [{"text": "a"}, {"text": "   "}, {"text": "abc"}]},
+        )
+        assert client.get("/health").status_code == 200
+
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert results[1]["error"] == "text must not be empty"
+    first, third = results[0]["embeddings"], results[2]["embeddings"]
+    assert (first[0], third[0]) == (1, 3)
+    # encoded in a pool worker, by the model its initializer loaded there
+    assert first[1] == third[1] != os.getpid()
+    assert worker_main.model is None